@@ -1,74 +1,111 @@
 # agents.py
 import os
 import re
+import asyncio
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm_gateway import get_chat_model, LLM_MODEL_NAME
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_community.tools import WikipediaQueryRun
-from langchain_community.utilities import WikipediaAPIWrapper
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain.agents import Tool
 import traceback
 import logging
-import time
+import threading
+from async_utils import run_sync
+import tracing
+from context_packer import pack_context
+from conversation import (load_retrieval_set, remember_retrieval_set, retrieval_set_coverage, chunk_ids_of,
+                          FOLLOW_UP_MIN_TERM_COVERAGE)
+from tool_cache import with_tool_cache
+from answer_format import ANSWER_HEADER_INSTRUCTIONS, parse_structured_answer, is_confident_answer
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 load_dotenv()
 
 # --- LLM Ayarları ---
-LLM_MODEL_NAME = "gemini-1.5-flash-latest" # Flash modelini kullanıyoruz
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# GOOGLE_API_KEY ilk LLM çağrısında (llm_gateway) kontrol edilir; import anında istemci kurulmaz
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY") # Tavily anahtarını yükle
 
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY ortam değişkeni bulunamadı.")
-if not TAVILY_API_KEY:
-    logging.warning("TAVILY_API_KEY ortam değişkeni bulunamadı. Web arama devre dışı.")
+# Haber agent'ı Wikipedia ve Tavily aramalarını aynı anda başlatır (false: sıralı, Tavily sadece gerekirse)
+NEWS_PARALLEL_FETCH = os.getenv("NEWS_PARALLEL_FETCH", "true").lower() != "false"
+
+# Kullanıcıya gösterilecek cevabı üreten zincirler bu etiketle işaretlenir;
+# graf stream edilirken sadece bu LLM çağrılarının token'ları arayüze aktarılır.
+FINAL_ANSWER_TAG = "final_answer"
 
 # --- Ana LLM ---
-llm = None
-try:
-    
-    llm = ChatGoogleGenerativeAI(model=LLM_MODEL_NAME, google_api_key=GOOGLE_API_KEY, temperature=0.3)
-    output_parser = StrOutputParser()
-    logging.info(f"Ana LLM başarıyla yüklendi: {LLM_MODEL_NAME}")
-except Exception as e:
-     logging.error(f"Ana LLM yüklenirken HATA: {e}", exc_info=True)
-     raise RuntimeError("Ana LLM yüklenemedi, uygulama başlatılamıyor.") from e
+# İstemci ve kota yönetimi llm_gateway'de; tüm çağrılar ortak rate limiter'dan geçer.
+# Gateway asıl Gemini istemcisini ilk çağrıda oluşturur.
+llm = get_chat_model(temperature=0.3)
+output_parser = StrOutputParser()
 
 # --- Araçlar (Wikipedia ve Tavily) ---
+# Araçlar ilk haber sorusunda oluşturulur (get_wikipedia_tool / get_tavily_tool).
+# Modül değişkenlerine önceden atanan araçlar (ör. benchmark'ın sahte araçları) olduğu gibi kullanılır.
 wikipedia_langchain_tool = None
-try:
-    api_wrapper = WikipediaAPIWrapper(lang="tr", top_k_results=2, doc_content_chars_max=4000)
-    wikipedia_tool = WikipediaQueryRun(api_wrapper=api_wrapper, name="wikipedia_search")
-    wikipedia_langchain_tool = Tool(
-        name="wikipedia_search",
-        func=wikipedia_tool.run,
-        description="Ansiklopedik bilgi, tarihi olaylar, kişiler(örn:Albert Einstein), yerler, kavram tanımları gibi genel ve oturmuş bilgiler için kullanılır."
-    )
-    logging.info("Wikipedia aracı başarıyla yüklendi.")
-except Exception as e:
-    logging.error(f"Hata: Wikipedia aracı yüklenirken: {e}", exc_info=True)
-
-# Tavily aracını tekrar ekleyelim
 tavily_langchain_tool = None
-if TAVILY_API_KEY:
+_tools_lock = threading.Lock()
+_tools_ready = {"wikipedia": False, "tavily": False}
+
+def _build_wikipedia_tool():
+    try:
+        from langchain_community.tools import WikipediaQueryRun
+        from langchain_community.utilities import WikipediaAPIWrapper
+        from langchain.agents import Tool
+        api_wrapper = WikipediaAPIWrapper(lang="tr", top_k_results=2, doc_content_chars_max=4000)
+        wikipedia_tool = WikipediaQueryRun(api_wrapper=api_wrapper, name="wikipedia_search")
+        tool = Tool(
+            name="wikipedia_search",
+            func=wikipedia_tool.run,
+            description="Ansiklopedik bilgi, tarihi olaylar, kişiler(örn:Albert Einstein), yerler, kavram tanımları gibi genel ve oturmuş bilgiler için kullanılır."
+        )
+        logging.info("Wikipedia aracı başarıyla yüklendi.")
+        # Aynı varlık sorguları kullanıcılar arasında sık tekrarlanır; sonuçlar TTL'li disk önbelleğinden gelir
+        return with_tool_cache(tool)
+    except Exception as e:
+        logging.error(f"Hata: Wikipedia aracı yüklenirken: {e}", exc_info=True)
+        return None
+
+def _build_tavily_tool():
+    if not TAVILY_API_KEY:
+        logging.warning("TAVILY_API_KEY ortam değişkeni bulunamadı. Web arama devre dışı.")
+        return None
     try:
+        from langchain_community.tools.tavily_search import TavilySearchResults
+        from langchain.agents import Tool
         # Güncel bilgiler için 5 sonuç yeterli olabilir
         tavily_search = TavilySearchResults(max_results=5, name="web_search")
-        tavily_langchain_tool = Tool(
+        tool = Tool(
             name="web_search",
             func=tavily_search.run, # Liste dönebilir
             description="En güncel olaylar(örn: geçen haftaki enflasyon oranı), anlık haberler, son dakika gelişmeleri veya Wikipedia'da bulunamayan spesifik bilgiler için internette arama yapar."
         )
         logging.info("Tavily Search aracı başarıyla yüklendi.")
+        return with_tool_cache(tool)
     except Exception as e:
         logging.error(f"Hata: Tavily Search aracı yüklenirken: {e}", exc_info=True)
-else:
-     logging.info("Tavily API Anahtarı bulunmadığı için Tavily Search aracı yüklenmedi.")
+        return None
+
+def get_wikipedia_tool():
+    """Wikipedia aracını ilk kullanımda (thread-safe, bir kez) oluşturur; yüklenemezse None."""
+    global wikipedia_langchain_tool
+    if not _tools_ready["wikipedia"]:
+        with _tools_lock:
+            if not _tools_ready["wikipedia"]:
+                if wikipedia_langchain_tool is None:
+                    wikipedia_langchain_tool = _build_wikipedia_tool()
+                _tools_ready["wikipedia"] = True
+    return wikipedia_langchain_tool
+
+def get_tavily_tool():
+    """Tavily aracını ilk kullanımda (thread-safe, bir kez) oluşturur; anahtar yoksa/yüklenemezse None."""
+    global tavily_langchain_tool
+    if not _tools_ready["tavily"]:
+        with _tools_lock:
+            if not _tools_ready["tavily"]:
+                if tavily_langchain_tool is None:
+                    tavily_langchain_tool = _build_tavily_tool()
+                _tools_ready["tavily"] = True
+    return tavily_langchain_tool
 
 
 # --- Agent Fonksiyonları ---
@@ -83,9 +120,11 @@ def create_rag_chain(retriever):
     1.  Tüm 'Bağlam Parçaları'nı oku.
     2.  'Soru'nun cevabını bu parçalarda ara.
     3.  Cevabı bulursan: Sadece parçalardaki bilgiyi kullanarak, soruyu doğrudan ve net bir şekilde Türkçe yanıtla. Varsa madde/tarih gibi detayları ekle.
-    4.  Cevabı bulamazsan: Sadece şu cümleyi yaz: "Sağlanan Resmi Gazete belgelerinde bu konuyla ilgili spesifik bir bilgiye rastlanmadı."
+    4.  Cevabı bulamazsan: Başlıkta ALAKALI: HAYIR yaz, cevap olarak sadece şu cümleyi yaz: "Sağlanan Resmi Gazete belgelerinde bu konuyla ilgili spesifik bir bilgiye rastlanmadı."
     5.  ASLA dışarıdan bilgi ekleme veya tahmin yapma.
 
+    {header_instructions}
+
     BAĞLAM PARÇALARI:
     {context}
 
@@ -93,13 +132,71 @@ def create_rag_chain(retriever):
 
     YANIT (Türkçe):
     """
-    rag_prompt = ChatPromptTemplate.from_template(rag_prompt_template)
+    rag_prompt = ChatPromptTemplate.from_template(rag_prompt_template).partial(header_instructions=ANSWER_HEADER_INSTRUCTIONS)
     if not llm:
          raise ValueError("RAG zinciri oluşturulamadı: Ana LLM yüklenmemiş.")
-    rag_chain = create_stuff_documents_chain(llm, rag_prompt)
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    rag_chain = create_stuff_documents_chain(llm, rag_prompt).with_config(tags=[FINAL_ANSWER_TAG])
     return rag_chain
 
 def run_gazette_agent(state: dict):
+    """Resmi Gazete ile ilgili soruları RAG kullanarak yanıtlar (arun_gazette_agent'ın senkron sarmalayıcısı)."""
+    return run_sync(arun_gazette_agent(state))
+
+async def _aretrieve_gazette_documents(retriever, question):
+    logging.info(f"MultiQueryRetriever'a gönderilen soru: {question}")
+    with tracing.span("retrieval") as retrieval_span:
+        retrieved_docs = await retriever.ainvoke(question)
+        retrieval_span.set(documents=len(retrieved_docs))
+    logging.info(f"MultiQueryRetriever {len(retrieved_docs)} belge buldu.")
+    return retrieved_docs
+
+async def _areuse_gazette_documents(state, retriever):
+    """Takip sorusunda önceki turun belge seti; set yoksa veya takip sorusunun terimlerini kapsamıyorsa boş liste."""
+    with tracing.span("retrieval_reuse") as reuse_span:
+        retrieved_docs = await asyncio.to_thread(load_retrieval_set, retriever, state["last_chunk_ids"])
+        coverage = retrieval_set_coverage(retrieved_docs, state.get("follow_up_question") or state.get("question"))
+        reused = bool(retrieved_docs) and coverage >= FOLLOW_UP_MIN_TERM_COVERAGE
+        reuse_span.set(documents=len(retrieved_docs) if reused else 0)
+    if reused:
+        logging.info(f"Takip sorusu: önceki turun {len(retrieved_docs)} belgesi tekrar kullanılıyor (terim kapsamı {coverage:.2f}).")
+        return retrieved_docs
+    if retrieved_docs:
+        logging.info(f"Takip sorusu önceki belge setiyle yeterince örtüşmüyor (terim kapsamı {coverage:.2f}); yeni arama yapılacak.")
+        tracing.metrics.inc("retrieval_reuse_total", 1, (("outcome", "low_overlap"),))
+    return []
+
+async def _agenerate_gazette_answer(question, retrieved_docs, rag_chain):
+    """Belgelerden cevabı üretir: (cevap, kaynak, LLM belgelerde bilgi buldu mu)."""
+    try:
+        # Örtüşen parçaları birleştir, tekrarları at, relevance sırasıyla token bütçesini doldur
+        with tracing.span("context_packing") as packing_span:
+            retrieved_docs, pack_stats = pack_context(retrieved_docs)
+            packing_span.set(documents=len(retrieved_docs), context_tokens=pack_stats["tokens"])
+        if not retrieved_docs:
+            logging.error("Context bütçesi nedeniyle tüm belgeler atlandı!")
+            return "Üzgünüm, bulunan ilgili belgeler işlenemeyecek kadar uzun.", "Gazette Agent (Context Limit Hatası)", False
+        logging.info(f"RAG zinciri LLM'i {len(retrieved_docs)} belge (~{pack_stats['tokens']} token) ile çağırıyor...")
+
+        with tracing.span("rag_generation"):
+            answer = await rag_chain.ainvoke({"input": question, "context": retrieved_docs})
+        logging.info(f"Gazette Agent LLM Ham Cevabı (kısaltılmış): {answer[:500]}...")
+
+        parsed = parse_structured_answer(answer)
+        answer = parsed["answer"] or "Sağlanan Resmi Gazete belgelerinde bu konuyla ilgili spesifik bir bilgiye rastlanmadı."
+        if is_confident_answer(parsed):
+            return answer, "Resmi Gazete Agent (RAG)", True
+        logging.info(f"Gazette Agent: LLM cevabı yetersiz buldu (alakalı={parsed['relevant']}, güven={parsed['confidence']}).")
+        return answer, "Gazette Agent (Bilgi Bulunamadı - LLM)", False
+
+    except Exception as e:
+        if "payload size exceeds the limit" in str(e) or "context length" in str(e).lower():
+             logging.error(f"HATA: RAG LLM çağrısı - Context Window aşımı: {e}", exc_info=False)
+             return f"Üzgünüm, bu soru için çok fazla ilgili belge bulundu ve hepsini aynı anda işleyemedim. (Context Limiti)", "Gazette Agent (Context Limit Hatası)", False
+        logging.error(f"HATA: RAG LLM çağrısı (Genel): {e}", exc_info=True)
+        return "Üzgünüm, bulunan belgelerden cevabı oluştururken teknik bir sorunla karşılaştım.", "Gazette Agent (LLM Hatası)", False
+
+async def arun_gazette_agent(state: dict):
     """Resmi Gazete ile ilgili soruları RAG kullanarak yanıtlar."""
     logging.info("--- Resmi Gazete Agent Çalışıyor ---")
     question = state.get("question")
@@ -110,83 +207,164 @@ def run_gazette_agent(state: dict):
         logging.error("Gazette Agent Hatası: Gerekli RAG bileşenleri eksik.")
         return {"answer": "Üzgünüm, RAG sistemi yapılandırmasında bir sorun var.", "source": "Gazette Agent (Yapılandırma Hatası)"}
 
-    # 1. Belgeleri Al
+    # 1. Belgeleri Al (takip sorusunda, soruyu kapsıyorsa önceki turun belge seti; sorgu üretimi ve arama yapılmadan)
     retrieved_docs = []
+    reused = False
     try:
-        logging.info(f"MultiQueryRetriever'a gönderilen soru: {question}")
-        retrieved_docs = retriever.invoke(question)
-        logging.info(f"MultiQueryRetriever {len(retrieved_docs)} belge buldu.")
+        if state.get("follow_up") and state.get("last_chunk_ids"):
+            retrieved_docs = await _areuse_gazette_documents(state, retriever)
+            reused = bool(retrieved_docs)
+        if not retrieved_docs:
+            retrieved_docs = await _aretrieve_gazette_documents(retriever, question)
         if not retrieved_docs:
             logging.warning("MultiQueryRetriever soruyla ilgili HİÇ belge bulamadı.")
             return {"answer": "Resmi Gazete arşivinde bu konuyla ilgili bir belge bulunamadı.", "source": "Gazette Agent (Belge Bulunamadı - Retriever)"}
         logging.info(f"İlk bulunan belge (metadata): {retrieved_docs[0].metadata}")
+        chunk_ids = remember_retrieval_set(retrieved_docs)
 
     except Exception as e:
         logging.error(f"HATA: MultiQueryRetriever sorgusu sırasında: {e}", exc_info=True)
         return {"answer": "Üzgünüm, Resmi Gazete belgelerinde arama yaparken teknik bir sorun oluştu (MultiQuery).", "source": "Gazette Agent (Retrieval Hatası)"}
 
     # 2. Cevabı Üret
-    answer = ""
-    source = "Gazette Agent (Bilinmeyen)"
     if not llm:
         logging.error("Gazette Agent: Ana LLM yüklenmemiş.")
         return {"answer": "Üzgünüm, cevap üretme servisinde bir sorun var.", "source": "Gazette Agent (LLM Hatası)"}
 
-    try:
-        logging.info(f"RAG zinciri LLM'i {len(retrieved_docs)} belge ile çağırıyor...")
-        time.sleep(1) # API Limiti
-        context_char_count = sum(len(doc.page_content) for doc in retrieved_docs)
-        logging.info(f"RAG LLM'e gönderilen context karakter sayısı: {context_char_count}")
-
-        # Context limiti kontrolü ve kırpma (Flash için önemli)
-        TOKEN_LIMIT_APPROX_FLASH = 20000
-        if context_char_count > TOKEN_LIMIT_APPROX_FLASH:
-             logging.warning(f"Context boyutu ({context_char_count} karakter) Flash LLM limiti ({TOKEN_LIMIT_APPROX_FLASH}) aşabilir! Belgeler kırpılıyor...")
-             trimmed_docs = []
-             current_chars = 0
-             for doc in retrieved_docs:
-                  doc_len = len(doc.page_content)
-                  if current_chars + doc_len <= TOKEN_LIMIT_APPROX_FLASH:
-                       trimmed_docs.append(doc)
-                       current_chars += doc_len
-                  else:
-                       # Kalan karakter kadarını almayı dene (opsiyonel, basitlik için atlayabiliriz)
-                       # remaining_space = TOKEN_LIMIT_APPROX_FLASH - current_chars
-                       # if remaining_space > 100: # Çok küçükse eklemeye değmez
-                       #      trimmed_doc_part = Document(page_content=doc.page_content[:remaining_space], metadata=doc.metadata)
-                       #      trimmed_docs.append(trimmed_doc_part)
-                       #      logging.warning(f"Son belge kısmen eklendi.")
-                       logging.warning(f"Context limiti nedeniyle {len(retrieved_docs) - len(trimmed_docs)} belge atlandı.")
-                       break
-             retrieved_docs = trimmed_docs
-             if not retrieved_docs:
-                  logging.error("Context limiti nedeniyle tüm belgeler atlandı!")
-                  return {"answer": "Üzgünüm, bulunan ilgili belgeler işlenemeyecek kadar uzun.", "source": "Gazette Agent (Context Limit Hatası)"}
-
-        answer = rag_chain.invoke({"input": question, "context": retrieved_docs})
-        logging.info(f"Gazette Agent LLM Ham Cevabı (kısaltılmış): {answer[:500]}...")
+    answer, source, found = await _agenerate_gazette_answer(question, retrieved_docs, rag_chain)
 
-        if "rastlanmadı" in answer or len(answer.strip()) < 15:
-            source = "Gazette Agent (Bilgi Bulunamadı - LLM)"
-        else:
-            source = "Resmi Gazete Agent (RAG)"
-
-    except Exception as e:
-        if "payload size exceeds the limit" in str(e) or "context length" in str(e).lower():
-             logging.error(f"HATA: RAG LLM çağrısı - Context Window aşımı: {e}", exc_info=False)
-             answer = f"Üzgünüm, bu soru için çok fazla ilgili belge bulundu ve hepsini aynı anda işleyemedim. (Context Limiti)"
-             source = "Gazette Agent (Context Limit Hatası)"
-        else:
-            logging.error(f"HATA: RAG LLM çağrısı (Genel): {e}", exc_info=True)
-            answer = "Üzgünüm, bulunan belgelerden cevabı oluştururken teknik bir sorunla karşılaştım."
-            source = "Gazette Agent (LLM Hatası)"
+    # 3. Önceki belge setinde cevap bulunamadıysa yeni arama yapılır ve cevap bir kez daha üretilir
+    if reused:
+        tracing.metrics.inc("retrieval_reuse_total", 1, (("outcome", "answered" if found else "not_found"),))
+    if reused and source == "Gazette Agent (Bilgi Bulunamadı - LLM)":
+        logging.info("Takip sorusu önceki belge setinden cevaplanamadı; yeni arama yapılıyor.")
+        try:
+            fresh_docs = await _aretrieve_gazette_documents(retriever, question)
+        except Exception as e:
+            logging.error(f"HATA: Takip sorusu için yeni arama sırasında: {e}", exc_info=True)
+            fresh_docs = []
+        if fresh_docs and chunk_ids_of(fresh_docs) != chunk_ids:
+            chunk_ids = remember_retrieval_set(fresh_docs)
+            answer, source, found = await _agenerate_gazette_answer(question, fresh_docs, rag_chain)
 
-    return {"answer": answer, "source": source}
+    return {"answer": answer, "source": source, "chunk_ids": chunk_ids}
 
 
 # 2. Güncel Haber / Genel Bilgi Agent (WIKIPEDIA + TAVILY )
 def run_news_agent(state: dict):
-    """Genel bilgi sorularını önce Wikipedia, başarısız olursa Tavily kullanarak yanıtlar."""
+    """Genel bilgi sorularını yanıtlar (arun_news_agent'ın senkron sarmalayıcısı)."""
+    return run_sync(arun_news_agent(state))
+
+async def _answer_from_wikipedia(question, fetch):
+    """Wikipedia sonucunu (fetch: başlatılmış arama görevi) bekler; alaka kararı ve cevabı tek LLM çağrısıyla alır. Başarısızsa None."""
+    try:
+        wiki_response_raw = await fetch
+        logging.info(f"--- Wikipedia Ham Yanıtı (Başlangıç) ---")
+        logging.info(wiki_response_raw[:400] + "..." if len(wiki_response_raw) > 400 else wiki_response_raw)
+        logging.info(f"--------------------------------------")
+
+        # Temel hata/boşluk/belirsizlik kontrolü
+        if (wiki_response_raw and len(wiki_response_raw.strip()) > 50 and
+            "Did not find results" not in wiki_response_raw and
+            "No good Wikipedia Search Result" not in wiki_response_raw and
+            "may refer to" not in wiki_response_raw and
+            "Page id" not in wiki_response_raw):
+
+            content_to_process = wiki_response_raw.split("Summary:", 1)[-1].strip() if "Summary:" in wiki_response_raw else wiki_response_raw
+            content_to_process = re.sub(r"^Page:.*?\n", "", content_to_process).strip()
+
+            # Tek çağrı: alaka kararı, güven ve cevap aynı üretimde (başlık + cevap) döner
+            wiki_processing_prompt = PromptTemplate.from_template("""
+            GÖREV: Sağlanan Wikipedia Metnini kullanarak aşağıdaki Soruyu yanıtla.
+            TALİMATLAR:
+            1. Metni oku ve soruyla alakalı olup olmadığına karar ver.
+            2. Sorunun cevabını metinde ara.
+            3. Cevabı bulursan, bilgiyi doğrudan ve kısa bir şekilde Türkçe olarak yaz.
+            4. Metin alakasızsa veya cevap metinde yoksa başlıkta ALAKALI: HAYIR yaz ve başka bir şey yazma.
+            5. "Metne göre" gibi ifadeler kullanma.
+
+            {header_instructions}
+
+            SAĞLANAN WIKIPEDIA METNİ:
+            {wikipedia_icerigi}
+
+            SORU: {soru}
+
+            YANITIN (Türkçe):
+            """).partial(header_instructions=ANSWER_HEADER_INSTRUCTIONS)
+            wiki_chain = (wiki_processing_prompt | llm | output_parser).with_config(tags=[FINAL_ANSWER_TAG])
+            logging.info("Wikipedia yanıtı LLM ile tek çağrıda değerlendirilip işleniyor...")
+            with tracing.span("wikipedia_generation"):
+                processed_wiki_answer = await wiki_chain.ainvoke({"soru": question, "wikipedia_icerigi": content_to_process})
+            logging.info(f"Wikipedia İşleme Sonucu (kısaltılmış): {processed_wiki_answer[:500]}...")
+
+            parsed = parse_structured_answer(processed_wiki_answer)
+            if is_confident_answer(parsed):
+                 return parsed["answer"], "Wikipedia (LLM ile İşlendi)"
+            logging.info(f"LLM, Wikipedia içeriğiyle cevap bulamadı (alakalı={parsed['relevant']}, güven={parsed['confidence']}).")
+        else:
+            logging.info("Wikipedia'dan yeterli/anlamlı sonuç alınamadı.")
+    except asyncio.CancelledError:
+        raise
+    except Exception as wiki_e:
+        logging.error(f"HATA: Wikipedia aracı çağrılırken/işlenirken: {wiki_e}", exc_info=True)
+    return None
+
+async def _answer_from_tavily(question, fetch):
+    """Tavily sonucunu (fetch: başlatılmış arama görevi) bekler ve LLM ile özetler. Başarısızsa None."""
+    try:
+        search_results_list = await fetch
+        logging.info(f"\n--- TAM Tavily Ham Yanıtı (Liste) ---")
+        logging.info(search_results_list)
+        logging.info(f"-----------------------------------\n")
+
+        if isinstance(search_results_list, list) and search_results_list:
+             formatted_results = ""
+             for i, result in enumerate(search_results_list[:5]): # İlk 5 sonucu alalım
+                 title = result.get('title', '')
+                 content = result.get('content', '')
+                 # url = result.get('url', '') # URL'i LLM'e vermeyebiliriz
+                 formatted_results += f"Başlık: {title}\nÖzet: {content}\n\n"
+
+             # Tavily için Basit Prompt
+             search_processing_prompt = PromptTemplate.from_template(
+                 "Aşağıdaki web arama sonuçlarını kullanarak '{soru}' sorusunu Türkçe yanıtla. Sonuçlardan en alakalı bilgiyi özetle. "
+                 "Sonuçlar soruyu yanıtlamıyorsa başlıkta ALAKALI: HAYIR yaz ve başka bir şey yazma.\n\n"
+                 "{header_instructions}\n\n{search_results}\n\nYanıt:"
+             ).partial(header_instructions=ANSWER_HEADER_INSTRUCTIONS)
+             search_chain = (search_processing_prompt | llm | output_parser).with_config(tags=[FINAL_ANSWER_TAG])
+             logging.info("Tavily arama sonuçları LLM ile işleniyor...")
+             with tracing.span("tavily_generation"):
+                 processed_tavily_answer = await search_chain.ainvoke({"soru": question, "search_results": formatted_results.strip()})
+             logging.info(f"Tavily İşleme Sonucu (kısaltılmış): {processed_tavily_answer[:500]}...")
+
+             parsed = parse_structured_answer(processed_tavily_answer)
+             if is_confident_answer(parsed):
+                  return parsed["answer"], "Web Search (Tavily ile İşlendi)"
+             logging.info(f"LLM, Tavily sonuçlarından yeterli bir cevap çıkaramadı (alakalı={parsed['relevant']}, güven={parsed['confidence']}).")
+        else:
+             logging.info("Tavily'den liste formatında anlamlı sonuç alınamadı.")
+    except asyncio.CancelledError:
+        raise
+    except Exception as tavily_e:
+        logging.error(f"HATA: Tavily aracı çağrılırken/işlenirken: {tavily_e}", exc_info=True)
+    return None
+
+def _cancel_unused(task):
+    """Kullanılmayan arama görevini iptal eder; bitmişse sonucunu/hatasını sessizce tüketir."""
+    if task is None:
+        return
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+async def arun_news_agent(state: dict):
+    """
+    Genel bilgi sorularını önce Wikipedia, başarısız olursa Tavily kullanarak yanıtlar.
+    NEWS_PARALLEL_FETCH açıkken iki arama aynı anda başlatılır: Wikipedia sonucu işlenirken Tavily
+    sonucu hazır bekler, Wikipedia yeterliyse Tavily araması iptal edilir.
+    """
     logging.info("--- Haber/Genel Bilgi Agent Çalışıyor ---")
     question = state.get("question")
     if not question:
@@ -202,130 +380,55 @@ def run_news_agent(state: dict):
         logging.error("News Agent: Ana LLM yüklenmemiş.")
         return {"answer": "Üzgünüm, cevap üretme servisinde bir sorun var.", "source": "News Agent (LLM Hatası)"}
 
-    # --- Adım 1: Wikipedia'yı Dene (Ansiklopedik bilgi için) ---
-    if wikipedia_langchain_tool:
+    # İlk haber sorusunda araçlar oluşturulur (import'ları event loop'u bloklamasın)
+    wikipedia_tool = await asyncio.to_thread(get_wikipedia_tool)
+    tavily_tool = await asyncio.to_thread(get_tavily_tool)
+
+    wiki_task = None
+    tavily_task = None
+    if wikipedia_tool:
         logging.info(f"Wikipedia'da (TR) '{question}' aranıyor...")
-        attempted_wiki = True
-        try:
-            wiki_response_raw = wikipedia_langchain_tool.run(question)
-            logging.info(f"--- Wikipedia Ham Yanıtı (Başlangıç) ---")
-            logging.info(wiki_response_raw[:400] + "..." if len(wiki_response_raw) > 400 else wiki_response_raw)
-            logging.info(f"--------------------------------------")
-
-            # Temel hata/boşluk/belirsizlik kontrolü
-            if (wiki_response_raw and len(wiki_response_raw.strip()) > 50 and
-                "Did not find results" not in wiki_response_raw and
-                "No good Wikipedia Search Result" not in wiki_response_raw and
-                "may refer to" not in wiki_response_raw and
-                "Page id" not in wiki_response_raw):
-
-                content_to_process = wiki_response_raw.split("Summary:", 1)[-1].strip() if "Summary:" in wiki_response_raw else wiki_response_raw
-                content_to_process = re.sub(r"^Page:.*?\n", "", content_to_process).strip()
-
-                # Alaka Kontrolü
-                relevance_check_prompt = PromptTemplate.from_template(
-                    "Aşağıdaki metin, '{soru}' sorusuyla alakalı mı? Sadece EVET veya HAYIR de.\n\nMetin:\n{metin}"
-                )
-                relevance_chain = relevance_check_prompt | llm | StrOutputParser()
-                logging.info("LLM ile Wikipedia metninin alaka düzeyi kontrol ediliyor...")
-                time.sleep(0.5)
-                relevance_decision = relevance_chain.invoke({"soru": question, "metin": content_to_process[:1000]})
-                logging.info(f"Alaka Kontrolü Sonucu: {relevance_decision}")
-
-                if "evet" in relevance_decision.lower():
-                    # Cevap Üretme  prompt
-                    wiki_processing_prompt = PromptTemplate.from_template("""
-                    GÖREV: Sağlanan Wikipedia Metnini kullanarak aşağıdaki Soruyu yanıtla.
-                    TALİMATLAR:
-                    1. Metni oku.
-                    2. Sorunun cevabını metinde ara.
-                    3. Cevabı bulursan, bilgiyi doğrudan ve kısa bir şekilde Türkçe olarak yaz.
-                    4. Cevabı bulamazsan, SADECE "Sağlanan Wikipedia metninde bu sorunun cevabı bulunmuyor." yaz.
-                    5. "Metne göre" gibi ifadeler kullanma.
-
-                    SAĞLANAN WIKIPEDIA METNİ:
-                    {wikipedia_icerigi}
-
-                    SORU: {soru}
-
-                    YANITIN (Türkçe):
-                    """)
-                    wiki_chain = wiki_processing_prompt | llm | output_parser
-                    logging.info("Alakalı bulunan Wikipedia yanıtı LLM ile işleniyor...")
-                    time.sleep(1)
-                    processed_wiki_answer = wiki_chain.invoke({"soru": question, "wikipedia_icerigi": content_to_process})
-                    logging.info(f"Wikipedia İşleme Sonucu (kısaltılmış): {processed_wiki_answer[:500]}...")
-
-                    # Cevap kontrolü
-                    failure_phrases_final = ["bulunmuyor", "yoktur", "rastlanmadı"]
-                    if not any(phrase in processed_wiki_answer.lower() for phrase in failure_phrases_final) and len(processed_wiki_answer.strip()) > 10 :
-                         final_answer = processed_wiki_answer
-                         final_source = "Wikipedia (LLM ile İşlendi)"
-                    else:
-                         logging.info("LLM, Wikipedia içeriğiyle cevap bulamadı.")
-                else:
-                    logging.warning("LLM, bulunan Wikipedia metnini soruyla alakasız buldu.")
-            else:
-                logging.info("Wikipedia'dan yeterli/anlamlı sonuç alınamadı.")
-        except Exception as wiki_e:
-            logging.error(f"HATA: Wikipedia aracı çağrılırken/işlenirken: {wiki_e}", exc_info=True)
+        wiki_task = asyncio.create_task(tracing.traced("wikipedia_search", wikipedia_tool.arun(question)))
     else:
         logging.info("Wikipedia aracı mevcut değil.")
+    if tavily_tool and NEWS_PARALLEL_FETCH:
+        # Spekülatif: Wikipedia yetersiz kalırsa Tavily sonucu beklemeden hazır olsun
+        logging.info(f"Web'de (Tavily) '{question}' paralel olarak aranıyor...")
+        tavily_task = asyncio.create_task(tracing.traced("web_search", tavily_tool.ainvoke(question)))
 
-    # --- Adım 2: Wikipedia Başarısız Olduysa Web Aramayı Dene (Tavily varsa - GÜNCEL bilgiler için) ---
-    # Özellikle soru "geçen hafta", "bugün", "son durum", "açıklandı mı" gibi ifadeler içeriyorsa Tavily daha uygun olabilir.
-    # Şimdilik basit fallback mantığıyla devam edelim:
-    if not final_answer and tavily_langchain_tool:
-        logging.info(f"Wikipedia yetersiz/başarısız, Web'de (Tavily) '{question}' aranıyor...")
-        attempted_tavily = True
-        try:
-            search_results_list = tavily_langchain_tool.invoke(question)
-            logging.info(f"\n--- TAM Tavily Ham Yanıtı (Liste) ---")
-            logging.info(search_results_list)
-            logging.info(f"-----------------------------------\n")
-
-            if isinstance(search_results_list, list) and search_results_list:
-                 formatted_results = ""
-                 for i, result in enumerate(search_results_list[:5]): # İlk 5 sonucu alalım
-                     title = result.get('title', '')
-                     content = result.get('content', '')
-                     # url = result.get('url', '') # URL'i LLM'e vermeyebiliriz
-                     formatted_results += f"Başlık: {title}\nÖzet: {content}\n\n"
-
-                 # Tavily için Basit Prompt
-                 search_processing_prompt = PromptTemplate.from_template(
-                     "Aşağıdaki web arama sonuçlarını kullanarak '{soru}' sorusunu Türkçe yanıtla. Sonuçlardan en alakalı bilgiyi özetle.\n\n{search_results}\n\nYanıt:"
-                 )
-                 search_chain = search_processing_prompt | llm | output_parser
-                 logging.info("Tavily arama sonuçları LLM ile işleniyor...")
-                 time.sleep(1)
-                 processed_tavily_answer = search_chain.invoke({"soru": question, "search_results": formatted_results.strip()})
-                 logging.info(f"Tavily İşleme Sonucu (kısaltılmış): {processed_tavily_answer[:500]}...")
-
-                 # Sonuç Kontrolü
-                 if processed_tavily_answer and len(processed_tavily_answer.strip()) > 15:
-                     very_negative_phrases = ["üzgünüm", "bulamadım", "bilgi yok", "cevap yok", "net bir cevap bulunamadı"]
-                     if not any(phrase in processed_tavily_answer.lower() for phrase in very_negative_phrases):
-                          final_answer = processed_tavily_answer
-                          final_source = "Web Search (Tavily ile İşlendi)"
-                     else:
-                          logging.info("LLM, Tavily sonuçlarından olumsuz bir yanıt üretti.")
-                 else:
-                      logging.info("LLM, Tavily sonuçlarından anlamlı/yeterli bir özet çıkaramadı.")
+    try:
+        # --- Adım 1: Wikipedia (Ansiklopedik bilgi için) ---
+        if wiki_task is not None:
+            attempted_wiki = True
+            result = await _answer_from_wikipedia(question, wiki_task)
+            if result:
+                final_answer, final_source = result
+
+        # --- Adım 2: Wikipedia Başarısız Olduysa Web Arama (Tavily - GÜNCEL bilgiler için) ---
+        if not final_answer and tavily_tool:
+            attempted_tavily = True
+            if tavily_task is None:
+                logging.info(f"Wikipedia yetersiz/başarısız, Web'de (Tavily) '{question}' aranıyor...")
+                tavily_task = asyncio.create_task(tracing.traced("web_search", tavily_tool.ainvoke(question)))
             else:
-                 logging.info("Tavily'den liste formatında anlamlı sonuç alınamadı.")
-        except Exception as tavily_e:
-            logging.error(f"HATA: Tavily aracı çağrılırken/işlenirken: {tavily_e}", exc_info=True)
-
-    elif not final_answer:
-         logging.info("Tavily aracı mevcut değil veya kullanılmadı.")
+                logging.info("Wikipedia yetersiz/başarısız, paralel başlatılan Tavily sonucu kullanılıyor.")
+            result = await _answer_from_tavily(question, tavily_task)
+            if result:
+                final_answer, final_source = result
+        elif not final_answer:
+             logging.info("Tavily aracı mevcut değil veya kullanılmadı.")
+    finally:
+        if tavily_task is not None and not attempted_tavily:
+            logging.info("Wikipedia cevabı yeterli, paralel Tavily araması iptal ediliyor.")
+        _cancel_unused(wiki_task)
+        _cancel_unused(tavily_task)
 
     # --- Adım 3: Hiçbir Yerden Cevap Bulunamadıysa ---
     if not final_answer:
         logging.warning("Hem Wikipedia hem de Web Search'ten (denendiyse) başarılı bir cevap alınamadı.")
         tried_sources = []
-        if wikipedia_langchain_tool and attempted_wiki: tried_sources.append("Wikipedia")
-        if tavily_langchain_tool and attempted_tavily: tried_sources.append("Web Search")
+        if wikipedia_tool and attempted_wiki: tried_sources.append("Wikipedia")
+        if tavily_tool and attempted_tavily: tried_sources.append("Web Search")
         sources_str = " ve ".join(tried_sources) if tried_sources else "mevcut"
 
         final_answer = f"Üzgünüm, '{question}' hakkında {sources_str} kaynaklarımda yaptığım aramalarda net veya yeterli bir bilgi bulamadım."
@@ -335,6 +438,10 @@ def run_news_agent(state: dict):
 
 
 # 3. Fallback Agent
+async def arun_fallback_agent(state: dict, custom_message: str = None):
+    """run_fallback_agent'ın async karşılığı (LLM/ağ çağrısı yapmaz)."""
+    return run_fallback_agent(state, custom_message)
+
 def run_fallback_agent(state: dict, custom_message: str = None):
     """İlgisiz veya cevaplanamayan sorular için standart bir yanıt verir."""
     logging.info("--- Fallback Agent Çalışıyor ---")
@@ -0,0 +1,246 @@
+# answer_cache.py
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+import logging
+import numpy as np
+from text_utils import normalize_question
+from conversation import is_follow_up
+from metadata_index import parse_query_filters
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Ayarlar ---
+# false ise arayüzler (Streamlit, API sunucusu) grafı önbelleksiz kullanır
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() != "false"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "./answer_cache.sqlite")
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+# Birebir eşleşme yoksa, kosinüs benzerliği bu eşiğin üstündeki önceki soru kullanılır
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+# Route başına geçerlilik süreleri (saniye). Gazete arşivi sadece ingest ile değişir,
+# Tavily cevapları ise hızla eskir. Listede olmayan route'lar önbelleğe alınmaz.
+ANSWER_CACHE_TTLS = {
+    "gazette_agent": 7 * 24 * 3600,
+    "news_agent": 6 * 3600,
+}
+# Web araması (Tavily) ile üretilmiş haber cevapları için kısa TTL
+TAVILY_ANSWER_TTL = 10 * 60
+# Bu ifadeleri içeren kaynaklar hata/bilgi yok cevaplarıdır, önbelleğe alınmaz
+UNCACHEABLE_SOURCE_MARKERS = ("Hata", "Bulunamadı", "Bilinmeyen")
+
+
+def _ttl_for(route, source):
+    if route not in ANSWER_CACHE_TTLS:
+        return None
+    if any(marker in (source or "") for marker in UNCACHEABLE_SOURCE_MARKERS):
+        return None
+    if route == "news_agent" and "Tavily" in (source or ""):
+        return TAVILY_ANSWER_TTL
+    return ANSWER_CACHE_TTLS[route]
+
+
+class AnswerCache:
+    """
+    Graf cevaplarını (answer/source/route) kalıcı olarak saklayan önbellek.
+    Önce normalize edilmiş soru ile birebir, sonra embedding benzerliği ile arar.
+    Route başına TTL, LRU ile sınırlı boyut ve SQLite arka ucu kullanır.
+    """
+
+    def __init__(self, embeddings=None, path=ANSWER_CACHE_PATH, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0}
+        self._lock = threading.Lock()
+        self._conn = _connect(path)
+        # Benzerlik araması için bellekteki vektör matrisi; başka süreçler yazınca yenilenir
+        self._matrix = None
+        self._matrix_keys = []
+        self._data_version = None
+
+    # --- Benzerlik indeksi ---
+    def _load_vectors(self, now):
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._matrix is not None and data_version == self._data_version:
+            return
+        rows = self._conn.execute(
+            "SELECT key, embedding FROM answers WHERE embedding IS NOT NULL AND expires > ?", (now,)
+        ).fetchall()
+        self._matrix_keys = [key for key, _ in rows]
+        if rows:
+            self._matrix = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+        else:
+            self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._data_version = data_version
+
+    def _embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    # --- Arama / kayıt ---
+    def lookup(self, question):
+        """Geçerli bir önceki cevap varsa {answer, source, route} döndürür, yoksa None."""
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, answer, source, route FROM answers WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+        if row:
+            self.stats["exact_hits"] += 1
+            return self._hit(row, now)
+        if self.embeddings is not None:
+            query = self._embed(question)
+            with self._lock:
+                self._load_vectors(now)
+                if self._matrix.shape[0] and self._matrix.shape[1] == query.shape[0]:
+                    sims = self._matrix @ query
+                    best = int(np.argmax(sims))
+                    # Sadece tarih/sayı/kanun numarası farklı sorular (ör. başka günün gazetesi) embedding'de çok
+                    # benzer çıkar; bu alanlar aynı değilse benzer soru eşleşmesi kullanılmaz
+                    if (sims[best] >= self.similarity_threshold
+                            and parse_query_filters(question) == parse_query_filters(self._matrix_keys[best])):
+                        row = self._conn.execute(
+                            "SELECT key, answer, source, route FROM answers WHERE key = ? AND expires > ?",
+                            (self._matrix_keys[best], now),
+                        ).fetchone()
+            if row:
+                self.stats["semantic_hits"] += 1
+                logging.info(f"Cevap önbelleği: benzer soru bulundu (benzerlik {float(sims[best]):.3f}).")
+                return self._hit(row, now)
+        self.stats["misses"] += 1
+        return None
+
+    def _hit(self, row, now):
+        key, answer, source, route = row
+        with self._lock:
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+        return {"answer": answer, "source": source, "route": route}
+
+    def store(self, question, state):
+        """Başarılı bir graf sonucunu route'una uygun TTL ile kaydeder."""
+        route, source, answer = state.get("route"), state.get("source"), state.get("answer")
+        ttl = _ttl_for(route, source)
+        if not ttl or not answer:
+            return False
+        embedding = self._embed(question).tobytes() if self.embeddings is not None else None
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, question, route, answer, source, embedding, created, expires, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (normalize_question(question), question, route, answer, source, embedding, now, now + ttl, now),
+            )
+            self._evict(now)
+            # Kendi yazdıklarımız data_version'ı değiştirmez, matrisi yeniden yüklemeye zorla
+            self._matrix = None
+        self.stats["stores"] += 1
+        return True
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM answers WHERE expires <= ?", (now,))
+        count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def invalidate_route(self, route):
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM answers WHERE route = ?", (route,)).rowcount
+        logging.info(f"Cevap önbelleği: '{route}' için {deleted} kayıt geçersiz kılındı.")
+        return deleted
+
+    def close(self):
+        self._conn.close()
+
+
+def _connect(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS answers ("
+        " key TEXT PRIMARY KEY, question TEXT, route TEXT, answer TEXT, source TEXT,"
+        " embedding BLOB, created REAL, expires REAL, last_used REAL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_route ON answers(route)")
+    return conn
+
+
+def invalidate_cached_answers(route, path=ANSWER_CACHE_PATH):
+    """Vektör deposu yeniden ingest edildiğinde ilgili route'un cevaplarını siler (ör. gazette_agent)."""
+    if not os.path.exists(path):
+        return 0
+    cache = AnswerCache(path=path)
+    try:
+        return cache.invalidate_route(route)
+    finally:
+        cache.close()
+
+
+class CachedAgentGraph:
+    """
+    Derlenmiş grafı cevap önbelleğiyle saran katman; invoke/ainvoke/astream_answer sunar.
+    Takip soruları (cevabı konuşmaya bağlı) önbelleğe bakmadan ve yazılmadan doğrudan grafa gider.
+    """
+
+    def __init__(self, graph, cache):
+        self.graph = graph
+        self.cache = cache
+
+    def _cached_state(self, initial_state, hit):
+        return {**initial_state, **hit, "cached": True}
+
+    def invoke(self, initial_state, config=None):
+        if is_follow_up(initial_state):
+            return self.graph.invoke(initial_state, config)
+        question = initial_state.get("question", "")
+        hit = self.cache.lookup(question)
+        if hit:
+            return self._cached_state(initial_state, hit)
+        final_state = self.graph.invoke(initial_state, config)
+        self.cache.store(question, final_state)
+        return final_state
+
+    async def ainvoke(self, initial_state, config=None):
+        if is_follow_up(initial_state):
+            return await self.graph.ainvoke(initial_state, config)
+        question = initial_state.get("question", "")
+        hit = await asyncio.to_thread(self.cache.lookup, question)
+        if hit:
+            return self._cached_state(initial_state, hit)
+        final_state = await self.graph.ainvoke(initial_state, config)
+        await asyncio.to_thread(self.cache.store, question, final_state)
+        return final_state
+
+    async def astream_answer(self, initial_state):
+        from graph import astream_answer
+        if is_follow_up(initial_state):
+            async for item in astream_answer(self.graph, initial_state):
+                yield item
+            return
+        question = initial_state.get("question", "")
+        hit = await asyncio.to_thread(self.cache.lookup, question)
+        if hit:
+            yield ("final", self._cached_state(initial_state, hit))
+            return
+        async for event_type, payload in astream_answer(self.graph, initial_state):
+            if event_type == "final":
+                await asyncio.to_thread(self.cache.store, question, payload)
+            yield (event_type, payload)
+
+
+def with_answer_cache(graph):
+    """ANSWER_CACHE_ENABLED açıksa grafı cevap önbelleğiyle sarar (aynı/çok benzer sorular grafı tekrar çalıştırmaz)."""
+    if not ANSWER_CACHE_ENABLED:
+        return graph
+    from utils import get_embedding_function
+    return CachedAgentGraph(graph, AnswerCache(get_embedding_function()))
@@ -0,0 +1,86 @@
+# answer_format.py
+import os
+import re
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Cevap üreten LLM çağrıları ilk satıra sabit biçimli bir başlık yazar, cevap metni alttan başlar:
+#   ALAKALI: EVET | GÜVEN: 0.85
+#   <cevap>
+# Başlık önce geldiği için cevap stream edilirken başlık ayıklanıp kalan token'lar doğrudan gösterilebilir.
+ANSWER_HEADER_INSTRUCTIONS = """ÇIKTI BİÇİMİ (zorunlu):
+İlk satıra SADECE şu başlığı yaz: ALAKALI: EVET | GÜVEN: <0 ile 1 arası sayı>
+- Kaynak soruyu yanıtlamak için yeterliyse ALAKALI: EVET, değilse ALAKALI: HAYIR yaz.
+- GÜVEN, cevabın kaynakla desteklendiğinden ne kadar emin olduğundur.
+İkinci satırdan itibaren cevabı yaz."""
+
+# Bu güvenin altındaki cevaplar "bilgi bulunamadı" sayılır
+MIN_ANSWER_CONFIDENCE = float(os.getenv("MIN_ANSWER_CONFIDENCE", "0.5"))
+
+_HEADER_RE = re.compile(
+    r"^\s*\**\s*ALAKALI\s*:\s*(?P<relevant>EVET|HAYIR)\s*\**\s*(?:[|,;]\s*\**\s*GÜVEN\s*:\s*(?P<confidence>[0-9]+(?:[.,][0-9]+)?))?",
+    re.IGNORECASE,
+)
+# Başlık bu kadar karakter içinde bitmezse ilk satır başlık değildir
+_MAX_HEADER_CHARS = 80
+
+
+def parse_structured_answer(text):
+    """
+    LLM çıktısını {"relevant", "confidence", "answer", "has_header"} sözlüğüne çevirir.
+    Başlık yoksa cevap metni olduğu gibi alınır (gösterilebilir), ancak is_confident_answer onu güvenli saymaz.
+    """
+    text = (text or "").strip()
+    first_line, _, rest = text.partition("\n")
+    match = _HEADER_RE.match(first_line)
+    if not match:
+        logging.warning("Yapılandırılmış cevap başlığı bulunamadı, cevap başlıksız kabul ediliyor.")
+        return {"relevant": bool(text), "confidence": None, "answer": text, "has_header": False}
+    confidence = match.group("confidence")
+    confidence = min(1.0, max(0.0, float(confidence.replace(",", ".")))) if confidence else None
+    return {
+        "relevant": match.group("relevant").upper() == "EVET",
+        "confidence": confidence,
+        "answer": rest.strip(),
+        "has_header": True,
+    }
+
+
+def is_confident_answer(parsed, min_confidence=MIN_ANSWER_CONFIDENCE):
+    """
+    Cevap alakalı, boş değil ve (verildiyse) güveni eşiğin üstünde mi? Başlığı olmayan cevap güvenli sayılmaz:
+    model biçime uymadıysa "bilgi bulunmuyor" gibi bir reddi de başlıksız yazmış olabilir.
+    """
+    if not parsed.get("has_header") or not parsed["relevant"] or not parsed["answer"]:
+        return False
+    return parsed["confidence"] is None or parsed["confidence"] >= min_confidence
+
+
+class HeaderStripper:
+    """Stream edilen token'lardan ilk satırdaki başlığı ayıklar; kalan metni olduğu gibi geçirir."""
+
+    def __init__(self):
+        self._buffer = ""
+        self._done = False
+
+    def feed(self, text):
+        if self._done:
+            return text
+        self._buffer += text
+        if "\n" not in self._buffer and len(self._buffer) < _MAX_HEADER_CHARS:
+            return ""
+        self._done = True
+        first_line, newline, rest = self._buffer.partition("\n")
+        self._buffer = ""
+        if _HEADER_RE.match(first_line):
+            return rest.lstrip("\n")
+        return first_line + newline + rest
+
+    def flush(self):
+        """Stream bittiğinde hâlâ tamponda kalan (başlık olmayan) metni döndürür."""
+        if self._done:
+            return ""
+        self._done = True
+        buffered, self._buffer = self._buffer, ""
+        return "" if _HEADER_RE.match(buffered) else buffered
@@ -5,7 +5,11 @@ import os
 # Proje bileşenlerini import et
 from utils import create_or_load_vector_store, get_retriever
 from agents import create_rag_chain # RAG zinciri oluşturma fonksiyonu
-from graph import create_agent_graph
+from graph import create_agent_graph, stream_answer
+from answer_cache import with_answer_cache
+from request_coalescing import with_request_coalescing
+from conversation import new_conversation, conversation_state, advance_conversation
+from tracing import start_metrics_server
 
 # --- Sayfa Ayarları ve Başlangıç ---
 st.set_page_config(page_title="Agentic AI Chatbot", layout="wide")
@@ -25,6 +29,11 @@ def load_environment():
     # print("API Anahtarı yüklendi.") # Geliştirme sırasında kontrol için
     return api_key
 
+# METRICS_PORT ayarlıysa Prometheus metriklerini ayrı porttan sun (Streamlit'in kendi HTTP sunucusu yok)
+@st.cache_resource
+def initialize_metrics_server():
+    return start_metrics_server()
+
 # Vektör veritabanını yükle/oluştur ve retriever'ı al
 @st.cache_resource
 def initialize_vector_store_and_retriever():
@@ -52,14 +61,14 @@ def initialize_rag_chain(_retriever): # Retriever'ı argüman olarak alması cac
 @st.cache_resource
 def initialize_graph(_retriever, _rag_chain): # Diğer bileşenleri argüman olarak alması cache'lemeyi tetikler
     if _retriever and _rag_chain:
-        graph = create_agent_graph(_retriever, _rag_chain)
+        graph = with_request_coalescing(with_answer_cache(create_agent_graph(_retriever, _rag_chain)))
         # print("Agent Grafiği oluşturuldu.") # Geliştirme sırasında kontrol için
         return graph
     elif _retriever: # Sadece retriever varsa (rag chain oluşturulamadıysa?)
         # Belki sadece haber agent'ı çalışacak bir graf oluşturulabilir veya uyarı verilebilir.
         # Şimdilik eksik bilgi ile graf oluşturmayı deneyelim (bazı nodelar hata verebilir)
          st.warning("RAG zinciri oluşturulamadığı için Resmi Gazete Agent'ı düzgün çalışmayabilir.")
-         graph = create_agent_graph(_retriever, None) # Eksik rag_chain ile graf oluştur
+         graph = with_request_coalescing(with_answer_cache(create_agent_graph(_retriever, None))) # Eksik rag_chain ile graf oluştur
          return graph
     else:
          st.error("Graf oluşturmak için gerekli Retriever ve/veya RAG Zinciri eksik.")
@@ -68,6 +77,7 @@ def initialize_graph(_retriever, _rag_chain): # Diğer bileşenleri argüman ola
 
 # --- Ana Akış ---
 api_key = load_environment()
+initialize_metrics_server()
 retriever = initialize_vector_store_and_retriever()
 rag_chain = initialize_rag_chain(retriever) # Retriever'ı argüman olarak geçir
 app_graph = initialize_graph(retriever, rag_chain) # Bileşenleri argüman olarak geçir
@@ -89,6 +99,9 @@ st.sidebar.warning("Resmi Gazete verileri sadece `data` klasöründeki PDF'lerde
 # Sohbet geçmişini session state'de tutalım
 if "messages" not in st.session_state:
     st.session_state.messages = []
+# Grafa verilen konuşma durumu (sınırlı geçmiş, özet, önceki route ve belge seti); takip soruları için
+if "conversation" not in st.session_state:
+    st.session_state.conversation = new_conversation()
 
 # Geçmiş mesajları göster
 for message in st.session_state.messages:
@@ -108,15 +121,24 @@ if prompt := st.chat_input("Sorunuzu buraya yazın..."):
         full_response = ""
         with st.spinner("Düşünüyorum..."):
             try:
-                # Agent grafiğini çalıştır
-                initial_state = {"question": prompt}
-                final_state = app_graph.invoke(initial_state)
+                # Agent grafiğini çalıştır; cevap token'ları geldikçe ekrana yazılır
+                initial_state = {"question": prompt, **conversation_state(st.session_state.conversation)}
+                final_state = {}
+                for event_type, payload in stream_answer(app_graph, initial_state):
+                    if event_type == "token":
+                        full_response += payload
+                        message_placeholder.markdown(full_response + "▌")
+                    elif event_type == "reset":
+                        full_response = ""
+                    elif event_type == "final":
+                        final_state = payload
 
                 # Cevabı ve kaynağı al
                 answer = final_state.get("answer", "Üzgünüm, bir cevap alamadım.")
                 source = final_state.get("source", "Bilinmeyen Kaynak")
+                st.session_state.conversation = advance_conversation(st.session_state.conversation, prompt, final_state)
 
-                # Cevabı ekrana yazdır
+                # Cevabı ekrana yazdır (kaynak etiketi cevap tamamlanınca eklenir)
                 full_response = f"{answer}\n\n*[Kaynak: {source}]*"
                 message_placeholder.markdown(full_response)
 
@@ -0,0 +1,84 @@
+# async_utils.py
+import os
+import asyncio
+import threading
+import contextvars
+
+# Senkron API'ler (Streamlit, CLI) async agent kodunu tek bir arka plan event loop'unda çalıştırır.
+# Her çağrıda yeni loop açmak (asyncio.run) loop'a bağlı async istemcileri (gRPC vb.) bozar.
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_background_loop():
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True)
+                thread.start()
+                _loop = loop
+    return _loop
+
+
+def _reset_after_fork():
+    # Fork edilen süreçte loop'u çalıştıran thread yoktur; ilk run_sync çağrısında yeni loop açılır
+    global _loop, _loop_lock
+    _loop = None
+    _loop_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def adopt_running_loop():
+    """
+    Kendi event loop'u olan uygulamalar (ör. ASGI sunucusu) için: çalışan loop'u ortak agent loop'u yapar.
+    Böylece thread'lerden yapılan run_sync çağrıları da async istemcilerle aynı loop'u kullanır.
+    Arka plan loop'u daha önce başlatılmışsa o korunur.
+    """
+    global _loop
+    running = asyncio.get_running_loop()
+    with _loop_lock:
+        if _loop is None:
+            _loop = running
+    return _loop
+
+
+def run_sync(coro):
+    """Bir coroutine'i arka plan event loop'unda çalıştırıp sonucunu senkron olarak döndürür."""
+    loop = _get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync arka plan event loop'unun içinden çağrılamaz; await kullanın.")
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), loop).result()
+
+
+async def _in_context(coro, context):
+    """Çağıran thread'in context değişkenlerini (aktif trace/span, callback'ler) coroutine'e taşır."""
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+def iterate_sync(async_iterable):
+    """Bir async generator'ı arka plan event loop'unda tüketip elemanlarını senkron olarak üretir."""
+    loop = _get_background_loop()
+    iterator = async_iterable.__aiter__()
+    try:
+        while True:
+            try:
+                item = asyncio.run_coroutine_threadsafe(iterator.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            asyncio.run_coroutine_threadsafe(aclose(), loop).result()
@@ -0,0 +1,208 @@
+# batch_cli.py
+"""
+JSONL soru dosyalarını grafı paralel çalıştırarak toplu cevaplar (regresyon setleri, önbellek ısıtma, analist işleri).
+
+    python batch_cli.py sorular.jsonl cevaplar.jsonl --concurrency 8
+
+Her giriş satırı bir JSON nesnesidir; soru --question-field alanından (varsayılan "question"), kimlik
+--id-field alanından okunur (yoksa satır numarası). Sonuçlar tamamlandıkça çıkış dosyasına eklenir ve
+çıkış dosyası aynı zamanda kontrol noktasıdır: yeniden çalıştırıldığında başarıyla cevaplanmış kimlikler
+atlanır, hatalı olanlar tekrar denenir (aynı kimlik için son satır geçerlidir).
+LLM çağrıları llm_gateway'in ortak kota sınırlarından geçer; eşzamanlılık bu sınırların üstüne çıkamaz.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Ayarlar ---
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_REQUEST_TIMEOUT = float(os.getenv("BATCH_REQUEST_TIMEOUT", "120"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "1"))
+PROGRESS_EVERY = 25
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="JSONL soru dosyasını agent grafı ile toplu cevaplar.")
+    parser.add_argument("input", help="Giriş JSONL dosyası (her satır bir soru nesnesi)")
+    parser.add_argument("output", help="Çıkış JSONL dosyası (aynı zamanda kontrol noktası)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Aynı anda çalışan soru sayısı")
+    parser.add_argument("--question-field", default="question",
+                        help="Sorunun okunacağı alan (satırda yoksa 'title' ve 'body' birleştirilir)")
+    parser.add_argument("--id-field", default="id", help="Kimliğin okunacağı alan (yoksa satır numarası)")
+    parser.add_argument("--timeout", type=float, default=BATCH_REQUEST_TIMEOUT, help="Soru başına zaman aşımı (saniye)")
+    parser.add_argument("--restart", action="store_true", help="Kontrol noktasını yok say, çıkış dosyasını baştan yaz")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Cevap önbelleğini kullanma")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help="1'den büyükse sorular bu kadar pre-fork işçi sürecinde cevaplanır")
+    return parser.parse_args(argv)
+
+
+def load_completed_ids(output_path):
+    """Çıkış dosyasında hatasız sonucu olan kimlikler (yarım kalmış son satır yok sayılır)."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("error"):
+                completed.discard(record.get("id"))
+            else:
+                completed.add(record.get("id"))
+    return completed
+
+
+def _ends_mid_line(path):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+# Soru alanı olmayan satırlarda (ör. request_id/title/body biçimindeki istek dosyaları) soru bu alanlardan kurulur
+FALLBACK_QUESTION_FIELDS = ("title", "body")
+
+
+def _question_text(record, question_field):
+    question = str(record.get(question_field) or "").strip()
+    if question:
+        return question
+    parts = [str(record.get(field) or "").strip() for field in FALLBACK_QUESTION_FIELDS]
+    return "\n".join(part for part in parts if part)
+
+
+def iter_questions(input_path, question_field, id_field):
+    """Giriş dosyasını satır satır okur (dosya belleğe alınmaz); (kimlik, soru) üretir."""
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f"Satır {line_number} geçerli JSON değil, atlanıyor.")
+                continue
+            question = _question_text(record, question_field)
+            if not question:
+                logging.warning(f"Satır {line_number}: '{question_field}', 'title' ve 'body' alanları boş, atlanıyor.")
+                continue
+            item_id = record.get(id_field)
+            yield (str(item_id) if item_id is not None else f"line-{line_number}"), question
+
+
+async def answer_one(agent_graph, item_id, question, timeout):
+    started = time.perf_counter()
+    result = {"id": item_id, "question": question}
+    try:
+        async with asyncio.timeout(timeout):
+            state = await agent_graph.ainvoke({"question": question})
+        result.update(answer=state.get("answer"), source=state.get("source"),
+                      route=state.get("route"), cached=bool(state.get("cached")))
+    except TimeoutError:
+        result["error"] = f"Zaman aşımı ({timeout} sn)"
+    except Exception as e:
+        logging.error(f"Hata: '{item_id}' cevaplanırken: {e}", exc_info=True)
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run_batch(agent_graph, args):
+    completed = set() if args.restart else load_completed_ids(args.output)
+    if completed:
+        logging.info(f"Kontrol noktası: {len(completed)} soru daha önce cevaplanmış, atlanacak.")
+    queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    counts = {"done": 0, "errors": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    with open(args.output, "w" if args.restart else "a", encoding="utf-8") as out:
+        if not args.restart and _ends_mid_line(args.output):
+            # Kesintide yarım kalan son satırı kapat; yeni sonuçlar ona eklenmesin
+            out.write("\n")
+
+        def write(result):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            counts["done"] += 1
+            counts["errors"] += 1 if result.get("error") else 0
+            if counts["done"] % PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - started
+                logging.info(f"İlerleme: {counts['done']} cevap, {counts['errors']} hata, {counts['done'] / elapsed:.2f} soru/sn")
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                try:
+                    if item is None:
+                        return
+                    write(await answer_one(agent_graph, *item, args.timeout))
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+        try:
+            for item_id, question in iter_questions(args.input, args.question_field, args.id_field):
+                if item_id in completed:
+                    counts["skipped"] += 1
+                    continue
+                await queue.put((item_id, question))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+
+    elapsed = time.perf_counter() - started
+    summary = {**counts, "seconds": round(elapsed, 2),
+               "questions_per_second": round(counts["done"] / elapsed, 3) if elapsed else 0.0}
+    logging.info(f"Toplu cevaplama bitti: {summary}")
+    return summary
+
+
+async def amain(args):
+    from async_utils import adopt_running_loop
+    from graph import build_agent_graph
+    # run_sync çağrıları ve async LLM istemcileri aynı loop'u kullanır
+    adopt_running_loop()
+    if args.workers > 1:
+        from worker_pool import WorkerPool
+        # Havuz grafın ainvoke arayüzünü sağlar; kapanışta işçi bazında verim raporlanır
+        pool = WorkerPool(args.workers, use_answer_cache=not args.no_answer_cache)
+        await asyncio.to_thread(pool.start)
+        try:
+            return await run_batch(pool, args)
+        finally:
+            await asyncio.to_thread(pool.close)
+    agent_graph = await asyncio.to_thread(build_agent_graph, not args.no_answer_cache)
+    return await run_batch(agent_graph, args)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.concurrency < 1 or args.workers < 1:
+        raise SystemExit("--concurrency ve --workers en az 1 olmalı.")
+    try:
+        summary = asyncio.run(amain(args))
+    except KeyboardInterrupt:
+        logging.warning("Kesildi. Tamamlanan sonuçlar kaydedildi; aynı komutla kaldığı yerden devam edebilirsiniz.")
+        return 130
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# benchmarks/corpus.py
+"""Resmi Gazete benzeri sentetik PDF arşivi üretir (harici PDF kütüphanesi gerektirmez)."""
+import os
+import random
+
+# Yerleşik Helvetica fontu latin-1 ile sınırlı; metinler Türkçe karakter içermeyen ASCII ile yazılır
+DOC_TYPES = ["YONETMELIK", "TEBLIG", "KANUN", "CUMHURBASKANI KARARI", "GENELGE", "ILAN"]
+SUBJECTS = [
+    "sosyal sigortalar ve genel saglik sigortasi", "tarimsal destekleme odemeleri", "yatirim tesvik belgesi",
+    "ogretim uyesi alimi", "kamu ihale usulleri", "gelir vergisi istisnalari", "enerji piyasasi lisanslari",
+    "cevre izin ve lisans islemleri", "ihracat destek programi", "kooperatif kredi faiz destegi",
+]
+LAW_NUMBERS = [5510, 4734, 3065, 193, 2547, 5520, 4628, 2872, 6102, 7420]
+LINES_PER_PAGE = 45
+
+
+def _page_lines(rng, doc_index, page_index):
+    doc_type = DOC_TYPES[doc_index % len(DOC_TYPES)]
+    subject = SUBJECTS[doc_index % len(SUBJECTS)]
+    law = LAW_NUMBERS[doc_index % len(LAW_NUMBERS)]
+    issue = 32000 + doc_index
+    day, month = 1 + doc_index % 28, 1 + doc_index % 12
+    lines = [f"T.C. Resmi Gazete Sayi: {issue} Tarih: {day:02d}.{month:02d}.2024", f"{doc_type} - {subject.upper()}"]
+    article = page_index * 4
+    while len(lines) < LINES_PER_PAGE:
+        article += 1
+        lines.append(f"MADDE {article} - (1) Bu {doc_type.lower()} {subject} ile ilgili usul ve esaslari duzenler.")
+        lines.append(f"(2) {law} sayili Kanun kapsaminda basvurular {rng.randint(15, 90)} gun icinde yapilir.")
+        lines.append(f"(3) Destek tutari {rng.randint(5, 500) * 1000} TL olup sartlar Bakanlikca belirlenir.")
+        lines.append("(4) Bu madde yayimi tarihinde yururluge girer ve hukumlerini Cumhurbaskani yurutur.")
+    return lines[:LINES_PER_PAGE]
+
+
+def write_pdf(path, pages):
+    """Her sayfası satır listesi olan minimal bir PDF 1.4 dosyası yazar."""
+    def escape(text):
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    out = [b"%PDF-1.4\n"]
+    offsets = {}
+
+    def add(number, content):
+        offsets[number] = sum(len(part) for part in out)
+        out.append(f"{number} 0 obj\n".encode() + content + b"\nendobj\n")
+
+    page_numbers = [(4 + 2 * i, 5 + 2 * i) for i in range(len(pages))]
+    add(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{page} 0 R" for page, _ in page_numbers)
+    add(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    add(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for (page, contents), lines in zip(page_numbers, pages):
+        add(page, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                   f"/Resources << /Font << /F1 3 0 R >> >> /Contents {contents} 0 R >>").encode())
+        stream = ("BT /F1 8 Tf 30 770 Td 11 TL " + " ".join(f"({escape(line)}) '" for line in lines) + " ET").encode("latin-1")
+        add(contents, f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+    xref_offset = sum(len(part) for part in out)
+    count = max(offsets) + 1
+    xref = [f"xref\n0 {count}\n0000000000 65535 f \n"] + [f"{offsets[i]:010d} 00000 n \n" for i in range(1, count)]
+    out.append("".join(xref).encode() + f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+    with open(path, "wb") as f:
+        f.write(b"".join(out))
+
+
+def build_corpus(folder, documents=20, pages_per_document=4, seed=42):
+    """folder içine sentetik gazete PDF'leri yazar; (dosya sayısı, sayfa sayısı, toplam bayt) döndürür."""
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    total_bytes = 0
+    for doc_index in range(documents):
+        pages = [_page_lines(rng, doc_index, page_index) for page_index in range(pages_per_document)]
+        path = os.path.join(folder, f"resmi_gazete_{32000 + doc_index}.pdf")
+        write_pdf(path, pages)
+        total_bytes += os.path.getsize(path)
+    return documents, documents * pages_per_document, total_bytes
@@ -0,0 +1,245 @@
+# benchmarks/fakes.py
+"""
+Benchmark için ağ kullanmayan, deterministik LLM / embedding / araç karşılıkları.
+Gecikmeler ayarlanabilir; çağrı sayıları ve prompt boyutları raporlama için toplanır.
+"""
+import re
+import time
+import asyncio
+import hashlib
+import threading
+from dataclasses import dataclass
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import Tool
+
+EMBEDDING_DIMENSIONS = 256
+_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass
+class FakeLatency:
+    """Saniye cinsinden simüle edilen gecikmeler."""
+    llm_seconds: float = 0.3
+    llm_seconds_per_1k_prompt_tokens: float = 0.05
+    llm_seconds_per_output_token: float = 0.002
+    embed_seconds: float = 0.05
+    wikipedia_seconds: float = 0.4
+    tavily_seconds: float = 0.8
+
+
+class CallRecorder:
+    """Thread-safe çağrı sayaçları ve prompt boyutu listesi."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {}
+            self.prompt_tokens = {}
+
+    def record(self, kind, prompt_tokens=None, count=1):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + count
+            if prompt_tokens is not None:
+                self.prompt_tokens.setdefault(kind, []).append(prompt_tokens)
+
+
+recorder = CallRecorder()
+
+
+def _fold(text):
+    from text_utils import fold_turkish
+    return fold_turkish(text)
+
+
+def _words(text):
+    return _WORD_RE.findall(_fold(text))
+
+
+def _section(text, start_marker, end_marker):
+    start = text.find(start_marker)
+    if start < 0:
+        return ""
+    start += len(start_marker)
+    end = text.find(end_marker, start)
+    return text[start:end if end >= 0 else None].strip()
+
+
+# --- LLM ---
+def classify_prompt(prompt):
+    """Prompt'un hangi adıma ait olduğunu belirler (raporda çağrıları adım adım saymak için)."""
+    if "Kategori:" in prompt and "Kategoriler ve Öncelikler" in prompt:
+        return "router"
+    if "Oluşturulan Arama Sorguları" in prompt:
+        return "query_generation"
+    if "BAĞLAM PARÇALARI" in prompt:
+        return "rag_answer"
+    if "WIKIPEDIA METNİ" in prompt:
+        return "wikipedia_answer"
+    if "web arama sonuçlarını" in prompt:
+        return "tavily_answer"
+    return "other"
+
+
+def fake_reply(prompt, output_words=60):
+    """Prompt türüne göre deterministik, biçimi gerçek modele uygun bir cevap üretir."""
+    kind = classify_prompt(prompt)
+    if kind == "router":
+        from fast_router import score_question
+        question = _section(prompt, "Soru:", "Kategori:")
+        scores = score_question(question)
+        route, score = max(scores.items(), key=lambda item: item[1])
+        if score <= 0:
+            return "İlgisiz/Diğer"
+        return "Resmi Gazete" if route == "gazette_agent" else "Haber/Genel Bilgi"
+    if kind == "query_generation":
+        question = _section(prompt, "Orijinal Soru:", "Oluşturulan Arama Sorguları")
+        return "\n".join(f"{question} {suffix}" for suffix in ("hakkında", "şartları nelerdir", "Resmi Gazete düzenlemesi"))
+    if kind in ("rag_answer", "wikipedia_answer", "tavily_answer"):
+        source = prompt.split("SORU:")[0] if kind != "tavily_answer" else prompt
+        words = [w for w in _words(source) if len(w) > 3][:output_words]
+        if not words:
+            return "ALAKALI: HAYIR | GÜVEN: 0.1"
+        return "ALAKALI: EVET | GÜVEN: 0.9\n" + " ".join(words) + "."
+    return " ".join(_words(prompt)[:output_words])
+
+
+class FakeChatModel(BaseChatModel):
+    """ChatGoogleGenerativeAI yerine kullanılan deterministik sohbet modeli."""
+
+    latency: FakeLatency
+    output_words: int = 60
+
+    @property
+    def _llm_type(self):
+        return "benchmark-fake"
+
+    def _prepare(self, messages):
+        from llm_gateway import count_tokens
+        prompt = "\n".join(str(m.content) for m in messages)
+        prompt_tokens = count_tokens(prompt)
+        recorder.record(f"llm:{classify_prompt(prompt)}", prompt_tokens)
+        reply = fake_reply(prompt, self.output_words)
+        delay = self.latency.llm_seconds + self.latency.llm_seconds_per_1k_prompt_tokens * prompt_tokens / 1000
+        return reply, delay
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        reply, delay = self._prepare(messages)
+        time.sleep(delay + self.latency.llm_seconds_per_output_token * len(reply.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        reply, delay = self._prepare(messages)
+        await asyncio.sleep(delay + self.latency.llm_seconds_per_output_token * len(reply.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply, delay = self._prepare(messages)
+        time.sleep(delay)
+        for piece in re.findall(r"\S+\s*", reply):
+            time.sleep(self.latency.llm_seconds_per_output_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply, delay = self._prepare(messages)
+        await asyncio.sleep(delay)
+        for piece in re.findall(r"\S+\s*", reply):
+            await asyncio.sleep(self.latency.llm_seconds_per_output_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+# --- Embedding ---
+class HashingEmbeddings(Embeddings):
+    """
+    GoogleGenerativeAIEmbeddings yerine kelime hash'leme ile vektör üretir. Ortak kelimesi olan
+    metinler benzer vektörler alır; böylece yönlendirme ve arama gerçeğe yakın davranır.
+    """
+
+    def __init__(self, latency, dimensions=EMBEDDING_DIMENSIONS):
+        self.latency = latency
+        self.dimensions = dimensions
+
+    def _vector(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in _words(text):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts, **kwargs):
+        recorder.record("embed:documents")
+        recorder.record("embed:texts", count=len(texts))
+        time.sleep(self.latency.embed_seconds)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        recorder.record("embed:query")
+        time.sleep(self.latency.embed_seconds)
+        return self._vector(text)
+
+
+# --- Araçlar ---
+def make_wikipedia_tool(latency, miss_rate=0.3):
+    """WikipediaQueryRun çıktısına benzeyen sahte araç. Sorunun hash'ine göre belirli oranda sonuç bulamaz."""
+
+    def _result(query):
+        recorder.record("tool:wikipedia")
+        bucket = int(hashlib.sha1(_fold(query).encode("utf-8")).hexdigest(), 16) % 100
+        if bucket < miss_rate * 100:
+            return "No good Wikipedia Search Result was found"
+        topic = " ".join(_words(query)[:4]) or "konu"
+        summary = " ".join(f"{topic} hakkında ansiklopedik bilgi cümlesi {i}." for i in range(12))
+        return f"Page: {topic.title()}\nSummary: {summary}"
+
+    def _run(query):
+        time.sleep(latency.wikipedia_seconds)
+        return _result(query)
+
+    async def _arun(query):
+        await asyncio.sleep(latency.wikipedia_seconds)
+        return _result(query)
+
+    return Tool(name="wikipedia_search", func=_run, coroutine=_arun, description="Benchmark Wikipedia aracı")
+
+
+def make_tavily_tool(latency, max_results=5):
+    """TavilySearchResults çıktısına ([{title, url, content}]) benzeyen sahte araç."""
+
+    def _result(query):
+        recorder.record("tool:tavily")
+        topic = " ".join(_words(query)[:4]) or "konu"
+        return [{"title": f"{topic} haberi {i}", "url": f"https://example.com/{i}",
+                 "content": f"{topic} ile ilgili güncel gelişme {i}: açıklama yapıldı ve rakamlar paylaşıldı."}
+                for i in range(max_results)]
+
+    def _run(query):
+        time.sleep(latency.tavily_seconds)
+        return _result(query)
+
+    async def _arun(query):
+        await asyncio.sleep(latency.tavily_seconds)
+        return _result(query)
+
+    return Tool(name="web_search", func=_run, coroutine=_arun, description="Benchmark web arama aracı")
+
+
+def install_fakes(latency, output_words=60):
+    """llm_gateway'in istemci fabrikalarını sahte modellerle değiştirir (agents/utils import edilmeden önce çağrılmalı)."""
+    import llm_gateway
+    llm_gateway.gateway.chat_factory = lambda model, temperature: FakeChatModel(latency=latency, output_words=output_words)
+    llm_gateway.gateway.embeddings_factory = lambda model: HashingEmbeddings(latency)
+    return llm_gateway.gateway
@@ -0,0 +1,359 @@
+# benchmarks/run_benchmark.py
+"""
+Çevrimdışı performans ölçümü: sentetik PDF arşivini create_or_load_vector_store ile ingest eder,
+soru setini create_agent_graph üzerinden çalıştırır ve adım bazında süre, çağrı sayısı ve prompt
+boyutu raporu üretir. Google/Tavily anahtarı ya da ağ erişimi gerekmez.
+
+Kullanım (depo kök dizininden):
+    python -m benchmarks.run_benchmark
+    python -m benchmarks.run_benchmark --questions benchmarks/questions.jsonl --repeat 3 --output rapor.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import statistics
+import threading
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+DEFAULT_QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.jsonl")
+# Zamanlaması raporlanan graf adımları (node ve yönlendirme fonksiyonu adları)
+GRAPH_STAGES = {"route_question": "routing", "gazette_agent": "gazette_agent",
+                "news_agent": "news_agent", "fallback_agent": "fallback_agent"}
+# Soğuk başlangıçta import edilen uygulama modülleri; import sırasında istemci kurulmamalı, ağ çağrısı yapılmamalı
+IMPORT_MODULES = ("utils", "agents", "supervisor", "graph")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Agentic chatbot çevrimdışı benchmark")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS_PATH,
+                        help="JSONL soru dosyası ('question' alanı; yoksa 'title'/'body' kullanılır)")
+    parser.add_argument("--documents", type=int, default=20, help="Sentetik PDF sayısı")
+    parser.add_argument("--pages", type=int, default=4, help="PDF başına sayfa sayısı")
+    parser.add_argument("--repeat", type=int, default=1, help="Soru setinin kaç kez tekrarlanacağı")
+    parser.add_argument("--concurrency", type=int, default=1, help="Aynı anda çalışan soru sayısı")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="LLM çağrısı başına sabit gecikme (sn)")
+    parser.add_argument("--llm-latency-per-1k", type=float, default=0.05, help="1000 prompt token başına ek gecikme (sn)")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Embedding çağrısı başına gecikme (sn)")
+    parser.add_argument("--wikipedia-latency", type=float, default=0.4)
+    parser.add_argument("--tavily-latency", type=float, default=0.8)
+    parser.add_argument("--wikipedia-miss-rate", type=float, default=0.3, help="Wikipedia'nın sonuç bulamadığı soru oranı")
+    parser.add_argument("--caches", action="store_true", help="Embedding ve araç önbelleklerini açık bırak")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Aynı anda çalışan aynı soruları tek çalıştırmada birleştir (--repeat ve --concurrency ile)")
+    parser.add_argument("--import-budget", type=float, default=1.0, help="Uygulama modüllerinin import süresi bütçesi (sn)")
+    parser.add_argument("--import-repeat", type=int, default=3, help="Import süresi ölçüm tekrarı (temiz süreçte)")
+    parser.add_argument("--workdir", default=None, help="Corpus/vektör deposu klasörü (varsayılan: geçici klasör)")
+    parser.add_argument("--output", default=None, help="JSON raporun yazılacağı dosya")
+    return parser.parse_args(argv)
+
+
+def load_questions(path):
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            text = record.get("question") or record.get("title") or record.get("body")
+            if text:
+                questions.append({"question": text, "expected_route": record.get("expected_route")})
+    return questions
+
+
+def configure_environment(args, workdir):
+    """Uygulama modülleri import edilmeden önce çağrılmalı: ayarlar import anında okunur."""
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark-offline")
+    os.environ.pop("TAVILY_API_KEY", None)
+    # Kota sınırları ölçümü bozmasın
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000")
+    os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "1000000000")
+    os.environ.setdefault("EMBED_REQUESTS_PER_MINUTE", "1000000")
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "true" if args.caches else "false"
+    os.environ["TOOL_CACHE_ENABLED"] = "true" if args.caches else "false"
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.sqlite")
+    os.environ["TOOL_CACHE_PATH"] = os.path.join(workdir, "tool_cache.sqlite")
+    os.environ["ANSWER_CACHE_PATH"] = os.path.join(workdir, "answer_cache.sqlite")
+
+
+def measure_import_time(budget, repeat=3, modules=IMPORT_MODULES):
+    """
+    Uygulama modüllerini her seferinde temiz bir Python sürecinde, API anahtarları olmadan import eder.
+    import_seconds: modüllerin import süresi, process_seconds: yorumlayıcı açılışı dahil toplam süre.
+    """
+    code = ("import time, importlib; started = time.perf_counter(); "
+            f"[importlib.import_module(name) for name in {list(modules)!r}]; "
+            "print(time.perf_counter() - started)")
+    env = {key: value for key, value in os.environ.items() if key not in ("GOOGLE_API_KEY", "TAVILY_API_KEY")}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+    import_samples, process_samples = [], []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+        process_samples.append(time.perf_counter() - started)
+        if completed.returncode != 0:
+            error = (completed.stderr.strip().splitlines() or ["bilinmeyen hata"])[-1]
+            return {"modules": list(modules), "budget_seconds": budget, "error": error, "within_budget": False}
+        import_samples.append(float(completed.stdout.strip().splitlines()[-1]))
+    import_seconds = min(import_samples)
+    return {
+        "modules": list(modules),
+        "import_seconds": round(import_seconds, 3),
+        "process_seconds": round(min(process_samples), 3),
+        "budget_seconds": budget,
+        "within_budget": import_seconds <= budget,
+    }
+
+
+class StageTimer:
+    """Adım adım süreleri toplar (ms)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds * 1000)
+
+    def summary(self):
+        return {stage: summarize(values) for stage, values in sorted(self.samples.items())}
+
+
+def summarize(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "total": round(sum(ordered), 2),
+        "mean": round(statistics.fmean(ordered), 2),
+        "p50": round(ordered[len(ordered) // 2], 2),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+def make_callback_handler(timer):
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class StageCallbackHandler(BaseCallbackHandler):
+        """Graf çalışırken node, retriever ve LLM sürelerini run_id bazında ölçer."""
+        run_inline = True
+
+        def __init__(self):
+            self._starts = {}
+
+        def _start(self, run_id, stage):
+            self._starts[run_id] = (stage, time.perf_counter())
+
+        def _end(self, run_id):
+            started = self._starts.pop(run_id, None)
+            if started:
+                timer.add(started[0], time.perf_counter() - started[1])
+
+        def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+            name = kwargs.get("name") or (serialized or {}).get("name")
+            stage = GRAPH_STAGES.get(name)
+            # Node ile içindeki aynı adlı RunnableLambda iki kez sayılmasın
+            if stage and self._starts.get(parent_run_id, (None,))[0] != stage:
+                self._start(run_id, stage)
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+            self._start(run_id, "retrieval")
+
+        def on_retriever_end(self, documents, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self._start(run_id, "llm_call")
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            self._end(run_id)
+
+    return StageCallbackHandler()
+
+
+def time_function(module, name, timer, stage):
+    """module.name fonksiyonunu süre ölçen bir sarmalayıcıyla değiştirir."""
+    original = getattr(module, name)
+
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            timer.add(stage, time.perf_counter() - started)
+
+    setattr(module, name, timed)
+
+
+async def run_questions(graph, questions, args, timer):
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    results = []
+
+    async def run_one(item):
+        async with semaphore:
+            handler = make_callback_handler(timer)
+            started = time.perf_counter()
+            error = None
+            try:
+                state = await graph.ainvoke({"question": item["question"]}, config={"callbacks": [handler]})
+            except Exception as e:
+                state, error = {}, repr(e)
+            elapsed = time.perf_counter() - started
+            timer.add("end_to_end", elapsed)
+            results.append({
+                "question": item["question"],
+                "expected_route": item["expected_route"],
+                "route": state.get("route"),
+                "source": state.get("source"),
+                "answer_chars": len(state.get("answer") or ""),
+                "seconds": round(elapsed, 4),
+                "error": error,
+            })
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_one(item) for _ in range(args.repeat) for item in questions))
+    return results, time.perf_counter() - started
+
+
+def build_report(args, ingest, results, wall_seconds, timer, recorder, gateway_stats, cold_start=None):
+    judged = [r for r in results if r["expected_route"]]
+    correct = sum(1 for r in judged if r["route"] == r["expected_route"])
+    prompt_sizes = {kind.split(":", 1)[1]: summarize(values) for kind, values in sorted(recorder.prompt_tokens.items())}
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "workdir")},
+        "cold_start": cold_start,
+        "ingest": ingest,
+        "questions": {
+            "count": len(results),
+            "errors": sum(1 for r in results if r["error"]),
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_qps": round(len(results) / wall_seconds, 3) if wall_seconds else None,
+            "route_accuracy": round(correct / len(judged), 3) if judged else None,
+            "routes": {route: sum(1 for r in results if r["route"] == route) for route in sorted({str(r["route"]) for r in results})},
+        },
+        "stages_ms": timer.summary(),
+        "calls": dict(sorted(recorder.counts.items())),
+        "prompt_tokens": prompt_sizes,
+        "gateway": {k: round(v, 3) if isinstance(v, float) else v for k, v in gateway_stats.items()},
+        "results": sorted(results, key=lambda r: r["question"]),
+    }
+
+
+def print_report(report):
+    cold_start = report.get("cold_start")
+    if cold_start:
+        print("\n=== Soğuk başlangıç ===")
+        if cold_start.get("error"):
+            print(f"Import başarısız: {cold_start['error']}")
+        else:
+            status = "bütçe içinde" if cold_start["within_budget"] else "BÜTÇE AŞILDI"
+            print(f"{', '.join(cold_start['modules'])} import: {cold_start['import_seconds']:.3f} sn "
+                  f"(süreç: {cold_start['process_seconds']:.3f} sn, bütçe: {cold_start['budget_seconds']} sn) -> {status}")
+    ingest = report["ingest"]
+    print("\n=== Ingest ===")
+    print(f"{ingest['documents']} PDF / {ingest['pages']} sayfa / {ingest['chunks']} parça, {ingest['seconds']:.2f} sn "
+          f"-> {ingest['pages_per_second']:.1f} sayfa/sn, {ingest['chunks_per_second']:.1f} parça/sn, {ingest['mb_per_second']:.2f} MB/sn")
+    questions = report["questions"]
+    print("\n=== Sorular ===")
+    print(f"{questions['count']} soru, {questions['wall_seconds']:.2f} sn, {questions['throughput_qps']} soru/sn, "
+          f"yönlendirme doğruluğu: {questions['route_accuracy']}, hata: {questions['errors']}, route dağılımı: {questions['routes']}")
+    print("\n=== Adım süreleri (ms) ===")
+    print(f"{'adım':<16}{'adet':>6}{'ort':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for stage, stats in report["stages_ms"].items():
+        print(f"{stage:<16}{stats['count']:>6}{stats['mean']:>10.1f}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['max']:>10.1f}")
+    if report.get("coalescing"):
+        coalescing = report["coalescing"]
+        print(f"Birleştirme: {coalescing['executions']} çalıştırma, {coalescing['coalesced']} istek paylaşılan sonucu aldı")
+    print("\n=== Çağrı sayıları ===")
+    for kind, count in report["calls"].items():
+        print(f"{kind:<28}{count:>8}")
+    print("\n=== Prompt boyutu (token) ===")
+    for kind, stats in report["prompt_tokens"].items():
+        print(f"{kind:<20} adet={stats['count']:<5} ort={stats['mean']:<9} p95={stats['p95']:<9} max={stats['max']}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="agentic-benchmark-")
+    # Uygulama modülleri bu süreçte import edilmeden önce, temiz süreçlerde ölçülür
+    cold_start = measure_import_time(args.import_budget, args.import_repeat)
+    configure_environment(args, workdir)
+
+    from benchmarks.fakes import FakeLatency, install_fakes, make_tavily_tool, make_wikipedia_tool, recorder
+    from benchmarks.corpus import build_corpus
+    latency = FakeLatency(
+        llm_seconds=args.llm_latency, llm_seconds_per_1k_prompt_tokens=args.llm_latency_per_1k,
+        embed_seconds=args.embed_latency, wikipedia_seconds=args.wikipedia_latency, tavily_seconds=args.tavily_latency,
+    )
+    gateway = install_fakes(latency)
+
+    # Uygulama modülleri sahte istemciler kurulduktan sonra import edilir
+    import utils
+    import agents
+    from graph import create_agent_graph
+    from tool_cache import with_tool_cache
+
+    agents.wikipedia_langchain_tool = with_tool_cache(make_wikipedia_tool(latency, args.wikipedia_miss_rate))
+    agents.tavily_langchain_tool = with_tool_cache(make_tavily_tool(latency))
+    timer = StageTimer()
+    time_function(agents, "pack_context", timer, "context_packing")
+
+    pdf_folder = os.path.join(workdir, "data")
+    persist_directory = os.path.join(workdir, "chroma_data")
+    documents, pages, total_bytes = build_corpus(pdf_folder, args.documents, args.pages)
+    started = time.perf_counter()
+    vector_store = utils.create_or_load_vector_store(persist_directory, pdf_folder)
+    ingest_seconds = time.perf_counter() - started
+    if vector_store is None:
+        raise SystemExit("Benchmark: vektör deposu oluşturulamadı.")
+    chunks = len(vector_store.get(include=[])["ids"])
+    ingest = {
+        "documents": documents, "pages": pages, "chunks": chunks, "bytes": total_bytes,
+        "seconds": round(ingest_seconds, 3),
+        "pages_per_second": pages / ingest_seconds, "chunks_per_second": chunks / ingest_seconds,
+        "mb_per_second": total_bytes / 1e6 / ingest_seconds,
+        "embed_calls": recorder.counts.get("embed:documents", 0), "embedded_texts": recorder.counts.get("embed:texts", 0),
+    }
+
+    retriever = utils.get_retriever(vector_store, persist_directory)
+    rag_chain = agents.create_rag_chain(retriever)
+    graph = create_agent_graph(retriever, rag_chain)
+    if args.coalesce:
+        from request_coalescing import CoalescingAgentGraph
+        graph = CoalescingAgentGraph(graph)
+
+    recorder.reset()
+    gateway.stats = {key: 0 if isinstance(value, int) else 0.0 for key, value in gateway.stats.items()}
+    questions = load_questions(args.questions)
+    results, wall_seconds = asyncio.run(run_questions(graph, questions, args, timer))
+
+    report = build_report(args, ingest, results, wall_seconds, timer, recorder, dict(gateway.stats), cold_start)
+    if args.coalesce:
+        report["coalescing"] = dict(graph.stats)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nRapor yazıldı: {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
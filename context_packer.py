@@ -0,0 +1,169 @@
+# context_packer.py
+import os
+import re
+import logging
+from langchain_core.documents import Document
+from llm_gateway import count_tokens, truncate_to_tokens
+from text_utils import fold_turkish
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Ayarlar ---
+# RAG prompt'una konacak bağlam parçalarının toplam token bütçesi
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "6000"))
+# Son parça sığmıyorsa en az bu kadar token'lık yer kaldıysa kısmen eklenir
+MIN_PARTIAL_TOKENS = int(os.getenv("MIN_PARTIAL_TOKENS", "80"))
+# Aynı sayfadaki iki parçanın birleştirilmesi için gereken en kısa örtüşme (karakter)
+MIN_OVERLAP_CHARS = 20
+# Kelime 3-gram'larının bu oranı daha önce seçilmiş bir parçada geçiyorsa parça tekrar sayılır
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85"))
+# Her parça create_stuff_documents_chain'de "\n\n" ile birleştirilir
+DOCUMENT_SEPARATOR_TOKENS = 2
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _score(doc, position):
+    """Relevance skoru yoksa retriever sırası korunur."""
+    score = doc.metadata.get("relevance_score")
+    return score if score is not None else -position
+
+
+def _overlap(left, right):
+    """left'in sonu ile right'ın başı arasındaki en uzun ortak kısmın uzunluğu."""
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge_text(first, second):
+    """İki parçayı örtüşme üzerinden birleştirir; biri diğerini içeriyorsa büyüğünü döndürür. Olmuyorsa None."""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    size = _overlap(first, second)
+    if size:
+        return first + second[size:]
+    size = _overlap(second, first)
+    if size:
+        return second + first[size:]
+    return None
+
+
+def merge_page_chunks(scored_docs):
+    """
+    Aynı PDF sayfasındaki bitişik/örtüşen parçaları (CHUNK_OVERLAP kaynaklı) tek parçada birleştirir.
+    scored_docs: [(skor, doc)]; birleşen parçanın skoru en yükseği olur.
+    """
+    merged = []
+    by_page = {}
+    for score, doc in scored_docs:
+        page_key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        candidates = by_page.setdefault(page_key, [])
+        text = doc.page_content
+        for item in candidates:
+            combined = _merge_text(item["text"], text)
+            if combined is not None:
+                item["text"] = combined
+                item["score"] = max(item["score"], score)
+                item["parts"] += 1
+                break
+        else:
+            item = {"text": text, "score": score, "metadata": doc.metadata, "parts": 1}
+            candidates.append(item)
+            merged.append(item)
+    # Bir birleşme sonrası aynı sayfadaki iki grup artık örtüşüyor olabilir
+    changed = True
+    while changed:
+        changed = False
+        for candidates in by_page.values():
+            for i in range(len(candidates)):
+                for j in range(i + 1, len(candidates)):
+                    combined = _merge_text(candidates[i]["text"], candidates[j]["text"])
+                    if combined is None:
+                        continue
+                    candidates[i]["text"] = combined
+                    candidates[i]["score"] = max(candidates[i]["score"], candidates[j]["score"])
+                    candidates[i]["parts"] += candidates[j]["parts"]
+                    absorbed = candidates.pop(j)
+                    merged[:] = [item for item in merged if item is not absorbed]
+                    changed = True
+                    break
+                if changed:
+                    break
+    return merged
+
+
+def _shingles(text):
+    words = _WORD_RE.findall(fold_turkish(text))
+    if len(words) < 3:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def drop_near_duplicates(items):
+    """Skora göre sıralı listede, içeriği daha yüksek skorlu bir parçada zaten bulunan parçaları atar."""
+    kept = []
+    kept_shingles = []
+    for item in items:
+        shingles = _shingles(item["text"])
+        duplicate = any(len(shingles & other) / len(shingles) >= NEAR_DUPLICATE_THRESHOLD for other in kept_shingles)
+        if not duplicate:
+            kept.append(item)
+            kept_shingles.append(shingles)
+    return kept
+
+
+def _truncate(text, max_tokens):
+    """Metni token sınırına göre keser; mümkünse cümle ya da kelime sınırında bitirir."""
+    part = truncate_to_tokens(text, max_tokens - 1)  # " …" için yer bırak
+    boundary = max(part.rfind(". "), part.rfind("\n"))
+    if boundary < len(part) // 2:
+        boundary = part.rfind(" ")
+    if boundary > 0:
+        part = part[:boundary + 1]
+    return part.rstrip() + " …"
+
+
+def pack_context(docs, token_budget=RAG_CONTEXT_TOKEN_BUDGET):
+    """
+    Retriever sonuçlarını LLM bağlamına hazırlar: aynı sayfadaki örtüşen parçaları birleştirir,
+    neredeyse aynı parçaları atar, relevance skoruna göre sıralar ve token bütçesini doldurur.
+    Sığmayan son parça, yeterli yer kaldıysa kısmen eklenir. (packed_docs, istatistik) döndürür.
+    """
+    scored = [(_score(doc, i), doc) for i, doc in enumerate(docs)]
+    items = merge_page_chunks(scored)
+    items.sort(key=lambda item: item["score"], reverse=True)
+    unique = drop_near_duplicates(items)
+
+    packed = []
+    used = 0
+    partial = False
+    for item in unique:
+        tokens = count_tokens(item["text"]) + DOCUMENT_SEPARATOR_TOKENS
+        remaining = token_budget - used
+        if tokens <= remaining:
+            packed.append(Document(page_content=item["text"], metadata=item["metadata"]))
+            used += tokens
+            continue
+        if remaining - DOCUMENT_SEPARATOR_TOKENS >= MIN_PARTIAL_TOKENS:
+            text = _truncate(item["text"], remaining - DOCUMENT_SEPARATOR_TOKENS)
+            packed.append(Document(page_content=text, metadata={**item["metadata"], "truncated": True}))
+            used += count_tokens(text) + DOCUMENT_SEPARATOR_TOKENS
+            partial = True
+        break
+
+    stats = {
+        "input_chunks": len(docs),
+        "merged": len(docs) - len(items),
+        "near_duplicates": len(items) - len(unique),
+        "packed": len(packed),
+        "dropped": len(unique) - len(packed),
+        "partial": partial,
+        "tokens": used,
+        "budget": token_budget,
+    }
+    logging.info(f"Bağlam paketlendi: {stats}")
+    return packed, stats
@@ -0,0 +1,252 @@
+# conversation.py
+"""
+Oturum bazlı konuşma durumu: sınırlı mesaj geçmişi (eski mesajlar boyut sınırlı bir özete sıkıştırılır),
+önceki turun route'u ve getirilen parça kimlikleri. Önceki konuyu açıkça sürdüren kısa sorular (takip soruları)
+yeniden yönlendirilmez; Resmi Gazete takip sorularında önceki turun belge seti tekrar kullanılır.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from langchain_core.documents import Document
+from text_utils import normalize_question
+from lexical_index import tokenize
+from fast_router import fast_route
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Ayarlar ---
+# Geçmişte aynen tutulan en fazla mesaj sayısı (kullanıcı + asistan); daha eskileri özete sıkıştırılır
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "8"))
+CONVERSATION_MESSAGE_MAX_CHARS = int(os.getenv("CONVERSATION_MESSAGE_MAX_CHARS", "1500"))
+CONVERSATION_SUMMARY_MAX_CHARS = int(os.getenv("CONVERSATION_SUMMARY_MAX_CHARS", "1500"))
+# Özete eklenen her eski mesajdan alınan en fazla karakter
+SUMMARY_LINE_CHARS = 200
+# Bundan uzun sorular kendi başına anlamlı sayılır, takip sorusu olarak ele alınmaz (kelime)
+FOLLOW_UP_MAX_WORDS = int(os.getenv("FOLLOW_UP_MAX_WORDS", "12"))
+# Takip sorusunda yönlendirmesi atlanabilecek route'lar
+FOLLOW_UP_ROUTES = ("gazette_agent", "news_agent")
+# Normalize edilmiş soru bu kelimelerle başlıyorsa önceki konunun devamıdır
+FOLLOW_UP_PREFIXES = ("peki", "ya ", "ayrica", "bir de", "o zaman", "ee ", "hani", "madem", "oyleyse", "bu durumda")
+# Önceki konuya gönderme yapan ifadeler (normalize edilmiş metinde kelime başı olarak aranır)
+FOLLOW_UP_REFERENCES = re.compile(
+    r"\b(bunun|bunlarin|buna|bunu|bunda|bundan|bununla|onun|ona|onu|onda|ondan|bu (kanun|yasa|yonetmelik|karar|teblig|ilan|madde|destek|ihale|konu|kisi)"
+    r"|ayni (kanun|yasa|yonetmelik|karar|teblig|ilan|konu)|soz konusu|bahsedilen|bahsettigin|yukaridaki|az once)\b")
+_NUMBER_RE = re.compile(r"\d+")
+# Takip sorusunun içerik terimlerinin en az bu oranı önceki belge setinde geçmiyorsa set tekrar kullanılmaz
+FOLLOW_UP_MIN_TERM_COVERAGE = float(os.getenv("FOLLOW_UP_MIN_TERM_COVERAGE", "0.5"))
+# Kapsam hesabında sayılmayan devam, gönderme ve soru kelimeleri
+_FOLLOW_UP_FILLER_TERMS = frozenset(tokenize(
+    " ".join(FOLLOW_UP_PREFIXES) + " bunun bunlarin buna bunu bunda bundan bununla onun ona onu onda ondan"
+    " soz konusu bahsedilen bahsettigin yukaridaki az once ayni kadar nasil neden niye kim zaman nerede hakkinda"))
+# Süreç içinde tutulan son retrieval setleri (parça kimlikleri -> belgeler)
+RETRIEVAL_SET_CACHE_SIZE = int(os.getenv("RETRIEVAL_SET_CACHE_SIZE", "256"))
+# API sunucusunda tutulan oturum sayısı ve oturumun hareketsiz kalabileceği süre (saniye)
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "10000"))
+CONVERSATION_SESSION_TTL = int(os.getenv("CONVERSATION_SESSION_TTL", "3600"))
+
+# Konuşma durumunun graf state'inde taşınan alanları
+CONVERSATION_FIELDS = ("history", "summary", "last_route", "last_chunk_ids")
+
+
+# --- Geçmiş ---
+def new_conversation():
+    return {"history": [], "summary": "", "last_route": None, "last_chunk_ids": []}
+
+
+def conversation_state(conversation):
+    """Grafın başlangıç state'ine eklenecek konuşma alanları."""
+    conversation = conversation or new_conversation()
+    return {field: conversation.get(field) for field in CONVERSATION_FIELDS}
+
+
+def _truncate(text, limit):
+    text = text or ""
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _compact(history, summary):
+    """Sınırı aşan en eski mesajları kısaltılmış satırlar olarak özete taşır; özet en yeni kısmı korunarak kırpılır."""
+    history = list(history)
+    lines = [summary] if summary else []
+    while len(history) > CONVERSATION_MAX_MESSAGES:
+        message = history.pop(0)
+        speaker = "Kullanıcı" if message["role"] == "user" else "Asistan"
+        lines.append(f"{speaker}: {_truncate(message['content'], SUMMARY_LINE_CHARS)}")
+    summary = "\n".join(lines)
+    if len(summary) > CONVERSATION_SUMMARY_MAX_CHARS:
+        summary = summary[-CONVERSATION_SUMMARY_MAX_CHARS:].split("\n", 1)[-1]
+    return history, summary
+
+
+def _user_message(question, topic=None):
+    message = {"role": "user", "content": _truncate(question, CONVERSATION_MESSAGE_MAX_CHARS)}
+    if topic:
+        # Art arda takip sorularında ilk konunun kaybolmaması için konuyu açan soru da saklanır
+        message["topic"] = topic
+    return message
+
+
+def advance_conversation(conversation, question, final_state):
+    """Tamamlanan turu konuşmaya ekler ve sonraki tur için route ve parça kimliklerini günceller."""
+    conversation = conversation or new_conversation()
+    topic = previous_question(conversation) if final_state.get("follow_up") else None
+    history = list(conversation.get("history") or []) + [
+        _user_message(question, topic),
+        {"role": "assistant", "content": _truncate(final_state.get("answer"), CONVERSATION_MESSAGE_MAX_CHARS)},
+    ]
+    history, summary = _compact(history, conversation.get("summary") or "")
+    route = final_state.get("route")
+    # Önbellekten gelen cevapta parça kimlikleri yoktur; takip sorusu o durumda yeniden retrieval yapar
+    chunk_ids = list(final_state.get("chunk_ids") or []) if route == "gazette_agent" else []
+    return {"history": history, "summary": summary, "last_route": route, "last_chunk_ids": chunk_ids}
+
+
+def previous_question(state):
+    """Geçmişteki son kullanıcı sorusu; takip sorusuysa konuyu açan soru."""
+    for message in reversed(state.get("history") or []):
+        if message.get("role") == "user":
+            return message.get("topic") or message.get("content")
+    return None
+
+
+# --- Takip sorusu tespiti ---
+def is_follow_up(state):
+    """
+    Soru önceki turun konusunu açıkça sürdürüyor mu? Kısa olmalı, devam/gönderme ifadesi içermeli,
+    önceki soruda olmayan yeni bir sayı (kanun no, tarih) içermemeli ve hızlı yönlendirici onu başka
+    bir kategoriye açıkça atamamalı.
+    """
+    last_route = state.get("last_route")
+    previous = previous_question(state)
+    question = normalize_question(state.get("question", ""))
+    if last_route not in FOLLOW_UP_ROUTES or not previous or not question:
+        return False
+    if len(question.split()) > FOLLOW_UP_MAX_WORDS:
+        return False
+    previous_numbers = set(_NUMBER_RE.findall(normalize_question(previous)))
+    if any(number not in previous_numbers for number in _NUMBER_RE.findall(question)):
+        return False
+    if not (question.startswith(FOLLOW_UP_PREFIXES) or FOLLOW_UP_REFERENCES.search(question)):
+        return False
+    decision, _ = fast_route(state.get("question", ""))
+    return decision in (None, last_route)
+
+
+def contextualize_question(state):
+    """Takip sorusunu önceki soruyla birlikte kendi başına anlaşılır hale getirir (arama ve cevap üretimi için)."""
+    previous = previous_question(state)
+    question = state.get("question", "")
+    if not previous:
+        return question
+    return f"{question} (Önceki soru: {_truncate(previous, SUMMARY_LINE_CHARS)})"
+
+
+# --- Retrieval seti tekrar kullanımı ---
+_retrieval_sets = OrderedDict()
+_retrieval_sets_lock = threading.Lock()
+
+
+def _chunk_id(doc):
+    return doc.metadata.get("chunk_id") or getattr(doc, "id", None)
+
+
+def chunk_ids_of(documents):
+    return [chunk_id for chunk_id in map(_chunk_id, documents) if chunk_id]
+
+
+def remember_retrieval_set(documents):
+    """Getirilen belgeleri parça kimlikleriyle saklar ve kimlik listesini döndürür."""
+    chunk_ids = chunk_ids_of(documents)
+    if chunk_ids:
+        with _retrieval_sets_lock:
+            _retrieval_sets[tuple(chunk_ids)] = list(documents)
+            _retrieval_sets.move_to_end(tuple(chunk_ids))
+            while len(_retrieval_sets) > RETRIEVAL_SET_CACHE_SIZE:
+                _retrieval_sets.popitem(last=False)
+    return chunk_ids
+
+
+def _retriever_store(retriever):
+    """FusionRetriever'ın vector_store'u veya MultiQueryRetriever'ın alttaki vektör deposu."""
+    store = getattr(retriever, "vector_store", None)
+    if store is None:
+        store = getattr(getattr(retriever, "retriever", None), "vectorstore", None)
+    return store
+
+
+def load_retrieval_set(retriever, chunk_ids):
+    """
+    Önceki turun belge setini döndürür: önce süreç içi önbellekten, yoksa (ör. farklı işçi süreci)
+    parça kimlikleriyle vektör deposundan (embedding çağrısı yapılmadan). Bulunamazsa boş liste.
+    """
+    key = tuple(chunk_ids or [])
+    if not key:
+        return []
+    with _retrieval_sets_lock:
+        documents = _retrieval_sets.get(key)
+        if documents is not None:
+            _retrieval_sets.move_to_end(key)
+            return list(documents)
+    store = _retriever_store(retriever)
+    if store is None:
+        return []
+    result = store.get(ids=list(key), include=["documents", "metadatas"])
+    by_id = {chunk_id: Document(page_content=text or "", metadata=metadata or {})
+             for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])}
+    # Önceki sıralama korunur (relevance skoru yoksa context packer sırayı kullanır)
+    documents = [by_id[chunk_id] for chunk_id in key if chunk_id in by_id]
+    if documents:
+        remember_retrieval_set(documents)
+    return documents
+
+
+def retrieval_set_coverage(documents, question):
+    """
+    Takip sorusunun içerik terimlerinden (devam/gönderme kelimeleri hariç) önceki belge setinde geçenlerin oranı.
+    Soruda içerik terimi yoksa 1.0 döner.
+    """
+    terms = set(tokenize(question or "")) - _FOLLOW_UP_FILLER_TERMS
+    if not terms:
+        return 1.0
+    document_terms = set()
+    for document in documents:
+        document_terms.update(tokenize(document.page_content))
+    return len(terms & document_terms) / len(terms)
+
+
+# --- API oturumları ---
+class ConversationStore:
+    """Oturum kimliği -> konuşma durumu; LRU ile sınırlı, hareketsiz oturumlar TTL sonunda düşer."""
+
+    def __init__(self, max_sessions=CONVERSATION_MAX_SESSIONS, ttl=CONVERSATION_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return new_conversation()
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._sessions[session_id]
+                return new_conversation()
+            return entry[1]
+
+    def put(self, session_id, conversation):
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic(), conversation)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def reset(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,137 @@
+# embedding_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from array import array
+from langchain_core.embeddings import Embeddings
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Ayarlar ---
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite")
+# Önbellekte tutulacak en fazla vektör sayısı (aşılınca en eski kullanılanlar silinir)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+# Tek bir toplu embed isteğinde gönderilecek en fazla metin sayısı
+EMBEDDING_BATCH_SIZE = 100
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embedding modelini diskte kalıcı, içerik adresli bir önbellekle sarar.
+    Anahtar: (model adı, sorgu/belge türü, metnin SHA-256'sı). Sadece önbellekte
+    bulunmayan metinler toplu halde modele gönderilir; eviction LRU'dur.
+    """
+
+    def __init__(self, underlying, model_name, path=EMBEDDING_CACHE_PATH,
+                 max_entries=EMBEDDING_CACHE_MAX_ENTRIES, batch_size=EMBEDDING_BATCH_SIZE):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, kind TEXT NOT NULL, text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, kind, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+
+    # --- Önbellek işlemleri ---
+    def _get_many(self, kind, hashes):
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # SQLite parametre limitini aşmamak için parça parça sorgula
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND kind = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, kind, *part],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND kind = ? AND text_hash = ?",
+                    [(now, self.model_name, kind, h) for h in found],
+                )
+        return found
+
+    def _put_many(self, kind, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, kind, text_hash, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(self.model_name, kind, h, array("f", vector).tobytes(), now) for h, vector in items],
+            )
+            self._evict_if_needed()
+
+    def _evict_if_needed(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Her seferinde tek tek silmemek için sınırın %10 altına in
+        to_delete = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (to_delete,),
+        )
+        logging.info(f"Embedding önbelleğinden {to_delete} eski kayıt silindi (LRU).")
+
+    def _embed_with_cache(self, kind, texts, embed_batch):
+        hashes = [_text_hash(text) for text in texts]
+        cached = self._get_many(kind, hashes)
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in cached and text_hash not in missing:
+                missing[text_hash] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            miss_hashes = list(missing)
+            for start in range(0, len(miss_hashes), self.batch_size):
+                part = miss_hashes[start:start + self.batch_size]
+                # Önbellekten gelenlerle aynı olsun diye float32'ye yuvarla
+                vectors = [array("f", vector).tolist() for vector in embed_batch([missing[h] for h in part])]
+                new_items = list(zip(part, vectors))
+                self._put_many(kind, new_items)
+                cached.update(new_items)
+            logging.info(f"Embedding önbelleği: {len(texts) - len(missing)} isabet, {len(missing)} yeni metin embed edildi.")
+        return [list(cached[h]) for h in hashes]
+
+    # --- Embeddings arayüzü ---
+    def embed_documents(self, texts):
+        return self._embed_with_cache("document", list(texts), self.underlying.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed_with_cache("query", [text], self._embed_query_batch)[0]
+
+    def embed_queries(self, texts):
+        """Birden fazla sorguyu (sorgu tipinde) tek toplu istekle embed eder."""
+        return self._embed_with_cache("query", list(texts), self._embed_query_batch)
+
+    def _embed_query_batch(self, batch):
+        if len(batch) == 1:
+            return [self.underlying.embed_query(batch[0])]
+        try:
+            return self.underlying.embed_documents(batch, task_type="retrieval_query")
+        except TypeError:
+            # task_type desteklemeyen embedding sınıfları için tek tek sorgu embed'i
+            return [self.underlying.embed_query(text) for text in batch]
@@ -0,0 +1,100 @@
+# fast_router.py
+import re
+from text_utils import normalize_question
+
+# --- Anahtar Kelime Tabanlı Ön Sınıflandırıcı ---
+# supervisor.routing_prompt_template'teki kategori tanımlarından türetilmiştir.
+# Desenler normalize edilmiş (küçük harf, ASCII'ye indirgenmiş) metin üzerinde,
+# kelime başından itibaren eşleşir; böylece Türkçe ekler ("yönetmeliği", "ihalesi") de yakalanır.
+# Ağırlıklar: 3 = kategoriyi tek başına belirler, 2 = güçlü işaret, 1 = zayıf işaret.
+ROUTE_KEYWORDS = {
+    "gazette_agent": [
+        (r"resmi gazete", 3),
+        (r"\d+ sayili", 3),
+        (r"torba (yasa|kanun)", 3),
+        (r"cumhurbaskani karar", 3),
+        (r"bakanlik karar", 2),
+        (r"yonetmeli", 2),
+        (r"kanun", 2),
+        (r"teblig", 2),
+        (r"kararname", 2),
+        (r"genelge", 2),
+        (r"mevzuat", 2),
+        (r"yururlu", 2),
+        (r"ihale", 2),
+        (r"kadro", 2),
+        (r"alim ilan", 2),
+        (r"ogretim uyesi", 2),
+        # Sadece "yasa"nın çekimleri; ASCII'de aynı görünen "yaşam", "yaşadım", "yaşanan", "yaşasın" eşleşmez
+        (r"yasa(?:si(?:n(?:in|a|da|dan|i))?|ya|da(?:ki)?|dan|nin|l\w*)?\b", 1),
+        (r"ilan", 1),
+        (r"destek", 1),
+        (r"yardim", 1),
+        (r"tesvik", 1),
+        (r"hibe", 1),
+        (r"sartlar", 1),
+        (r"kosullar", 1),
+        (r"basvuru", 1),
+        (r"yayinlandi mi", 1),
+        (r"madde \d+|\d+\. madde|madde", 1),
+        (r"fikra", 1),
+        (r"duyuru", 1),
+    ],
+    "news_agent": [
+        (r"enflasyon oran", 3),
+        (r"baskenti", 3),
+        (r"baskani kim", 3),
+        (r"son dakika", 3),
+        (r"hava durumu", 3),
+        (r"borsa", 2),
+        (r"biyografi", 2),
+        (r"kimdir", 2),
+        (r"haberler", 2),
+        (r"son durum", 2),
+        (r"nedir", 1),
+        (r"nerede", 1),
+        (r"ne zaman", 1),
+        (r"tanimi", 1),
+        (r"acikla", 1),
+    ],
+}
+
+# Doğrudan yönlendirme için gereken en düşük puan ve güven (baskın kategorinin toplam puandaki payı)
+FAST_ROUTE_MIN_SCORE = 2
+FAST_ROUTE_MIN_CONFIDENCE = 0.75
+
+
+def _compile(keywords):
+    pattern = "|".join(f"(?P<k{i}>\\b(?:{kw}))" for i, (kw, _) in enumerate(keywords))
+    weights = {f"k{i}": weight for i, (_, weight) in enumerate(keywords)}
+    return re.compile(pattern), weights
+
+
+_MATCHERS = {route: _compile(keywords) for route, keywords in ROUTE_KEYWORDS.items()}
+
+
+def score_question(question):
+    """Her kategori için eşleşen anahtar kelimelerin ağırlık toplamını döndürür."""
+    text = normalize_question(question)
+    scores = {}
+    for route, (matcher, weights) in _MATCHERS.items():
+        # Aynı anahtar kelimenin tekrarı puanı şişirmesin
+        matched = {m.lastgroup for m in matcher.finditer(text)}
+        scores[route] = sum(weights[name] for name in matched)
+    return scores
+
+
+def fast_route(question):
+    """
+    Soruyu LLM çağırmadan sınıflandırmayı dener.
+    (route, confidence) döner; karar verilemezse route None olur ve soru LLM'e bırakılır.
+    """
+    scores = score_question(question)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (top_route, top_score), (_, second_score) = ranked[0], ranked[1]
+    if top_score == 0:
+        return None, 0.0
+    confidence = top_score / (top_score + second_score)
+    if top_score >= FAST_ROUTE_MIN_SCORE and confidence >= FAST_ROUTE_MIN_CONFIDENCE:
+        return top_route, confidence
+    return None, confidence
@@ -1,33 +1,110 @@
 # graph.py
-from typing import TypedDict, Sequence, Optional
+import logging
+from typing import TypedDict, Sequence, Optional, Any
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableLambda
 
 # Agent fonksiyonlarını import et
-from agents import run_gazette_agent, run_news_agent, run_fallback_agent
+from agents import (run_gazette_agent, run_news_agent, run_fallback_agent,
+                    arun_gazette_agent, arun_news_agent, arun_fallback_agent, FINAL_ANSWER_TAG)
+from async_utils import iterate_sync
+from answer_format import HeaderStripper
+import tracing
+from conversation import is_follow_up, contextualize_question
 # Supervisor (router) fonksiyonunu import et
-from supervisor import route_question 
+from supervisor import route_question, aroute_question
 
 # --- Grafiğin Durum (State) Tanımı ---
 class AgentState(TypedDict):
     question: str
     answer: Optional[str]
     source: Optional[str]
+    route: Optional[str]  # Cevabı üreten agent node'u (önbellek TTL'leri vb. için)
+    trace: Optional[Any]  # tracing.Trace; TRACE_REQUESTS açıksa veya çağıran verirse istek boyunca span'lar toplanır
+    # Konuşma durumu (conversation.py): sınırlı geçmiş, sıkıştırılmış özet, önceki turun route'u ve parça kimlikleri
+    history: Optional[list]
+    summary: Optional[str]
+    last_route: Optional[str]
+    last_chunk_ids: Optional[list]
+    follow_up: Optional[bool]  # Soru önceki konuyu sürdürüyor; yönlendirme atlanır
+    standalone_question: Optional[str]  # Takip sorusunun önceki soruyla birleştirilmiş hali
+    chunk_ids: Optional[list]  # Bu turda Resmi Gazete Agent'ının kullandığı belge seti
 
 # --- Yönlendirici Node Fonksiyonu ---
 # Bu fonksiyon, "router" adlı node çalıştığında çağrılır.
 # Asıl yönlendirme işini yapmaz, sadece bir geçiş noktasıdır.
 # State'i değiştirmesi gerekmiyorsa boş bir dict döndürebilir.
 def router_node_placeholder(state: AgentState) -> dict:
-    """Yönlendirme kararından hemen önce çalışan node. State'i değiştirmez."""
+    """Yönlendirme kararından hemen önce çalışan node. Sorunun takip sorusu olup olmadığını işaretler."""
     print("--- Router Node Çalıştırıldı (Yönlendirme Kararı Öncesi) ---")
-    # Bu node'un kendisi state'i değiştirmiyor, karar conditional_edge'de veriliyor.
-    # LangGraph bir dict beklediği için boş bir dict döndürüyoruz.
-    return {}
+    # Karar conditional_edge'de verilir; bu node sadece takip sorusu bayrağını ve
+    # (istek için trace açıksa ve çağıran vermediyse) yeni bir Trace'i state'e ekler.
+    follow_up = is_follow_up(state)
+    updates = {"follow_up": follow_up, "standalone_question": contextualize_question(state) if follow_up else None}
+    if state.get("trace") is None:
+        trace = tracing.new_trace_if_enabled()
+        if trace is not None:
+            updates["trace"] = trace
+    return updates
+
+def _finish_node_span(name, node_span, result):
+    source = result.get("source")
+    node_span.set(source=source)
+    if "Hata" in (source or ""):
+        node_span.outcome = "failed"
+    tracing.metrics.inc("answers_total", 1, (("route", name), ("source", source)))
+
+def _agent_node(name, func, afunc):
+    """Agent fonksiyonunu, sonucuna hangi node'dan geldiğini ("route") ekleyerek ve span ile ölçerek graf node'una çevirir."""
+    def run(state):
+        with tracing.use_trace(state.get("trace")), tracing.span(f"node:{name}") as node_span:
+            result = func(state)
+            _finish_node_span(name, node_span, result)
+        return {**result, "route": name}
+    async def arun(state):
+        with tracing.use_trace(state.get("trace")), tracing.span(f"node:{name}") as node_span:
+            result = await afunc(state)
+            _finish_node_span(name, node_span, result)
+        return {**result, "route": name}
+    return RunnableLambda(run, afunc=arun, name=name)
+
+def _follow_up_route(state, route_span):
+    """Takip sorusu önceki turun agent'ına gider; yönlendirici (LLM/semantik) çağrılmaz."""
+    route = state["last_route"]
+    logging.info(f"Takip sorusu, yönlendirme atlandı: {route}")
+    route_span.set(route=route, tier="followup")
+    tracing.metrics.inc("follow_up_questions_total", 1, (("route", route),))
+    return route
+
+def _traced_route(state):
+    with tracing.use_trace(state.get("trace")), tracing.span("node:router") as route_span:
+        if state.get("follow_up"):
+            return _follow_up_route(state, route_span)
+        route = route_question(state)
+        route_span.set(route=route)
+    return route
+
+async def _atraced_route(state):
+    with tracing.use_trace(state.get("trace")), tracing.span("node:router") as route_span:
+        if state.get("follow_up"):
+            return _follow_up_route(state, route_span)
+        route = await aroute_question(state)
+        route_span.set(route=route)
+    return route
+
+def _with_context(state):
+    """Takip sorularında agent'lar soruyu önceki soruyla birlikte görür (arama ve cevap üretimi için)."""
+    if state.get("follow_up") and state.get("standalone_question"):
+        return {**state, "question": state["standalone_question"], "follow_up_question": state["question"]}
+    return state
 
 # --- LangGraph İş Akışı ---
 def create_agent_graph(retriever, rag_chain):
-    """LangGraph iş akışını tanımlar ve derler."""
+    """
+    LangGraph iş akışını tanımlar ve derler.
+    Her node'un hem senkron hem async hali vardır; graf invoke/stream veya ainvoke/astream ile sürülebilir.
+    """
 
     if not retriever:
         print("Uyarı: Retriever nesnesi olmadan graf oluşturuluyor. Resmi Gazete Agent çalışmayabilir.")
@@ -42,16 +119,20 @@ def create_agent_graph(retriever, rag_chain):
 
     # Gazette agent nodu: state'i alır VE dışarıdan gelen retriever/rag_chain'i kullanır
     def gazette_node_wrapper(state):
-        input_dict = {**state, "retriever": retriever, "rag_chain": rag_chain}
-        # run_gazette_agent bir dict döndürmeli (answer, source içeren)
+        input_dict = {**_with_context(state), "retriever": retriever, "rag_chain": rag_chain}
+        # run_gazette_agent bir dict döndürmeli (answer, source, varsa chunk_ids içeren)
         return run_gazette_agent(input_dict)
-    workflow.add_node("gazette_agent", gazette_node_wrapper)
+    async def agazette_node_wrapper(state):
+        input_dict = {**_with_context(state), "retriever": retriever, "rag_chain": rag_chain}
+        return await arun_gazette_agent(input_dict)
+    workflow.add_node("gazette_agent", _agent_node("gazette_agent", gazette_node_wrapper, agazette_node_wrapper))
 
     # News agent nodu state'i alır ve bir dict döndürmeli
-    workflow.add_node("news_agent", run_news_agent)
+    workflow.add_node("news_agent", _agent_node("news_agent", lambda state: run_news_agent(_with_context(state)),
+                                                lambda state: arun_news_agent(_with_context(state))))
 
     # Fallback agent nodu state'i alır ve bir dict döndürmeli
-    workflow.add_node("fallback_agent", run_fallback_agent)
+    workflow.add_node("fallback_agent", _agent_node("fallback_agent", run_fallback_agent, arun_fallback_agent))
 
 
     # Başlangıç noktasını belirle
@@ -62,7 +143,7 @@ def create_agent_graph(retriever, rag_chain):
     # route_question'ın döndürdüğü string'e göre ilgili agent node'una git.
     workflow.add_conditional_edges(
         "router",          # Hangi node'dan sonra karar verilecek: "router"
-        route_question,   # Kararı hangi fonksiyon verecek (state'i alır, string döndürür)
+        RunnableLambda(_traced_route, afunc=_atraced_route, name="route_question"),   # Kararı hangi fonksiyon verecek (state'i alır, string döndürür)
         {                 # Dönen string'e göre hangi node'a gidilecek eşleşmesi
             "gazette_agent": "gazette_agent",
             "news_agent": "news_agent",
@@ -78,4 +159,73 @@ def create_agent_graph(retriever, rag_chain):
     # Grafiği derle
     agent_graph = workflow.compile()
     print("LangGraph başarıyla derlendi.")
-    return agent_graph
\ No newline at end of file
+    return agent_graph
+
+
+def build_agent_graph(use_answer_cache=True):
+    """
+    Vektör deposu, retriever, RAG zinciri ve grafı bir kez kurar (app.py'deki başlangıç adımlarıyla aynı).
+    Arayüzsüz giriş noktaları (API sunucusu, toplu cevaplama CLI'ı) içindir.
+    """
+    from utils import create_or_load_vector_store, get_retriever
+    from agents import create_rag_chain
+    from answer_cache import with_answer_cache
+    from request_coalescing import with_request_coalescing
+    vector_store = create_or_load_vector_store()
+    if vector_store is None:
+        raise RuntimeError("Vektör veritabanı oluşturulamadı veya yüklenemedi. 'data' klasörünü ve PDF dosyalarını kontrol edin.")
+    retriever = get_retriever(vector_store)
+    if retriever is None:
+        raise RuntimeError("Retriever oluşturulamadı.")
+    rag_chain = create_rag_chain(retriever)
+    if rag_chain is None:
+        logging.warning("RAG zinciri oluşturulamadığı için Resmi Gazete Agent'ı düzgün çalışmayabilir.")
+    agent_graph = create_agent_graph(retriever, rag_chain)
+    if use_answer_cache:
+        agent_graph = with_answer_cache(agent_graph)
+    # Aynı anda gelen aynı sorular tek çalıştırmayı paylaşır (önbellek ıskaları da dahil)
+    return with_request_coalescing(agent_graph)
+
+
+# --- Cevap Akışı (Streaming) ---
+async def astream_answer(agent_graph, initial_state):
+    """
+    Grafı çalıştırırken cevabı üreten LLM'in token'larını akıtır. Üretilen olaylar:
+    ("token", metin) - yeni token, ("reset", None) - önceki taslak cevap atıldı
+    (ör. Wikipedia cevabı yetersiz bulunup Tavily'ye geçildi), ("final", state) - son durum.
+    """
+    if hasattr(agent_graph, "astream_answer"):
+        # Önbellek gibi sarmalayıcılar kendi akışlarını sağlar
+        async for item in agent_graph.astream_answer(initial_state):
+            yield item
+        return
+    final_state = None
+    # Cevap LLM'leri ilk satıra yapılandırılmış başlık yazar (answer_format); başlık kullanıcıya gösterilmez
+    strippers = {}
+    async for event in agent_graph.astream_events(initial_state, version="v2"):
+        kind = event["event"]
+        if FINAL_ANSWER_TAG in event.get("tags", []):
+            if kind == "on_chat_model_start":
+                strippers[event["run_id"]] = HeaderStripper()
+                yield ("reset", None)
+            elif kind == "on_chat_model_stream":
+                stripper = strippers.get(event["run_id"])
+                text = event["data"]["chunk"].content
+                if text and stripper is not None:
+                    text = stripper.feed(text)
+                if text:
+                    yield ("token", text)
+            elif kind == "on_chat_model_end":
+                stripper = strippers.pop(event["run_id"], None)
+                text = stripper.flush() if stripper is not None else ""
+                if text:
+                    yield ("token", text)
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            final_state = event["data"].get("output")
+    yield ("final", final_state or {})
+
+
+def stream_answer(agent_graph, initial_state):
+    """astream_answer'ın senkron karşılığı (Streamlit gibi senkron arayüzler için)."""
+    return iterate_sync(astream_answer(agent_graph, initial_state))
+
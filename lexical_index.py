@@ -0,0 +1,195 @@
+# lexical_index.py
+import os
+import re
+import math
+import gzip
+import json
+import logging
+from text_utils import fold_turkish
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+LEXICAL_INDEX_FILENAME = "lexical_index.json.gz"
+LEXICAL_INDEX_VERSION = 1
+# BM25 parametreleri
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+# Çok sık geçen ve aramaya katkısı olmayan kelimeler (ASCII'ye indirgenmiş halleriyle)
+_STOPWORDS = {
+    "ve", "ile", "bu", "su", "o", "bir", "da", "de", "ki", "mi", "mu", "icin", "gibi", "olan", "olarak",
+    "ne", "nedir", "neler", "nelerdir", "hangi", "var", "midir", "ise", "veya", "ya", "daha", "en",
+}
+# Hafif ek budama: uzundan kısaya denenir, kök en az MIN_STEM_LENGTH karakter kalmalıdır
+_SUFFIXES = sorted([
+    "lerinden", "larindan", "lerinde", "larinda", "lerine", "larina", "lerini", "larini",
+    "lerin", "larin", "leri", "lari", "ler", "lar",
+    "inden", "indan", "unden", "undan", "inde", "inda", "unde", "unda",
+    "nden", "ndan", "nde", "nda", "den", "dan", "ten", "tan", "de", "da", "te", "ta",
+    "nin", "nun", "ini", "unu", "ine", "una", "yla", "yle", "la", "le",
+    "in", "un", "si", "su", "yi", "yu", "i", "u", "e", "a",
+], key=len, reverse=True)
+MIN_STEM_LENGTH = 4
+
+
+def stem(token):
+    """Türkçe için kural tabanlı hafif ek budama (tam bir morfolojik çözümleyici değildir)."""
+    if token.isdigit():
+        return token
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LENGTH:
+            return token[: -len(suffix)]
+    return token
+
+
+def tokenize(text):
+    """Türkçe büyük/küçük harf katlama (İ/ı), ASCII'ye indirgeme, stopword temizliği ve ek budama."""
+    tokens = []
+    for token in _TOKEN_RE.findall(fold_turkish(text)):
+        if token in _STOPWORDS or (len(token) < 2 and not token.isdigit()):
+            continue
+        tokens.append(stem(token))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    Chunk'lar üzerinde BM25 ters indeksi. Dosya bazında artımlı güncellenir
+    (silinen parçalar işaretlenir, kayıtta sıkıştırılır) ve diske gzip'li JSON olarak yazılır.
+    """
+
+    def __init__(self):
+        self.chunk_ids = []      # doc_idx -> chunk_id (silinmişse None)
+        self.doc_files = []      # doc_idx -> dosya adı
+        self.doc_lengths = []    # doc_idx -> token sayısı
+        self.postings = {}       # terim -> {doc_idx: tf}
+        self.files = {}          # dosya adı -> sha256 (indekslenmiş sürüm)
+        self._live_docs = 0
+        self._total_length = 0
+        self._tombstones = 0
+
+    # --- Güncelleme ---
+    def add_file(self, filename, file_sha, chunks):
+        """chunks: [(chunk_id, metin)]. Dosyanın önceki parçaları varsa önce kaldırılır."""
+        self.remove_file(filename)
+        for chunk_id, text in chunks:
+            doc_idx = len(self.chunk_ids)
+            tokens = tokenize(text)
+            self.chunk_ids.append(chunk_id)
+            self.doc_files.append(filename)
+            self.doc_lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                self.postings.setdefault(token, {})[doc_idx] = tf
+            self._live_docs += 1
+            self._total_length += len(tokens)
+        self.files[filename] = file_sha
+
+    def remove_file(self, filename):
+        if filename not in self.files:
+            return
+        for doc_idx, doc_file in enumerate(self.doc_files):
+            if doc_file == filename and self.chunk_ids[doc_idx] is not None:
+                self.chunk_ids[doc_idx] = None
+                self._live_docs -= 1
+                self._total_length -= self.doc_lengths[doc_idx]
+                self._tombstones += 1
+        del self.files[filename]
+
+    # --- Arama ---
+    def search(self, query, k=10, allowed=None):
+        """
+        BM25 ile en iyi k parçayı [(chunk_id, skor, eşleşen_terimler)] olarak döndürür.
+        allowed (chunk_id kümesi) verilirse sadece o parçalar sıralanır; istatistikler tüm arşivden gelir.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self._live_docs:
+            return []
+        avg_length = self._total_length / self._live_docs
+        scores = {}
+        matched = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            live = [(doc_idx, tf) for doc_idx, tf in posting.items() if self.chunk_ids[doc_idx] is not None]
+            if not live:
+                continue
+            idf = math.log(1 + (self._live_docs - len(live) + 0.5) / (len(live) + 0.5))
+            for doc_idx, tf in live:
+                if allowed is not None and self.chunk_ids[doc_idx] not in allowed:
+                    continue
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_idx] / avg_length)
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+                matched.setdefault(doc_idx, set()).add(term)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.chunk_ids[doc_idx], score, matched[doc_idx]) for doc_idx, score in best]
+
+    # --- Kalıcılık ---
+    def _compact(self):
+        remap = {}
+        chunk_ids, doc_files, doc_lengths = [], [], []
+        for doc_idx, chunk_id in enumerate(self.chunk_ids):
+            if chunk_id is None:
+                continue
+            remap[doc_idx] = len(chunk_ids)
+            chunk_ids.append(chunk_id)
+            doc_files.append(self.doc_files[doc_idx])
+            doc_lengths.append(self.doc_lengths[doc_idx])
+        postings = {}
+        for term, posting in self.postings.items():
+            live = {remap[doc_idx]: tf for doc_idx, tf in posting.items() if doc_idx in remap}
+            if live:
+                postings[term] = live
+        self.chunk_ids, self.doc_files, self.doc_lengths, self.postings = chunk_ids, doc_files, doc_lengths, postings
+        self._tombstones = 0
+
+    def save(self, directory):
+        if self._tombstones:
+            self._compact()
+        file_names = sorted(set(self.doc_files))
+        file_index = {name: i for i, name in enumerate(file_names)}
+        payload = {
+            "version": LEXICAL_INDEX_VERSION,
+            "files": self.files,
+            "file_names": file_names,
+            "chunk_ids": self.chunk_ids,
+            "doc_files": [file_index[name] for name in self.doc_files],
+            "doc_lengths": self.doc_lengths,
+            # Terim başına [doc_idx listesi, tf listesi]: sözlükten daha kompakt
+            "postings": {term: [list(posting), list(posting.values())] for term, posting in self.postings.items()},
+        }
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, LEXICAL_INDEX_FILENAME)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory):
+        """Diskteki indeksi yükler; yoksa veya sürümü uyumsuzsa boş indeks döner."""
+        index = cls()
+        path = os.path.join(directory, LEXICAL_INDEX_FILENAME)
+        if not os.path.exists(path):
+            return index
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Sözcüksel indeks okunamadı ({path}): {e}. Yeniden oluşturulacak.")
+            return index
+        if payload.get("version") != LEXICAL_INDEX_VERSION:
+            return index
+        file_names = payload["file_names"]
+        index.files = payload["files"]
+        index.chunk_ids = payload["chunk_ids"]
+        index.doc_files = [file_names[i] for i in payload["doc_files"]]
+        index.doc_lengths = payload["doc_lengths"]
+        index.postings = {term: dict(zip(doc_ids, tfs)) for term, (doc_ids, tfs) in payload["postings"].items()}
+        index._live_docs = len(index.chunk_ids)
+        index._total_length = sum(index.doc_lengths)
+        return index
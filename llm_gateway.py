@@ -0,0 +1,405 @@
+# llm_gateway.py
+import os
+import time
+import math
+import asyncio
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from dotenv import load_dotenv
+from langchain_core.runnables import Runnable
+from langchain_core.embeddings import Embeddings
+from tracing import add_to_current_span
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+load_dotenv()
+
+# --- Ayarlar ---
+LLM_MODEL_NAME = "gemini-1.5-flash-latest"
+EMBEDDING_MODEL_NAME = "models/embedding-001"
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Kota ayarları: sadece kota gerçekten dolduğunda beklenir (sabit time.sleep yerine)
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+EMBED_REQUESTS_PER_MINUTE = int(os.getenv("EMBED_REQUESTS_PER_MINUTE", "600"))
+# Embedding API'sinin tek istekte kabul ettiği en fazla metin sayısı
+EMBED_MAX_BATCH = 100
+
+
+class TokenBucket:
+    """
+    Dakika başına kapasiteli token bucket. reserve() kotayı hemen düşer ve
+    çağıranın ne kadar beklemesi gerektiğini döndürür; böylece bekleyenler sırayla (FIFO) geçer.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1.0):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def resize(self, per_minute):
+        with self._lock:
+            self.capacity = float(per_minute)
+            self.rate = per_minute / 60.0
+            self.tokens = min(self.tokens, self.capacity)
+
+    def charge(self, amount):
+        """Beklemeden kotadan düşer (ör. cevapta gelen çıktı token'ları için)."""
+        with self._lock:
+            self.tokens -= amount
+
+
+class _SlotWaiter:
+    __slots__ = ("wake", "granted")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SlotLimiter:
+    """
+    Eşzamanlı çağrı sınırı; thread'ler ve farklı event loop'lar arasında paylaşılır. Boşalan slot sıradaki
+    bekleyene (FIFO) doğrudan devredilir; async bekleyenler yoklama yapmadan bir future üzerinde bekler.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._available = limit
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        # Kilit altında çağrılır; sırada bekleyen varsa boş slot ona ayrılmıştır
+        if self._available > 0 and not self._waiters:
+            self._available -= 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._lock:
+            if self._take():
+                return
+            event = threading.Event()
+            self._waiters.append(_SlotWaiter(event.set))
+        event.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._take():
+                return
+            future = loop.create_future()
+            waiter = _SlotWaiter(lambda: loop.call_soon_threadsafe(_resolve, future))
+            self._waiters.append(waiter)
+        try:
+            await future
+        except BaseException:
+            # İptal edildi: slot devredildiyse geri bırakılır, devredilmediyse sıradan çıkılır
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    if self._available >= self.limit:
+                        raise ValueError("SlotLimiter: alınandan fazla slot bırakıldı.")
+                    self._available += 1
+                    return
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+            try:
+                waiter.wake()
+                return
+            except RuntimeError:
+                continue  # bekleyenin event loop'u kapanmış; slot sıradakine geçer
+
+    def idle(self):
+        with self._lock:
+            return self._available == self.limit and not self._waiters
+
+
+def _require_api_key():
+    # Anahtar import anında değil, ilk gerçek istemci oluşturulurken kontrol edilir
+    api_key = GOOGLE_API_KEY or os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY ortam değişkeni bulunamadı.")
+    return api_key
+
+
+def _default_chat_factory(model, temperature):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=model, google_api_key=_require_api_key(), temperature=temperature)
+
+
+def _default_embeddings_factory(model):
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model=model, google_api_key=_require_api_key())
+
+
+_encoding = None
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding
+
+def count_tokens(text):
+    """Yaklaşık token sayısı (tiktoken cl100k; Gemini tokenizer'ına yakın bir tahmin)."""
+    encoding = _get_encoding()
+    if not encoding:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text, max_tokens):
+    """Metnin ilk max_tokens token'lık kısmını döndürür (count_tokens ile aynı tokenizer)."""
+    encoding = _get_encoding()
+    if not encoding:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def _input_to_text(value):
+    if isinstance(value, str):
+        return value
+    if hasattr(value, "to_string"):
+        return value.to_string()
+    if isinstance(value, (list, tuple)):
+        return "\n".join(getattr(m, "content", str(m)) if not isinstance(m, str) else m for m in value)
+    return str(value)
+
+
+def _output_tokens(message):
+    usage = getattr(message, "usage_metadata", None)
+    if usage and usage.get("output_tokens"):
+        return usage["output_tokens"]
+    return count_tokens(getattr(message, "content", "") or "")
+
+
+class LLMGateway:
+    """
+    LLM ve embedding istemcilerinin tek sahibi. Tüm çağrılar ortak bir istek/dakika ve
+    token/dakika kotasından ve eşzamanlı çağrı sınırından geçer.
+    """
+
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                 max_in_flight=LLM_MAX_IN_FLIGHT, embed_requests_per_minute=EMBED_REQUESTS_PER_MINUTE,
+                 chat_factory=_default_chat_factory, embeddings_factory=_default_embeddings_factory):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.embed_bucket = TokenBucket(embed_requests_per_minute)
+        self.max_in_flight = max_in_flight
+        self.chat_factory = chat_factory
+        self.embeddings_factory = embeddings_factory
+        self._slots = SlotLimiter(max_in_flight)
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"llm_calls": 0, "embed_calls": 0, "prompt_tokens": 0, "output_tokens": 0, "throttled_seconds": 0.0}
+
+    # --- İstemci havuzu ---
+    def _client(self, key, factory):
+        with self._clients_lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory()
+                self._clients[key] = client
+            return client
+
+    def get_chat_model(self, temperature=0.3, model=LLM_MODEL_NAME):
+        """
+        Aynı (model, sıcaklık) için her yerde paylaşılan, kotaya tabi bir sohbet modeli döner.
+        Asıl istemci ilk çağrıda oluşturulur; modül seviyesinde çağırmak ucuzdur.
+        """
+        return self._client(("chat", model, temperature),
+                            lambda: GatedChatModel(self, lambda: self.chat_factory(model, temperature)))
+
+    def get_embeddings(self, model=EMBEDDING_MODEL_NAME):
+        return self._client(("embed", model), lambda: GatedEmbeddings(self, lambda: self.embeddings_factory(model)))
+
+    # --- Kota ---
+    def share_quota(self, parts):
+        """
+        Kotayı ve eşzamanlı çağrı sınırını parts eşit paya böler. Çok süreçli sunumda her işçi süreci
+        kendi payını kullanır; böylece süreçlerin toplamı yapılandırılan kotayı aşmaz. Slot sınırlayıcı
+        yeniden oluşturulduğu için sadece ilk LLM çağrısından önce (işçi süreci başlarken) çağrılmalıdır.
+        """
+        if not self._slots.idle():
+            raise RuntimeError("share_quota, LLM çağrıları sürerken çağrılamaz; gateway kullanılmadan önce çağrılmalıdır.")
+        for bucket in (self.request_bucket, self.token_bucket, self.embed_bucket):
+            bucket.resize(bucket.capacity / parts)
+        self.max_in_flight = max(1, self.max_in_flight // parts)
+        self._slots = SlotLimiter(self.max_in_flight)
+
+    def _llm_wait(self, prompt_tokens):
+        wait = max(self.request_bucket.reserve(1), self.token_bucket.reserve(prompt_tokens))
+        self._count(llm_calls=1, prompt_tokens=prompt_tokens, throttled_seconds=wait)
+        add_to_current_span(llm_calls=1, prompt_tokens=prompt_tokens, throttled_seconds=wait)
+        if wait > 0:
+            logging.info(f"LLM kotası dolu, {wait:.2f} sn bekleniyor.")
+        return wait
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def record_output(self, output_tokens):
+        self._count(output_tokens=output_tokens)
+        self.token_bucket.charge(output_tokens)
+        add_to_current_span(output_tokens=output_tokens)
+
+    @contextmanager
+    def llm_slot(self, prompt_tokens):
+        time.sleep(self._llm_wait(prompt_tokens))
+        self._slots.acquire()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def allm_slot(self, prompt_tokens):
+        await asyncio.sleep(self._llm_wait(prompt_tokens))
+        await self._slots.aacquire()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def embed_wait(self, request_count=1):
+        wait = self.embed_bucket.reserve(request_count)
+        self._count(embed_calls=request_count, throttled_seconds=wait)
+        add_to_current_span(embed_calls=request_count)
+        if wait > 0:
+            logging.info(f"Embedding kotası dolu, {wait:.2f} sn bekleniyor.")
+        return wait
+
+
+def _lazy_client(holder):
+    """holder._client_factory ile istemciyi ilk kullanımda (thread-safe, bir kez) oluşturur."""
+    if holder._client is None:
+        with holder._client_lock:
+            if holder._client is None:
+                holder._client = holder._client_factory()
+    return holder._client
+
+
+class GatedChatModel(Runnable):
+    """Sohbet modelini saran Runnable; her çağrı gateway kotasından geçer. Zincirlerde LLM yerine kullanılır."""
+
+    def __init__(self, gateway, client_factory):
+        self.gateway = gateway
+        self._client_factory = client_factory
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def model(self):
+        return _lazy_client(self)
+
+    def invoke(self, input, config=None, **kwargs):
+        with self.gateway.llm_slot(count_tokens(_input_to_text(input))):
+            result = self.model.invoke(input, config, **kwargs)
+        self.gateway.record_output(_output_tokens(result))
+        return result
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        async with self.gateway.allm_slot(count_tokens(_input_to_text(input))):
+            result = await self.model.ainvoke(input, config, **kwargs)
+        self.gateway.record_output(_output_tokens(result))
+        return result
+
+    def stream(self, input, config=None, **kwargs):
+        output_tokens = 0
+        with self.gateway.llm_slot(count_tokens(_input_to_text(input))):
+            for chunk in self.model.stream(input, config, **kwargs):
+                output_tokens += count_tokens(getattr(chunk, "content", "") or "")
+                yield chunk
+        self.gateway.record_output(output_tokens)
+
+    async def astream(self, input, config=None, **kwargs):
+        output_tokens = 0
+        async with self.gateway.allm_slot(count_tokens(_input_to_text(input))):
+            async for chunk in self.model.astream(input, config, **kwargs):
+                output_tokens += count_tokens(getattr(chunk, "content", "") or "")
+                yield chunk
+        self.gateway.record_output(output_tokens)
+
+
+class GatedEmbeddings(Embeddings):
+    """Embedding istemcisini saran ve her API isteğini embedding kotasından geçiren sarmalayıcı."""
+
+    def __init__(self, gateway, client_factory):
+        self.gateway = gateway
+        self._client_factory = client_factory
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        return _lazy_client(self)
+
+    def embed_documents(self, texts, **kwargs):
+        texts = list(texts)
+        time.sleep(self.gateway.embed_wait(max(1, math.ceil(len(texts) / EMBED_MAX_BATCH))))
+        return self.embeddings.embed_documents(texts, **kwargs)
+
+    def embed_query(self, text):
+        time.sleep(self.gateway.embed_wait(1))
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        texts = list(texts)
+        await asyncio.sleep(self.gateway.embed_wait(max(1, math.ceil(len(texts) / EMBED_MAX_BATCH))))
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.gateway.embed_wait(1))
+        return await self.embeddings.aembed_query(text)
+
+
+# Uygulama genelinde paylaşılan tek gateway
+gateway = LLMGateway()
+
+
+def get_chat_model(temperature=0.3, model=LLM_MODEL_NAME):
+    return gateway.get_chat_model(temperature=temperature, model=model)
+
+
+def get_embeddings(model=EMBEDDING_MODEL_NAME):
+    return gateway.get_embeddings(model=model)
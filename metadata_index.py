@@ -0,0 +1,266 @@
+# metadata_index.py
+"""
+Resmi Gazete sayılarından yapılandırılmış alanların çıkarılması (yayım tarihi, sayı, kanun/karar numaraları,
+belge türü) ve bu alanlardan parça kimliklerine giden yerel arama indeksi. Sorudaki tarih ve numaralar
+vektör aramasından önce kesin filtre olarak uygulanır.
+"""
+import os
+import re
+import gzip
+import json
+import logging
+from datetime import date
+from langchain_core.documents import Document
+from text_utils import fold_turkish
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+METADATA_INDEX_FILENAME = "metadata_index.json.gz"
+METADATA_INDEX_VERSION = 1
+# Parça metadata'sında ve indekste tutulan alanlar (Chroma sadece skaler değer kabul eder; numaralar virgülle birleştirilir)
+FILTER_FIELDS = ("publication_date", "issue_number", "law_numbers", "doc_type")
+# Sayının künyesi (tarih, sayı) ilk sayfanın bu kadar karakterinde aranır
+ISSUE_HEADER_CHARS = 2000
+
+_MONTHS = {"ocak": 1, "subat": 2, "mart": 3, "nisan": 4, "mayis": 5, "haziran": 6, "temmuz": 7,
+           "agustos": 8, "eylul": 9, "ekim": 10, "kasim": 11, "aralik": 12}
+# Tarih biçimleri (ASCII'ye indirgenmiş metinde): 12.03.2022, 12/03/2022, 2022-03-12, 12 Mart 2022
+_NUMERIC_DATE_RE = re.compile(r"\b(\d{1,2})[./](\d{1,2})[./](\d{4})\b")
+_ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_TEXT_DATE_RE = re.compile(r"\b(\d{1,2})\s+(" + "|".join(_MONTHS) + r")\s+(\d{4})\b")
+# Gazete sayısı: "Sayı : 31776" veya "31776 sayılı Resmi Gazete"
+_ISSUE_RE = re.compile(r"\bsayi\s*[:.]?\s*(\d{4,5})\b|\b(\d{4,5})\s+sayili\s+resmi\s+gazete")
+# Kanun/karar numaraları: "5510 sayılı Kanun", "Kanun No. 7394", "Karar Sayısı: 5334"
+_LAW_RE = re.compile(r"\b(\d{2,5})\s+sayili\b(?!\s+resmi\s+gazete)"
+                     r"|\b(?:kanun|karar|kararname)\s+(?:no|numarasi|sayisi)\s*[:.]?\s*(\d{2,5})\b")
+# Belge türü başlıkları (tamamı büyük harf satırlarda aranır) ve soruda geçen karşılıkları
+_DOC_TYPE_RES = {
+    "kanun": re.compile(r"\bkanun\b"),
+    "yonetmelik": re.compile(r"\byonetmeli[gk]"),
+    "teblig": re.compile(r"\bteblig"),
+    "ilan": re.compile(r"\bilan"),
+    "karar": re.compile(r"\bkarar(i|lari)?\b"),
+    "genelge": re.compile(r"\bgenelge"),
+}
+
+
+# --- Alan çıkarımı ---
+def _valid_date(year, month, day):
+    try:
+        return date(int(year), int(month), int(day)).isoformat()
+    except ValueError:
+        return None
+
+
+def extract_dates(text):
+    """Metindeki tarihleri geçtikleri sırayla ISO biçiminde (YYYY-AA-GG) döndürür."""
+    folded = fold_turkish(text or "")
+    found = []
+    for match in _NUMERIC_DATE_RE.finditer(folded):
+        found.append((match.start(), _valid_date(match.group(3), match.group(2), match.group(1))))
+    for match in _ISO_DATE_RE.finditer(folded):
+        found.append((match.start(), _valid_date(match.group(1), match.group(2), match.group(3))))
+    for match in _TEXT_DATE_RE.finditer(folded):
+        found.append((match.start(), _valid_date(match.group(3), _MONTHS[match.group(2)], match.group(1))))
+    return list(dict.fromkeys(value for _, value in sorted(found) if value))
+
+
+def extract_issue_numbers(text):
+    return list(dict.fromkeys(a or b for a, b in _ISSUE_RE.findall(fold_turkish(text or ""))))
+
+
+def extract_law_numbers(text):
+    return list(dict.fromkeys(a or b for a, b in _LAW_RE.findall(fold_turkish(text or ""))))
+
+
+def _doc_types_in(text):
+    return [name for name, pattern in _DOC_TYPE_RES.items() if pattern.search(text)]
+
+
+def extract_doc_type(text):
+    """Parçadaki son belge türü başlığı (tamamı büyük harf satır), yoksa None."""
+    doc_type = None
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if len(line) > 3 and line.isupper():
+            types = _doc_types_in(fold_turkish(line))
+            if types:
+                doc_type = types[0]
+    return doc_type
+
+
+def issue_fields(first_page_text):
+    """Sayının künyesinden yayım tarihi ve gazete sayısı (ilk sayfanın başındaki ilk eşleşmeler)."""
+    header = (first_page_text or "")[:ISSUE_HEADER_CHARS]
+    fields = {}
+    dates = extract_dates(header)
+    if dates:
+        fields["publication_date"] = dates[0]
+    issues = extract_issue_numbers(header)
+    if issues:
+        fields["issue_number"] = issues[0]
+    return fields
+
+
+def annotate_chunks(chunks, first_page_text):
+    """
+    Bir sayının parçalarına (sırasıyla) yapılandırılmış alanları metadata olarak ekler. Belge türü başlığı
+    olmayan parça, aynı sayıda kendinden önce gelen son başlığın türünü alır.
+    """
+    issue = issue_fields(first_page_text)
+    doc_type = None
+    for chunk in chunks:
+        chunk.metadata.update(issue)
+        doc_type = extract_doc_type(chunk.page_content) or doc_type
+        if doc_type:
+            chunk.metadata["doc_type"] = doc_type
+        law_numbers = extract_law_numbers(chunk.page_content)
+        if law_numbers:
+            chunk.metadata["law_numbers"] = ",".join(law_numbers)
+    return chunks
+
+
+def chunk_fields(metadata):
+    """Parça metadata'sındaki filtre alanları: {alan: [değerler]}."""
+    fields = {}
+    for field in FILTER_FIELDS:
+        value = (metadata or {}).get(field)
+        if value:
+            fields[field] = [v for v in str(value).split(",") if v]
+    return fields
+
+
+# --- Soru tarafı ---
+def parse_query_filters(question):
+    """
+    Sorudaki tarih, gazete sayısı, kanun numarası ve belge türünü filtre olarak çıkarır: {alan: değerler}.
+    Belge türü tek başına filtre olmaz (ör. "5510 sayılı kanun" yönetmelik metinlerinde de geçer);
+    sadece tarih veya sayı ile birlikte daraltır.
+    """
+    filters = {}
+    dates = extract_dates(question)
+    if dates:
+        filters["publication_date"] = frozenset(dates)
+    issues = extract_issue_numbers(question)
+    if issues:
+        filters["issue_number"] = frozenset(issues)
+    law_numbers = extract_law_numbers(question)
+    if law_numbers:
+        filters["law_numbers"] = frozenset(law_numbers)
+    if "publication_date" in filters or "issue_number" in filters:
+        doc_types = _doc_types_in(fold_turkish(question or ""))
+        if doc_types:
+            filters["doc_type"] = frozenset(doc_types)
+    return filters
+
+
+def _chunk_order(chunk_id):
+    # Ingest kimlikleri "<dosya_sha>-<sıra>" biçimindedir; aynı dosyanın parçaları metindeki sırayla döner
+    prefix, _, index = chunk_id.rpartition("-")
+    return (prefix, int(index)) if index.isdigit() else (chunk_id, 0)
+
+
+class MetadataIndex:
+    """
+    Filtre alanı değerlerinden parça kimliklerine ters indeks. Dosya bazında artımlı güncellenir
+    ve diske gzip'li JSON olarak yazılır.
+    """
+
+    def __init__(self):
+        self.files = {}        # dosya adı -> sha256 (indekslenmiş sürüm)
+        self.file_chunks = {}  # dosya adı -> {chunk_id: {alan: [değerler]}}
+        self.postings = {field: {} for field in FILTER_FIELDS}  # alan -> değer -> {chunk_id}
+
+    # --- Güncelleme ---
+    def add_file(self, filename, file_sha, chunks):
+        """chunks: [(chunk_id, {alan: [değerler]})]. Dosyanın önceki parçaları varsa önce kaldırılır."""
+        self.remove_file(filename)
+        entries = {}
+        for chunk_id, fields in chunks:
+            entries[chunk_id] = fields
+            for field, values in fields.items():
+                for value in values:
+                    self.postings[field].setdefault(value, set()).add(chunk_id)
+        self.file_chunks[filename] = entries
+        self.files[filename] = file_sha
+
+    def remove_file(self, filename):
+        for chunk_id, fields in self.file_chunks.pop(filename, {}).items():
+            for field, values in fields.items():
+                for value in values:
+                    posting = self.postings[field].get(value)
+                    if posting is not None:
+                        posting.discard(chunk_id)
+                        if not posting:
+                            del self.postings[field][value]
+        self.files.pop(filename, None)
+
+    # --- Arama ---
+    def lookup(self, filters):
+        """
+        Filtrelerin hepsine uyan parça kimliklerini (dosya içi sırayla) döndürür; filtre yoksa None.
+        Alan içinde değerler VEYA, alanlar arasında VE ile birleşir. Belge türüyle hiçbir parça kalmıyorsa
+        belge türü filtresi bırakılır (başlığı okunamayan sayılar elenmesin diye).
+        """
+        if not filters:
+            return None
+        matches = self._match(filters)
+        if not matches and "doc_type" in filters and len(filters) > 1:
+            matches = self._match({field: values for field, values in filters.items() if field != "doc_type"})
+        return sorted(matches, key=_chunk_order)
+
+    def _match(self, filters):
+        matches = None
+        for field, values in sorted(filters.items(), key=lambda item: item[0] != "publication_date"):
+            postings = self.postings.get(field, {})
+            ids = set().union(*(postings.get(value, ()) for value in values))
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return set()
+        return matches
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.file_chunks.values())
+
+    # --- Kalıcılık ---
+    def save(self, directory):
+        payload = {"version": METADATA_INDEX_VERSION, "files": self.files, "file_chunks": self.file_chunks}
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, METADATA_INDEX_FILENAME)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory):
+        """Diskteki indeksi yükler; yoksa veya sürümü uyumsuzsa boş indeks döner."""
+        index = cls()
+        path = os.path.join(directory, METADATA_INDEX_FILENAME)
+        if not os.path.exists(path):
+            return index
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Metadata indeksi okunamadı ({path}): {e}. Yeniden oluşturulacak.")
+            return index
+        if payload.get("version") != METADATA_INDEX_VERSION:
+            return index
+        for filename, entries in payload["file_chunks"].items():
+            index.add_file(filename, payload["files"].get(filename), entries.items())
+        return index
+
+
+def fields_for_stored_chunks(chunk_ids, texts, metadatas):
+    """
+    Vektör deposundan okunan bir dosyanın parçaları için filtre alanları. Alanlar ingest'te metadata'ya
+    yazılmadıysa (bu özellikten önce oluşturulmuş depo) parça metinlerinden çıkarılır.
+    """
+    metadatas = [metadata or {} for metadata in metadatas]
+    if not any(field in metadata for metadata in metadatas for field in FILTER_FIELDS):
+        chunks = [Document(page_content=text or "", metadata={}) for text in texts]
+        first_page = min((metadata.get("page", 0) for metadata in metadatas), default=0)
+        first_page_text = "\n".join(text or "" for text, metadata in zip(texts, metadatas) if metadata.get("page", 0) == first_page)
+        metadatas = [chunk.metadata for chunk in annotate_chunks(chunks, first_page_text)]
+    return [(chunk_id, chunk_fields(metadata)) for chunk_id, metadata in zip(chunk_ids, metadatas)]
@@ -0,0 +1,212 @@
+# request_coalescing.py
+"""
+Aynı anda gelen aynı sorular için tek çalıştırma (single-flight). Bir soru (normalize edilmiş hali) zaten
+cevaplanıyorsa yeni istekler o çalıştırmaya bağlanır ve aynı answer/source'u veya aynı hatayı alır;
+yönlendirme, retrieval ve cevap LLM'i bir kez çalışır.
+Paylaşılan çalıştırma, isteyenlerden biri vazgeçse (zaman aşımı, kopan bağlantı) de diğerleri için tamamlanır;
+sonucu bekleyen kimse kalmazsa iptal edilir. Vazgeçen son istek çalıştırma durana kadar döner, böylece sunucunun
+eşzamanlılık slotu arka planda süren işler için erkenden boşalmaz.
+"""
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+import tracing
+from text_utils import normalize_question
+from conversation import is_follow_up
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Ayarlar ---
+REQUEST_COALESCING_ENABLED = os.getenv("REQUEST_COALESCING_ENABLED", "true").lower() != "false"
+
+
+class CoalescedRunAborted(RuntimeError):
+    """Paylaşılan çalıştırma sonuç üretmeden bitti (ör. event loop kapanırken iptal edildi)."""
+
+
+class CoalescingAgentGraph:
+    """
+    Grafı (veya CachedAgentGraph/WorkerPool gibi sarmalayıcıları) tek çalıştırma katmanıyla sarar;
+    invoke/ainvoke/astream_answer sunar. Bekleyen bağlı istekler akışta sadece son durumu alır.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.stats = {"executions": 0, "coalesced": 0}
+        self._flights = {}  # anahtar -> concurrent.futures.Future (sync ve async bekleyenler için ortak)
+        self._waiters = {}  # future -> sonucu bekleyen istek sayısı
+        self._runs = {}     # future -> (anahtar, çalıştırmayı yürüten task)
+        self._lock = threading.Lock()
+
+    def _flight_key(self, initial_state):
+        # Takip sorusunun cevabı konuşmaya bağlıdır; başka isteklerle paylaşılmaz
+        if is_follow_up(initial_state):
+            return None
+        return normalize_question(initial_state.get("question", ""))
+
+    def _join(self, initial_state):
+        """(anahtar, future, lider_mi) döner; lider çalıştırmayı yapar, diğerleri sonucunu bekler."""
+        key = self._flight_key(initial_state)
+        with self._lock:
+            flight = self._flights.get(key) if key is not None else None
+            if flight is not None:
+                self.stats["coalesced"] += 1
+                self._waiters[flight] += 1
+                return key, flight, False
+            flight = Future()
+            if key is not None:
+                self._flights[key] = flight
+                self.stats["executions"] += 1
+            self._waiters[flight] = 1
+            return key, flight, True
+
+    def _leave(self, flight, abandoned=False):
+        """
+        Bekleyeni düşürür. Vazgeçen son bekleyense ve çalıştırma sürüyorsa, yeni istekler ona bağlanmasın diye
+        kaydını siler ve iptal edilecek task'ı döndürür.
+        """
+        with self._lock:
+            self._waiters[flight] -= 1
+            if self._waiters[flight] > 0:
+                return None
+            del self._waiters[flight]
+            run = self._runs.get(flight)
+            if not abandoned or run is None or flight.done():
+                return None
+            key, task = run
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            return task
+
+    async def _cancel_run(self, task):
+        """Bekleyeni kalmayan çalıştırmayı iptal eder; aynı loop'taysa durmasını bekler."""
+        loop = task.get_loop()
+        if loop is not asyncio.get_running_loop():
+            loop.call_soon_threadsafe(task.cancel)
+            return
+        logging.info("Paylaşılan çalıştırmanın sonucunu bekleyen kalmadı, iptal ediliyor.")
+        task.cancel()
+        await asyncio.wait({task})
+
+    async def _wait(self, flight):
+        abandoned = False
+        result = asyncio.wrap_future(flight)
+        try:
+            return await asyncio.shield(result)
+        except asyncio.CancelledError:
+            abandoned = True
+            # Vazgeçilen sonucun hatası (ör. iptal edilen çalıştırmanın CoalescedRunAborted'ı) loglanmasın
+            result.add_done_callback(lambda f: f.cancelled() or f.exception())
+            raise
+        finally:
+            task = self._leave(flight, abandoned)
+            if task is not None:
+                await self._cancel_run(task)
+
+    def _land(self, key, flight, state=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if flight.done():
+            return
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(state)
+
+    def _follower_state(self, initial_state, state):
+        logging.info(f"Aynı soru zaten cevaplanıyordu, sonucu paylaşıldı: {initial_state.get('question', '')[:100]}")
+        tracing.metrics.inc("coalesced_requests_total")
+        tracing.set_on_current_span(coalesced=True)
+        return {**state, **initial_state, "coalesced": True}
+
+    def _spawn(self, key, flight, coro):
+        # Paylaşılan çalıştırma isteyenin task'ından ayrı yürür; bekleyen kaldıkça bir isteyenin iptali onu durdurmaz
+        task = asyncio.ensure_future(coro)
+        with self._lock:
+            self._runs[flight] = (key, task)
+        task.add_done_callback(lambda _: self._forget_run(flight))
+        return task
+
+    def _forget_run(self, flight):
+        with self._lock:
+            self._runs.pop(flight, None)
+
+    def invoke(self, initial_state, config=None):
+        key, flight, leader = self._join(initial_state)
+        try:
+            if not leader:
+                return self._follower_state(initial_state, flight.result())
+            try:
+                state = self.graph.invoke(initial_state, config)
+            except Exception as e:
+                self._land(key, flight, error=e)
+                raise
+            self._land(key, flight, state)
+            return state
+        finally:
+            self._leave(flight)
+
+    async def ainvoke(self, initial_state, config=None):
+        key, flight, leader = self._join(initial_state)
+        if leader:
+            self._spawn(key, flight, self._fly(key, flight, initial_state, config))
+        state = await self._wait(flight)
+        return state if leader else self._follower_state(initial_state, state)
+
+    async def _fly(self, key, flight, initial_state, config):
+        try:
+            self._land(key, flight, await self.graph.ainvoke(initial_state, config))
+        except Exception as e:
+            self._land(key, flight, error=e)
+        finally:
+            self._land(key, flight, error=CoalescedRunAborted("Paylaşılan çalıştırma sonuç üretmeden bitti."))
+
+    async def astream_answer(self, initial_state):
+        from graph import astream_answer
+        key, flight, leader = self._join(initial_state)
+        if not leader:
+            state = await self._wait(flight)
+            yield ("final", self._follower_state(initial_state, state))
+            return
+
+        events = asyncio.Queue()
+
+        async def fly():
+            try:
+                async for event_type, payload in astream_answer(self.graph, initial_state):
+                    if event_type == "final":
+                        self._land(key, flight, payload)
+                    events.put_nowait((event_type, payload))
+            except Exception as e:
+                self._land(key, flight, error=e)
+            finally:
+                self._land(key, flight, error=CoalescedRunAborted("Paylaşılan akış son durum üretmeden bitti."))
+                events.put_nowait(None)
+
+        self._spawn(key, flight, fly())
+        abandoned = True
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            abandoned = False
+        finally:
+            # Akış yarıda bırakıldıysa (zaman aşımı, kopan bağlantı) ve bekleyen kalmadıysa çalıştırma iptal edilir
+            task = self._leave(flight, abandoned)
+            if task is not None:
+                await self._cancel_run(task)
+        error = flight.exception()
+        if error is not None:
+            raise error
+
+
+def with_request_coalescing(graph):
+    """REQUEST_COALESCING_ENABLED açıksa grafı tek çalıştırma katmanıyla sarar."""
+    if not REQUEST_COALESCING_ENABLED:
+        return graph
+    return CoalescingAgentGraph(graph)
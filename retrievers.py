@@ -0,0 +1,223 @@
+# retrievers.py
+import asyncio
+import contextvars
+import hashlib
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from metadata_index import parse_query_filters, extract_law_numbers
+from text_utils import fold_turkish
+import tracing
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Reciprocal Rank Fusion sabiti (literatürdeki standart değer)
+RRF_K = 60
+# Madde atıfları ("Madde 12", "12. madde"); kanun numaraları metadata_index.extract_law_numbers ile bulunur
+_ARTICLE_RE = re.compile(r"\bmadde\s+(\d{1,3})\b|\b(\d{1,3})\s*\.?\s*madde")
+# Alt sorgu üretiminde kullanılacak en fazla alternatif sorgu sayısı
+MAX_GENERATED_QUERIES = 5
+
+
+def chunk_key(doc):
+    """Belgenin tekil kimliği: ingest'te atanan chunk_id, yoksa içerik + konum özeti."""
+    chunk_id = doc.metadata.get("chunk_id") or getattr(doc, "id", None)
+    if chunk_id:
+        return chunk_id
+    raw = f"{doc.metadata.get('source')}|{doc.metadata.get('page')}|{doc.page_content}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(ranked_lists, rrf_k=RRF_K, weights=None):
+    """
+    Birden fazla sıralı belge listesini RRF ile birleştirir, chunk kimliğine göre tekilleştirir.
+    [(Document, skor)] listesini skora göre azalan sırada döndürür.
+    """
+    scores = {}
+    docs = {}
+    for list_index, ranked in enumerate(ranked_lists):
+        weight = weights[list_index] if weights else 1.0
+        for rank, doc in enumerate(ranked):
+            key = chunk_key(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    ordered = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(docs[key], score) for key, score in ordered]
+
+
+def question_identifiers(question):
+    """
+    Sorudaki kanun/karar numaraları ve madde numaraları (BM25 token'ları olarak). Tarihler ve yıllar
+    tanımlayıcı sayılmaz; bunlar arşivin büyük kısmında geçer ve metadata filtresiyle ele alınır.
+    """
+    folded = fold_turkish(question or "")
+    articles = {a or b for a, b in _ARTICLE_RE.findall(folded)}
+    return set(extract_law_numbers(question)) | articles
+
+
+def parse_generated_queries(text):
+    queries = []
+    for line in text.splitlines():
+        line = line.strip().lstrip("-*•0123456789.) ").strip()
+        if line and line not in queries:
+            queries.append(line)
+    return queries[:MAX_GENERATED_QUERIES]
+
+
+class FusionRetriever(BaseRetriever):
+    """
+    MultiQuery'nin hızlı karşılığı: LLM ile alternatif sorgular üretir, orijinal soru dahil tüm sorguları
+    tek toplu istekle embed eder, vektör aramalarını eşzamanlı yapar ve sonuçları RRF ile birleştirip
+    skorlu, tekilleştirilmiş ilk top_n parçayı döndürür.
+    lexical_index verilirse (hibrit mod) BM25 sonuçları da füzyona katılır; soru kanun/madde numarası gibi
+    tanımlayıcılar içeriyor ve BM25 bunları birebir bulduysa LLM ve embedding çağrısı hiç yapılmaz.
+    metadata_index verilirse sorudaki tarih, gazete sayısı ve kanun numarası aramadan önce kesin filtre olur:
+    BM25 ve vektör araması sadece uyan parçalarda yapılır; aday sayısı top_n'i geçmiyorsa arama hiç yapılmaz.
+    """
+
+    vector_store: Any
+    embeddings: Any
+    query_chain: Optional[Any] = None  # prompt | llm | StrOutputParser; None ise sadece orijinal soru aranır
+    k: int = 8
+    top_n: int = 10
+    max_workers: int = 8
+    lexical_index: Optional[Any] = None
+    lexical_k: int = 10
+    lexical_weight: float = 1.0
+    metadata_index: Optional[Any] = None
+
+    # --- Yardımcılar ---
+    def _embed_queries(self, queries):
+        with tracing.span("embed_queries", queries=len(queries)):
+            if hasattr(self.embeddings, "embed_queries"):
+                return self.embeddings.embed_queries(queries)
+            return [self.embeddings.embed_query(query) for query in queries]
+
+    def _candidates(self, question):
+        """Sorudaki filtrelere uyan parça kimlikleri; filtre yoksa veya hiçbir parça uymuyorsa None (filtresiz arama)."""
+        if self.metadata_index is None:
+            return None
+        filters = parse_query_filters(question)
+        if not filters:
+            return None
+        described = {field: sorted(values) for field, values in filters.items()}
+        with tracing.span("metadata_filter", filters=described) as filter_span:
+            candidates = self.metadata_index.lookup(filters)
+            filter_span.set(candidates=len(candidates))
+        if not candidates:
+            # Künyesi okunamamış veya arşivde olmayan bir sayı olabilir; cevap üretimi bağlama göre karar verir
+            logging.warning(f"Metadata filtresi {described} hiçbir parçayla eşleşmedi, filtresiz aranıyor.")
+            tracing.metrics.inc("metadata_filter_total", 1, (("outcome", "empty"),))
+            return None
+        logging.info(f"Metadata filtresi {described}: {len(candidates)} aday parça.")
+        tracing.metrics.inc("metadata_filter_total", 1, (("outcome", "applied"),))
+        return candidates
+
+    def _search(self, vector, candidates=None):
+        # Chroma ve mmap indeksi aynı filtre sözdizimini kabul eder
+        search_filter = {"chunk_id": {"$in": list(candidates)}} if candidates else None
+        with tracing.span("vector_search") as search_span:
+            results = self.vector_store.similarity_search_by_vector_with_relevance_scores(vector, k=self.k, filter=search_filter)
+            search_span.set(documents=len(results))
+        return [doc for doc, _ in results]
+
+    def _fetch(self, chunk_ids):
+        """Chunk ID'lerine karşılık gelen belgeleri (verilen sırayla) vektör deposundan okur."""
+        if not chunk_ids:
+            return []
+        result = self.vector_store.get(ids=list(chunk_ids), include=["documents", "metadatas"])
+        by_id = {chunk_id: Document(page_content=text, metadata={**(metadata or {}), "chunk_id": chunk_id})
+                 for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])}
+        return [by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id]
+
+    def _lexical_search(self, question, candidates=None):
+        """(BM25 sonuç belgeleri, tanımlayıcı kısa yolu kullanılabilir mi) döndürür."""
+        if self.lexical_index is None:
+            return [], False
+        allowed = set(candidates) if candidates else None
+        with tracing.span("lexical_search") as search_span:
+            hits = self.lexical_index.search(question, k=self.lexical_k, allowed=allowed)
+            search_span.set(documents=len(hits))
+        if not hits:
+            return [], False
+        identifiers = question_identifiers(question)
+        exact = [chunk_id for chunk_id, _, matched in hits if identifiers and identifiers <= matched]
+        if exact and hits[0][0] in exact:
+            logging.info(f"Hibrit arama: tanımlayıcılar {sorted(identifiers)} BM25 ile birebir bulundu, vektör araması atlanıyor.")
+            return self._fetch(exact[:self.top_n]), True
+        return self._fetch([chunk_id for chunk_id, _, _ in hits]), False
+
+    def _fuse(self, question, ranked_lists, lexical_docs=None):
+        weights = [1.0] * len(ranked_lists)
+        if lexical_docs:
+            ranked_lists = ranked_lists + [lexical_docs]
+            weights.append(self.lexical_weight)
+        fused = reciprocal_rank_fusion(ranked_lists, weights=weights)[:self.top_n]
+        documents = []
+        for doc, score in fused:
+            documents.append(Document(page_content=doc.page_content,
+                                      metadata={**doc.metadata, "chunk_id": chunk_key(doc), "relevance_score": score}))
+        logging.info(f"FusionRetriever: {len(ranked_lists)} sıralı liste, {sum(len(r) for r in ranked_lists)} sonuç -> {len(documents)} tekil parça.")
+        return documents
+
+    def _queries_from(self, question, generated_text):
+        queries = [question] + [q for q in parse_generated_queries(generated_text or "") if q != question]
+        logging.info(f"FusionRetriever sorguları: {queries}")
+        return queries
+
+    def _filtered_documents(self, question, candidates):
+        """Aday sayısı top_n'i geçmiyorsa hepsi döner (BM25 sırası önce, kalanlar metindeki sırayla); aksi halde None."""
+        if not candidates or len(candidates) > self.top_n:
+            return None
+        logging.info(f"Metadata filtresi sonrası {len(candidates)} aday kaldı, sorgu üretimi ve vektör araması atlanıyor.")
+        ranked = []
+        if self.lexical_index is not None:
+            ranked = [chunk_id for chunk_id, _, _ in self.lexical_index.search(question, k=len(candidates), allowed=set(candidates))]
+        return self._fetch(list(dict.fromkeys(ranked + list(candidates))))
+
+    # --- BaseRetriever arayüzü ---
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        candidates = self._candidates(query)
+        filtered = self._filtered_documents(query, candidates)
+        if filtered is not None:
+            return self._fuse(query, [filtered])
+        lexical_docs, exact = self._lexical_search(query, candidates)
+        if exact:
+            return self._fuse(query, [], lexical_docs)
+        generated = ""
+        if self.query_chain is not None:
+            try:
+                with tracing.span("query_generation"):
+                    generated = self.query_chain.invoke({"question": query})
+            except Exception as e:
+                logging.error(f"Hata: Alternatif sorgu üretimi başarısız, sadece orijinal soru aranacak: {e}", exc_info=True)
+        queries = self._queries_from(query, generated)
+        vectors = self._embed_queries(queries)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(vectors))) as executor:
+            # Her görev çağıranın context'inin kopyasıyla çalışır; böylece arama span'ları aynı trace'e düşer
+            futures = [executor.submit(contextvars.copy_context().run, self._search, vector, candidates) for vector in vectors]
+            ranked_lists = [future.result() for future in futures]
+        return self._fuse(query, ranked_lists, lexical_docs)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        candidates = self._candidates(query)
+        filtered = await asyncio.to_thread(self._filtered_documents, query, candidates)
+        if filtered is not None:
+            return self._fuse(query, [filtered])
+        lexical_docs, exact = await asyncio.to_thread(self._lexical_search, query, candidates)
+        if exact:
+            return self._fuse(query, [], lexical_docs)
+        generated = ""
+        if self.query_chain is not None:
+            try:
+                with tracing.span("query_generation"):
+                    generated = await self.query_chain.ainvoke({"question": query})
+            except Exception as e:
+                logging.error(f"Hata: Alternatif sorgu üretimi başarısız, sadece orijinal soru aranacak: {e}", exc_info=True)
+        queries = self._queries_from(query, generated)
+        vectors = await asyncio.to_thread(self._embed_queries, queries)
+        ranked_lists = await asyncio.gather(*(asyncio.to_thread(self._search, vector, candidates) for vector in vectors))
+        return self._fuse(query, list(ranked_lists), lexical_docs)
@@ -0,0 +1,119 @@
+# semantic_router.py
+import os
+import json
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+from text_utils import normalize_question
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Ayarlar ---
+ROUTING_EXEMPLARS_PATH = os.getenv("ROUTING_EXEMPLARS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing_exemplars.json"))
+# En iyi iki kategori arasındaki benzerlik farkı bunun altındaysa karar LLM'e bırakılır
+SEMANTIC_ROUTER_MIN_MARGIN = float(os.getenv("SEMANTIC_ROUTER_MIN_MARGIN", "0.05"))
+# "centroid": her kategorinin ortalama vektörü, "exemplar": kategorideki en yakın örnek
+SEMANTIC_ROUTER_MODE = os.getenv("SEMANTIC_ROUTER_MODE", "centroid")
+ROUTING_CACHE_SIZE = int(os.getenv("ROUTING_CACHE_SIZE", "2048"))
+
+# Örnek dosyasındaki kategori adlarının graf node'larına karşılığı
+CATEGORY_ROUTES = {
+    "Resmi Gazete": "gazette_agent",
+    "Haber/Genel Bilgi": "news_agent",
+    "İlgisiz/Diğer": "fallback_agent",
+}
+
+
+class RoutingDecisionCache:
+    """Normalize edilmiş soruya göre son yönlendirme kararlarını tutan thread-safe LRU önbellek."""
+
+    def __init__(self, maxsize=ROUTING_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, question):
+        key = normalize_question(question)
+        with self._lock:
+            route = self._data.get(key)
+            if route is not None:
+                self._data.move_to_end(key)
+            return route
+
+    def put(self, question, route):
+        key = normalize_question(question)
+        with self._lock:
+            self._data[key] = route
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class SemanticRouter:
+    """
+    Soruyu bir kez embed edip kategori örnekleriyle (ya da merkezleriyle) kosinüs benzerliğini
+    vektörel olarak hesaplar. Örnek vektörleri ilk kullanımda hesaplanır (embedding önbelleğine düşer).
+    """
+
+    def __init__(self, embeddings, exemplars_path=ROUTING_EXEMPLARS_PATH,
+                 min_margin=SEMANTIC_ROUTER_MIN_MARGIN, mode=SEMANTIC_ROUTER_MODE):
+        self.embeddings = embeddings
+        self.exemplars_path = exemplars_path
+        self.min_margin = min_margin
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._routes = None
+        self._matrix = None
+        self._labels = None
+
+    def _ensure_loaded(self):
+        if self._matrix is not None:
+            return
+        with self._lock:
+            if self._matrix is not None:
+                return
+            with open(self.exemplars_path, "r", encoding="utf-8") as f:
+                exemplars = json.load(f)
+            unknown = set(exemplars) - set(CATEGORY_ROUTES)
+            if unknown:
+                raise ValueError(f"Yönlendirme örnek dosyasında bilinmeyen kategori(ler): {unknown}")
+            categories = [c for c in CATEGORY_ROUTES if exemplars.get(c)]
+            texts = [text for c in categories for text in exemplars[c]]
+            labels = np.array([i for i, c in enumerate(categories) for _ in exemplars[c]])
+            vectors = _normalize_rows(np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32))
+            if self.mode == "exemplar":
+                matrix = vectors
+            else:
+                matrix = _normalize_rows(np.stack([vectors[labels == i].mean(axis=0) for i in range(len(categories))]))
+                labels = np.arange(len(categories))
+            self._routes = [CATEGORY_ROUTES[c] for c in categories]
+            self._labels = labels
+            self._matrix = matrix
+            logging.info(f"Semantik yönlendirici hazır: {len(texts)} örnek, {len(categories)} kategori ({self.mode}).")
+
+    def score(self, question):
+        """Her route için en yüksek kosinüs benzerliğini döndürür."""
+        self._ensure_loaded()
+        query = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        sims = self._matrix @ query
+        best = np.full(len(self._routes), -1.0, dtype=np.float32)
+        np.maximum.at(best, self._labels, sims)
+        return dict(zip(self._routes, best.tolist()))
+
+    def classify(self, question):
+        """(route, margin) döner; margin eşiğin altındaysa route None olur."""
+        scores = self.score(question)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (top_route, top_score), second_score = ranked[0], (ranked[1][1] if len(ranked) > 1 else -1.0)
+        margin = top_score - second_score
+        if margin >= self.min_margin:
+            return top_route, margin
+        return None, margin
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
@@ -0,0 +1,259 @@
+# server.py
+"""
+Agent grafını Streamlit'ten bağımsız, yük dengeleyici arkasında çoğaltılabilen bir HTTP API olarak sunar.
+Çalıştırma: uvicorn server:app --host 0.0.0.0 --port 8000  (veya python server.py)
+"""
+import os
+import json
+import asyncio
+import logging
+from typing import Optional
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+
+load_dotenv()
+
+from graph import build_agent_graph, astream_answer
+from request_coalescing import with_request_coalescing
+from async_utils import adopt_running_loop
+from conversation import ConversationStore, conversation_state, advance_conversation
+import tracing
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Ayarlar ---
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+# Aynı anda çalışan graf sayısı (LLM kota/token bucket'ları zaten gateway'de; bu sınır bellek ve gecikme için)
+SERVER_MAX_CONCURRENCY = int(os.getenv("SERVER_MAX_CONCURRENCY", "8"))
+# Slot bekleyebilecek en fazla istek; dolunca yeni istekler beklemeden 429 alır
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", "16"))
+# Bir isteğin slot için en fazla bekleme süresi (saniye); aşılırsa 429
+SERVER_QUEUE_TIMEOUT = float(os.getenv("SERVER_QUEUE_TIMEOUT", "2"))
+# Bir isteğin (graf çalışması) en fazla süresi (saniye); aşılırsa 504
+SERVER_REQUEST_TIMEOUT = float(os.getenv("SERVER_REQUEST_TIMEOUT", "60"))
+# 1'den büyükse sorular pre-fork işçi süreçlerinde cevaplanır (bkz. worker_pool.py); tüm çekirdekler kullanılır
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+RETRY_AFTER_SECONDS = 1
+
+
+class ServerBusy(Exception):
+    """Tüm slotlar dolu ve bekleme kuyruğu/süresi aşıldı."""
+
+
+class ConcurrencyLimiter:
+    """Eşzamanlı istek sınırı ve sınırlı bekleme kuyruğu (backpressure)."""
+
+    def __init__(self, max_concurrency, max_queue, queue_timeout):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+
+    async def acquire(self):
+        if self.waiting >= self.max_queue and self._semaphore.locked():
+            raise ServerBusy()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise ServerBusy() from None
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "waiting": self.waiting,
+                "max_concurrency": self.max_concurrency, "max_queue": self.max_queue}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Async LLM istemcileri ve run_sync çağrıları sunucunun loop'unu paylaşır
+    adopt_running_loop()
+    app.state.graph = None
+    app.state.pool = None
+    app.state.startup_error = None
+    app.state.limiter = ConcurrencyLimiter(SERVER_MAX_CONCURRENCY, SERVER_MAX_QUEUE, SERVER_QUEUE_TIMEOUT)
+    # session_id ile gelen isteklerin konuşma durumu (süreç içinde; işçilere her istekle gönderilir)
+    app.state.conversations = ConversationStore()
+    try:
+        if SERVER_WORKERS > 1:
+            # İşçi havuzu grafın ainvoke/astream_answer arayüzünü sağlar
+            from worker_pool import WorkerPool
+            logging.info(f"API sunucusu: {SERVER_WORKERS} işçili havuz başlatılıyor...")
+            app.state.pool = WorkerPool(SERVER_WORKERS)
+            await asyncio.to_thread(app.state.pool.start)
+            # Aynı sorular işçilere gönderilmeden ana süreçte birleştirilir
+            app.state.graph = with_request_coalescing(app.state.pool)
+        else:
+            logging.info("API sunucusu: graf kuruluyor...")
+            app.state.graph = await asyncio.to_thread(build_agent_graph)
+        logging.info("API sunucusu hazır.")
+    except Exception as e:
+        logging.error(f"Hata: API sunucusu başlatılırken graf kurulamadı: {e}", exc_info=True)
+        app.state.startup_error = str(e)
+    yield
+    if app.state.pool is not None:
+        await asyncio.to_thread(app.state.pool.close)
+
+
+app = FastAPI(title="Agentic AI Chatbot API", lifespan=lifespan)
+
+
+class AskRequest(BaseModel):
+    question: str = Field(..., min_length=1, max_length=4000)
+    # Verilirse aynı oturumdaki önceki turlar takip sorularını anlamak için kullanılır
+    session_id: Optional[str] = Field(None, min_length=1, max_length=128)
+
+
+def _count_request(endpoint, status):
+    tracing.metrics.inc("http_requests_total", 1, (("endpoint", endpoint), ("status", str(status))))
+
+
+def _initial_state(request, body, trace):
+    state = {"question": body.question, "trace": trace}
+    if body.session_id:
+        state.update(conversation_state(request.app.state.conversations.get(body.session_id)))
+    return state
+
+
+def _remember_turn(request, body, state):
+    if body.session_id:
+        conversations = request.app.state.conversations
+        conversations.put(body.session_id, advance_conversation(conversations.get(body.session_id), body.question, state))
+
+
+def _response_body(state, trace):
+    body = {
+        "answer": state.get("answer") or "Üzgünüm, bir cevap alamadım.",
+        "source": state.get("source") or "Bilinmeyen Kaynak",
+        "route": state.get("route"),
+        "cached": bool(state.get("cached")),
+        "follow_up": bool(state.get("follow_up")),
+    }
+    if trace is not None:
+        body["trace"] = trace.to_dict()
+    return body
+
+
+async def _acquire_slot(request, endpoint):
+    if request.app.state.graph is None:
+        _count_request(endpoint, 503)
+        raise HTTPException(status_code=503, detail="Servis hazır değil.")
+    limiter = request.app.state.limiter
+    try:
+        await limiter.acquire()
+    except ServerBusy:
+        _count_request(endpoint, 429)
+        logging.warning(f"API sunucusu dolu, istek reddedildi: {limiter.stats()}")
+        raise HTTPException(status_code=429, detail="Sunucu meşgul, lütfen tekrar deneyin.",
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    return limiter
+
+
+@app.post("/ask")
+async def ask(body: AskRequest, request: Request):
+    limiter = await _acquire_slot(request, "ask")
+    trace = tracing.new_trace_if_enabled()
+    try:
+        with tracing.use_trace(trace), tracing.span("request:ask"):
+            async with asyncio.timeout(SERVER_REQUEST_TIMEOUT):
+                state = await request.app.state.graph.ainvoke(_initial_state(request, body, trace))
+    except TimeoutError:
+        _count_request("ask", 504)
+        logging.error(f"Hata: İstek {SERVER_REQUEST_TIMEOUT} sn içinde tamamlanamadı: {body.question[:100]}")
+        raise HTTPException(status_code=504, detail="İstek zaman aşımına uğradı.")
+    except Exception as e:
+        _count_request("ask", 500)
+        logging.error(f"Hata: /ask isteği işlenirken: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="İsteğiniz işlenirken bir sorun oluştu.")
+    finally:
+        limiter.release()
+    _remember_turn(request, body, state)
+    _count_request("ask", 200)
+    return _response_body(state, trace)
+
+
+@app.post("/ask/stream")
+async def ask_stream(body: AskRequest, request: Request):
+    """
+    Cevabı satır satır JSON (NDJSON) olarak akıtır: {"type": "token", "text": ...}, {"type": "reset"}
+    (taslak cevap atıldı), son olarak {"type": "final", ...} veya {"type": "error", ...}.
+    """
+    limiter = await _acquire_slot(request, "ask_stream")
+    trace = tracing.new_trace_if_enabled()
+    released = False
+
+    def release_slot():
+        # Akış hiç başlamadan bağlantı koparsa generator'ın finally'si çalışmaz; yanıt bitince de serbest bırakılır
+        nonlocal released
+        if not released:
+            released = True
+            limiter.release()
+
+    async def events():
+        status = 200
+        try:
+            with tracing.use_trace(trace), tracing.span("request:ask_stream"):
+                async with asyncio.timeout(SERVER_REQUEST_TIMEOUT):
+                    async for event_type, payload in astream_answer(request.app.state.graph, _initial_state(request, body, trace)):
+                        if event_type == "token":
+                            event = {"type": "token", "text": payload}
+                        elif event_type == "reset":
+                            event = {"type": "reset"}
+                        else:
+                            _remember_turn(request, body, payload)
+                            event = {"type": "final", **_response_body(payload, trace)}
+                        yield json.dumps(event, ensure_ascii=False) + "\n"
+        except TimeoutError:
+            status = 504
+            logging.error(f"Hata: Akış {SERVER_REQUEST_TIMEOUT} sn içinde tamamlanamadı: {body.question[:100]}")
+            yield json.dumps({"type": "error", "detail": "İstek zaman aşımına uğradı."}, ensure_ascii=False) + "\n"
+        except asyncio.CancelledError:
+            # İstemci bağlantıyı kapattı
+            status = 499
+            raise
+        except Exception as e:
+            status = 500
+            logging.error(f"Hata: /ask/stream isteği işlenirken: {e}", exc_info=True)
+            yield json.dumps({"type": "error", "detail": "İsteğiniz işlenirken bir sorun oluştu."}, ensure_ascii=False) + "\n"
+        finally:
+            release_slot()
+            _count_request("ask_stream", status)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson", background=BackgroundTask(release_slot))
+
+
+@app.get("/health")
+async def health(request: Request):
+    limiter = request.app.state.limiter
+    if request.app.state.graph is None:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "error": request.app.state.startup_error})
+    pool = request.app.state.pool
+    if pool is None:
+        return {"status": "ok", **limiter.stats()}
+    pool_stats = pool.stats()
+    if not pool_stats["ready"]:
+        return JSONResponse(status_code=503, content={"status": "unavailable", **limiter.stats(), **pool_stats})
+    return {"status": "ok", **limiter.stats(), **pool_stats}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(tracing.metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("server:app", host=SERVER_HOST, port=SERVER_PORT)
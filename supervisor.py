@@ -1,25 +1,30 @@
 # supervisor.py
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm_gateway import get_chat_model, LLM_MODEL_NAME
 import os
 import logging
 import traceback
-import time
+import asyncio
+import threading
+from async_utils import run_sync
+import tracing
+from fast_router import fast_route
+from semantic_router import SemanticRouter, RoutingDecisionCache
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- LLM Ayarları ---
-# Yönlendirme için Flash modeli
-LLM_MODEL_NAME = "gemini-1.5-flash-latest"
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Hızlı yoldan sonra kullanılacak motor: "semantic" (embedding + örnekler, emin değilse LLM) veya "llm"
+ROUTER_ENGINE = os.getenv("ROUTER_ENGINE", "semantic").lower()
 
 # Yönlendirme LLM'i
 router_llm = None
 try:
-    router_llm = ChatGoogleGenerativeAI(model=LLM_MODEL_NAME, google_api_key=GOOGLE_API_KEY, temperature=0.1)
+    router_llm = get_chat_model(temperature=0.1)
     output_parser = StrOutputParser()
-    logging.info(f"Yönlendirme LLM'i başarıyla yüklendi: {LLM_MODEL_NAME}")
+    logging.info(f"Yönlendirme LLM'i hazır (istemci ilk çağrıda oluşturulur): {LLM_MODEL_NAME}")
 except Exception as e:
     logging.error(f"Yönlendirme LLM'i ({LLM_MODEL_NAME}) yüklenirken HATA: {e}", exc_info=True)
     raise RuntimeError("Yönlendirme LLM'i yüklenemedi.") from e
@@ -58,33 +63,94 @@ else:
     logging.error("Yönlendirme zinciri oluşturulamadı: Yönlendirme LLM'i yüklenemedi.")
 
 
+routing_decision_cache = RoutingDecisionCache()
+_semantic_router = None
+_semantic_router_lock = threading.Lock()
+
+def get_semantic_router():
+    """Semantik yönlendiriciyi ilk kullanımda oluşturur (embedding fonksiyonu utils'ten gelir)."""
+    global _semantic_router
+    if _semantic_router is None:
+        with _semantic_router_lock:
+            if _semantic_router is None:
+                from utils import get_embedding_function
+                _semantic_router = SemanticRouter(get_embedding_function())
+    return _semantic_router
+
+def _category_to_route(predicted_category):
+    cat_lower = predicted_category.lower().replace(" ", "").replace("/", "")
+
+    if "resmigazete" in cat_lower:
+        logging.info("Yönlendirme: Resmi Gazete Agent")
+        return "gazette_agent"
+    elif "habergenelbilgi" in cat_lower or "haber" in cat_lower or "genelbilgi" in cat_lower:
+         logging.info("Yönlendirme: Haber/Genel Bilgi Agent")
+         return "news_agent"
+    else:
+        logging.warning(f"Tahmin edilen kategori ('{predicted_category}') anlaşılamadı, Fallback Agent'a yönlendiriliyor.")
+        return "fallback_agent"
+
+def _semantic_route(question):
+    try:
+        route, margin = get_semantic_router().classify(question)
+    except Exception as e:
+        logging.error(f"Hata: Semantik yönlendirme başarısız, LLM kullanılacak: {e}", exc_info=True)
+        return None
+    if route:
+        logging.info(f"Semantik yönlendirme: {route} (fark: {margin:.3f})")
+    else:
+        logging.info(f"Semantik yönlendirme kararsız (fark: {margin:.3f}), LLM'e soruluyor.")
+    return route
+
 def route_question(state: dict):
-    """Gelen soruyu LLM kullanarak sınıflandırır ve ilgili agent'a yönlendirir."""
+    """Senkron yönlendirme (aroute_question'ın sarmalayıcısı)."""
+    return run_sync(aroute_question(state))
+
+async def aroute_question(state: dict):
+    """
+    Gelen soruyu sınıflandırır ve ilgili agent'a yönlendirir.
+    Sıra: anahtar kelime hızlı yolu -> karar önbelleği -> semantik yönlendirici -> LLM.
+    """
     logging.info("--- Supervisor (Yönlendirici) Çalışıyor ---")
     question = state.get("question")
 
+    # Hızlı yol: Anahtar kelimelerle net sınıflandırılabilen sorular için LLM çağrılmaz
+    if question:
+        fast_decision, confidence = fast_route(question)
+        if fast_decision:
+            logging.info(f"Hızlı yönlendirme (LLM'siz): {fast_decision} (güven: {confidence:.2f})")
+            tracing.set_on_current_span(tier="fast")
+            return fast_decision
+
+        cached_route = routing_decision_cache.get(question)
+        if cached_route:
+            logging.info(f"Yönlendirme önbellekten: {cached_route}")
+            tracing.set_on_current_span(tier="cache")
+            return cached_route
+        if ROUTER_ENGINE == "semantic":
+            # Embedding çağrısı senkron; event loop'u bloklamamak için thread'de çalıştır
+            with tracing.span("router_semantic") as semantic_span:
+                semantic_decision = await asyncio.to_thread(_semantic_route, question)
+                semantic_span.set(route=semantic_decision)
+            if semantic_decision:
+                routing_decision_cache.put(question, semantic_decision)
+                tracing.set_on_current_span(tier="semantic")
+                return semantic_decision
+
     if not router_chain or not question:
         logging.error(f"Yönlendirme yapılamıyor. Soru: {question is not None}, Router Chain: {router_chain is not None}")
         return "fallback_agent"
 
     logging.info(f"Soru sınıflandırılıyor: {question}")
     try:
-        time.sleep(0.5) # API Limiti
-        predicted_category = router_chain.invoke({"question": question})
+        with tracing.span("router_llm"):
+            predicted_category = await router_chain.ainvoke({"question": question})
         predicted_category = predicted_category.strip()
         logging.info(f"LLM Kategori Tahmini: '{predicted_category}'")
-
-        cat_lower = predicted_category.lower().replace(" ", "").replace("/", "")
-
-        if "resmigazete" in cat_lower:
-            logging.info("Yönlendirme: Resmi Gazete Agent")
-            return "gazette_agent"
-        elif "habergenelbilgi" in cat_lower or "haber" in cat_lower or "genelbilgi" in cat_lower:
-             logging.info("Yönlendirme: Haber/Genel Bilgi Agent")
-             return "news_agent"
-        else:
-            logging.warning(f"Tahmin edilen kategori ('{predicted_category}') anlaşılamadı, Fallback Agent'a yönlendiriliyor.")
-            return "fallback_agent"
+        route = _category_to_route(predicted_category)
+        routing_decision_cache.put(question, route)
+        tracing.set_on_current_span(tier="llm")
+        return route
     except Exception as e:
         logging.error(f"Hata: Yönlendirme sırasında LLM çağrısı başarısız: {e}", exc_info=True)
-        return "fallback_agent"
\ No newline at end of file
+        return "fallback_agent"
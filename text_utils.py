@@ -0,0 +1,27 @@
+# text_utils.py
+import re
+import unicodedata
+
+# Türkçe'ye özgü büyük/küçük harf dönüşümü: I -> ı, İ -> i
+_TR_LOWER_MAP = str.maketrans({"I": "ı", "İ": "i"})
+# Türkçe karakterleri ASCII karşılıklarına indirger (klavyesi Türkçe olmayan kullanıcılar için)
+_TR_FOLD_MAP = str.maketrans({"ı": "i", "ş": "s", "ğ": "g", "ü": "u", "ö": "o", "ç": "c", "â": "a", "î": "i", "û": "u"})
+_WHITESPACE_RE = re.compile(r"\s+")
+_PUNCT_RE = re.compile(r"[^\w\s.]")
+
+
+def turkish_lower(text):
+    """Metni Türkçe kurallarına göre küçük harfe çevirir."""
+    return unicodedata.normalize("NFC", text).translate(_TR_LOWER_MAP).lower()
+
+
+def fold_turkish(text):
+    """Küçük harfe çevirir ve Türkçe karakterleri ASCII karşılıklarına indirger."""
+    return turkish_lower(text).translate(_TR_FOLD_MAP)
+
+
+def normalize_question(question):
+    """Önbellek/eşleştirme anahtarı olarak kullanılacak normalize edilmiş soru metni."""
+    text = fold_turkish(question or "")
+    text = _PUNCT_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip(" .")
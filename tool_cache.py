@@ -0,0 +1,219 @@
+# tool_cache.py
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from text_utils import normalize_question
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Ayarlar ---
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() != "false"
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH", "./tool_cache.sqlite")
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "20000"))
+# Araç başına (taze süre, bayat kabul süresi) saniye cinsinden.
+# Taze süre içinde sonuç doğrudan döner; bayat süre içinde hemen döner ve arka planda yenilenir.
+TOOL_CACHE_TTLS = {
+    "wikipedia_search": (
+        int(os.getenv("WIKIPEDIA_CACHE_TTL", str(3 * 24 * 3600))),
+        int(os.getenv("WIKIPEDIA_CACHE_STALE_TTL", str(14 * 24 * 3600))),
+    ),
+    "web_search": (
+        int(os.getenv("TAVILY_CACHE_TTL", str(10 * 60))),
+        int(os.getenv("TAVILY_CACHE_STALE_TTL", str(30 * 60))),
+    ),
+}
+DEFAULT_TOOL_CACHE_TTL = (3600, 3600)
+# Aracın sonuç bulamadığında döndürdüğü metinler ve hata metinleri (ör. Tavily aracının döndürdüğü
+# "HTTPError(...)"). Geçici olabilecekleri için önbelleğe yazılmaz, önbellekte bulunursa yok sayılır.
+TOOL_MISS_MARKERS = ("No good Wikipedia Search Result", "Did not find results")
+_TOOL_ERROR_RE = re.compile(r"^\s*\w*(Error|Exception)\(")
+
+
+class ToolResultCache:
+    """
+    Araç (Wikipedia, Tavily) sonuçlarını normalize edilmiş sorguya göre saklayan SQLite önbellek.
+    Araç başına TTL, bayat-iken-yenile (stale-while-revalidate) ve LRU ile sınırlı boyut destekler.
+    """
+
+    def __init__(self, path=TOOL_CACHE_PATH, max_entries=TOOL_CACHE_MAX_ENTRIES, ttls=None):
+        self.max_entries = max_entries
+        self.ttls = ttls or TOOL_CACHE_TTLS
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tool_results ("
+            " tool TEXT, key TEXT, value TEXT, created REAL, last_used REAL, PRIMARY KEY (tool, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tool_results_last_used ON tool_results(last_used)")
+
+    def _ttl(self, tool):
+        return self.ttls.get(tool, DEFAULT_TOOL_CACHE_TTL)
+
+    def get(self, tool, query):
+        """(değer, bayat_mı) döndürür; kayıt yoksa veya bayat süresi de geçmişse (None, False)."""
+        key = normalize_question(query)
+        fresh_ttl, stale_ttl = self._ttl(tool)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM tool_results WHERE tool = ? AND key = ?", (tool, key)
+            ).fetchone()
+            if row is None or now - row[1] > stale_ttl:
+                self.stats["misses"] += 1
+                return None, False
+            self._conn.execute("UPDATE tool_results SET last_used = ? WHERE tool = ? AND key = ?", (now, tool, key))
+        stale = now - row[1] > fresh_ttl
+        self.stats["stale_hits" if stale else "hits"] += 1
+        return json.loads(row[0]), stale
+
+    def put(self, tool, query, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tool_results (tool, key, value, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (tool, normalize_question(query), json.dumps(value, ensure_ascii=False), now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM tool_results").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM tool_results WHERE rowid IN (SELECT rowid FROM tool_results ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def close(self):
+        self._conn.close()
+
+
+class CachedTool:
+    """
+    LangChain Tool'u önbellekle saran katman; agents.py'nin kullandığı run/arun/invoke/ainvoke arayüzünü sunar.
+    Bayat bir sonuç hemen döner, aynı sorgu için tek bir arka plan yenilemesi başlatılır.
+    """
+
+    def __init__(self, tool, cache):
+        self.tool = tool
+        self.cache = cache
+        self.name = tool.name
+        self.description = tool.description
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self._background_tasks = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"{self.name}-refresh")
+
+    @staticmethod
+    def _cacheable(value):
+        if value is None or value == "" or value == []:
+            return False
+        if isinstance(value, str):
+            return not (any(marker in value for marker in TOOL_MISS_MARKERS) or _TOOL_ERROR_RE.match(value))
+        return True
+
+    def _claim_refresh(self, query):
+        key = normalize_question(query)
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return None
+            self._refreshing.add(key)
+            return key
+
+    def _release_refresh(self, key):
+        with self._refresh_lock:
+            self._refreshing.discard(key)
+
+    # --- Senkron ---
+    def _fetch(self, query):
+        value = self.tool.invoke(query)
+        if self._cacheable(value):
+            self.cache.put(self.name, query, value)
+        return value
+
+    def _refresh(self, key, query):
+        try:
+            self._fetch(query)
+            self.cache.stats["refreshes"] += 1
+        except Exception as e:
+            logging.warning(f"Araç önbelleği: '{self.name}' arka plan yenilemesi başarısız: {e}")
+        finally:
+            self._release_refresh(key)
+
+    def invoke(self, query, config=None, **kwargs):
+        value, stale = self.cache.get(self.name, query)
+        if not self._cacheable(value):
+            return self._fetch(query)
+        if stale:
+            key = self._claim_refresh(query)
+            if key is not None:
+                logging.info(f"Araç önbelleği: '{self.name}' için bayat sonuç döndü, arka planda yenileniyor.")
+                self._executor.submit(self._refresh, key, query)
+        return value
+
+    def run(self, query, **kwargs):
+        return self.invoke(query)
+
+    # --- Async ---
+    async def _afetch(self, query):
+        value = await self.tool.ainvoke(query)
+        if self._cacheable(value):
+            await asyncio.to_thread(self.cache.put, self.name, query, value)
+        return value
+
+    async def _arefresh(self, key, query):
+        try:
+            await self._afetch(query)
+            self.cache.stats["refreshes"] += 1
+        except Exception as e:
+            logging.warning(f"Araç önbelleği: '{self.name}' arka plan yenilemesi başarısız: {e}")
+        finally:
+            self._release_refresh(key)
+
+    async def ainvoke(self, query, config=None, **kwargs):
+        value, stale = await asyncio.to_thread(self.cache.get, self.name, query)
+        if not self._cacheable(value):
+            return await self._afetch(query)
+        if stale:
+            key = self._claim_refresh(query)
+            if key is not None:
+                logging.info(f"Araç önbelleği: '{self.name}' için bayat sonuç döndü, arka planda yenileniyor.")
+                task = asyncio.create_task(self._arefresh(key, query))
+                # Görev referansı tutulmazsa çöp toplayıcı tarafından yarıda kesilebilir
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+        return value
+
+    async def arun(self, query, **kwargs):
+        return await self.ainvoke(query)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_tool_cache():
+    """Süreç genelinde paylaşılan araç önbelleği."""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = ToolResultCache()
+    return _shared_cache
+
+
+def with_tool_cache(tool):
+    """TOOL_CACHE_ENABLED açıksa aracı önbellekli sarmalayıcıyla döndürür."""
+    if tool is None or not TOOL_CACHE_ENABLED:
+        return tool
+    try:
+        return CachedTool(tool, get_tool_cache())
+    except Exception as e:
+        logging.error(f"Hata: Araç önbelleği oluşturulamadı, '{tool.name}' önbelleksiz kullanılacak: {e}", exc_info=True)
+        return tool
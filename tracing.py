@@ -0,0 +1,244 @@
+# tracing.py
+import os
+import time
+import asyncio
+import threading
+import logging
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Ayarlar ---
+# true ise her istek için span listesi (Trace) son state'e "trace" olarak eklenir
+TRACE_REQUESTS = os.getenv("TRACE_REQUESTS", "false").lower() == "true"
+# Streamlit gibi HTTP sunucusu olmayan arayüzlerde /metrics'i ayrı porttan sunmak için (boş: kapalı)
+METRICS_PORT = os.getenv("METRICS_PORT", "")
+METRICS_PREFIX = "chatbot"
+# Süre histogramı kovaları (saniye)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Span:
+    """Tek bir adımın (graf node'u, LLM çağrısı, vektör araması, araç çağrısı) süresi ve nitelikleri."""
+
+    def __init__(self, name, attributes=None, parent=None):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.outcome = "ok"
+        self.started = time.time()
+        self._perf_start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **counts):
+        """Sayısal nitelikleri artırır (ör. aynı span içindeki birden fazla LLM çağrısının token'ları)."""
+        for key, value in counts.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._perf_start
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "parent": self.parent.name if self.parent else None,
+            "start": self.started,
+            "duration_ms": round((self.duration or 0.0) * 1000, 2),
+            "outcome": self.outcome,
+            **self.attributes,
+        }
+
+
+class Trace:
+    """Bir isteğe ait tamamlanmış span'ların listesi (tamamlanma sırasıyla)."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            return [span.to_dict() for span in self.spans]
+
+    def summary(self):
+        """Span adı -> toplam süre (ms); yavaş bir cevabın adımlara dağılımını görmek için."""
+        totals = {}
+        for span in self.to_dict():
+            totals[span["name"]] = round(totals.get(span["name"], 0.0) + span["duration_ms"], 2)
+        return totals
+
+
+class MetricsRegistry:
+    """Span'lardan beslenen süre histogramları ve sayaçlar; Prometheus metin formatında dışa aktarılır."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}  # (span, outcome) -> [kova sayıları, toplam, adet]
+        self._counters = {}    # (metrik adı, etiketler) -> değer
+
+    def observe_span(self, span):
+        key = (span.name, span.outcome)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if span.duration <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += span.duration
+            histogram[2] += 1
+        for attribute, metric, extra in (("prompt_tokens", "llm_tokens_total", (("direction", "prompt"),)),
+                                         ("output_tokens", "llm_tokens_total", (("direction", "output"),)),
+                                         ("documents", "retrieved_documents_total", ())):
+            value = span.attributes.get(attribute)
+            if value:
+                self.inc(metric, value, (("span", span.name),) + extra)
+
+    def inc(self, metric, value=1, labels=()):
+        key = (metric, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def render_prometheus(self):
+        lines = []
+        name = f"{METRICS_PREFIX}_span_duration_seconds"
+        with self._lock:
+            histograms = {key: (list(value[0]), value[1], value[2]) for key, value in self._histograms.items()}
+            counters = dict(self._counters)
+        lines.append(f"# HELP {name} Graf node'ları ve dış çağrıların süresi.")
+        lines.append(f"# TYPE {name} histogram")
+        for (span_name, outcome), (bucket_counts, total, count) in sorted(histograms.items()):
+            labels = f'span="{_escape(span_name)}",outcome="{_escape(outcome)}"'
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+        seen = set()
+        for (metric, labels), value in sorted(counters.items()):
+            full_name = f"{METRICS_PREFIX}_{metric}"
+            if full_name not in seen:
+                lines.append(f"# TYPE {full_name} counter")
+                seen.add(full_name)
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+            lines.append(f"{full_name}{{{label_text}}} {value}" if label_text else f"{full_name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+metrics = MetricsRegistry()
+
+
+# --- Span API ---
+@contextmanager
+def span(name, **attributes):
+    """Bir adımı ölçer; süre metriklere ve (varsa) aktif isteğin trace'ine eklenir."""
+    current = Span(name, attributes, parent=_current_span.get())
+    token = _current_span.set(current)
+    try:
+        yield current
+    except asyncio.CancelledError:
+        current.outcome = "cancelled"
+        raise
+    except BaseException as e:
+        current.outcome = "error"
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+        metrics.observe_span(current)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(current)
+
+
+async def traced(name, awaitable, **attributes):
+    """Bir awaitable'ı span içinde bekler (asyncio.create_task ile paralel başlatılan çağrılar için)."""
+    with span(name, **attributes):
+        return await awaitable
+
+
+def current_span():
+    return _current_span.get()
+
+
+def add_to_current_span(**counts):
+    """Aktif span varsa sayısal nitelikleri artırır (ör. gateway'in ölçtüğü token sayıları)."""
+    current = _current_span.get()
+    if current is not None:
+        current.add(**counts)
+
+
+def set_on_current_span(**attributes):
+    """Aktif span varsa niteliklerini günceller (ör. yönlendirmenin hangi katmanda karara bağlandığı)."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+@contextmanager
+def use_trace(trace):
+    """Verilen Trace'i (None olabilir) bu blok içindeki span'ların hedefi yapar."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def new_trace_if_enabled():
+    return Trace() if TRACE_REQUESTS else None
+
+
+# --- /metrics sunucusu ---
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Metrikleri ayrı bir thread'de http://0.0.0.0:<port>/metrics adresinden sunar (bir kez başlatılır)."""
+    global _metrics_server
+    if not port:
+        return None
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            except OSError as e:
+                logging.error(f"Hata: Metrik sunucusu {port} portunda başlatılamadı: {e}")
+                return None
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+            logging.info(f"Prometheus metrikleri http://0.0.0.0:{port}/metrics adresinde.")
+    return _metrics_server
@@ -1,41 +1,77 @@
 # utils.py
 import os
+import json
+import time
 import shutil
-from langchain_community.document_loaders import PyPDFLoader
+import hashlib
+import itertools
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain.retrievers.multi_query import MultiQueryRetriever
-from langchain_google_genai import ChatGoogleGenerativeAI
+from llm_gateway import get_chat_model, get_embeddings, EMBEDDING_MODEL_NAME
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
-import google.generativeai as genai
 from dotenv import load_dotenv
 import logging
+from embedding_cache import CachedEmbeddings
+from answer_cache import invalidate_cached_answers
+from retrievers import FusionRetriever
+from lexical_index import LexicalIndex
+from metadata_index import MetadataIndex, annotate_chunks, fields_for_stored_chunks
+from vector_index import MmapVectorIndex, export_vector_index, manifest_signature, read_header
+
+try:
+    import fcntl
+except ImportError:  # Windows: kilit yok, tek süreçli kullanım varsayılır
+    fcntl = None
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY ortam değişkeni bulunamadı.")
-
-genai.configure(api_key=GOOGLE_API_KEY)
+# Not: GOOGLE_API_KEY import anında değil, llm_gateway ilk istemciyi oluştururken kontrol edilir.
+# Ağır kütüphaneler (Chroma, PDF yükleyici, MultiQueryRetriever) ilk kullanıldıkları fonksiyonda import edilir.
 
 # --- Ayarlar ---
 PDF_DATA_PATH = "data"
 CHROMA_PERSIST_DIR = "./chroma_data"
-EMBEDDING_MODEL_NAME = "models/embedding-001"
 CHUNK_SIZE = 750 
 CHUNK_OVERLAP = 150
 # MultiQuery'nin temelindeki her arama için getirilecek parça sayısı
 BASE_RETRIEVER_K = 8 
+# "fusion": alt sorgular + orijinal soru toplu embed, eşzamanlı arama, RRF ile birleştirme; "multiquery": eski davranış
+RETRIEVER_MODE = os.getenv("RETRIEVER_MODE", "fusion").lower()
+# RRF sonrası LLM'e gönderilecek en fazla parça sayısı
+FUSION_TOP_N = int(os.getenv("FUSION_TOP_N", "10"))
+# Hibrit arama: FusionRetriever'a BM25 (sözcüksel) sonuçlarını da ekler
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() != "false"
+LEXICAL_TOP_K = int(os.getenv("LEXICAL_TOP_K", "10"))
+# Sorudaki tarih/sayı/kanun numarası ile aramadan önce parça adaylarını daraltma (bkz. metadata_index.py)
+METADATA_FILTERING = os.getenv("METADATA_FILTERING", "true").lower() != "false"
+# Artımlı ingest için PDF hash'lerini ve chunk ID'lerini tutan manifest dosyası
+INGEST_MANIFEST_FILENAME = "ingest_manifest.json"
+INGEST_MANIFEST_VERSION = 1
+# Açılışta data/ klasörü ile vektör deposunu senkronize et (yeni/değişen/silinen PDF'ler)
+INGEST_ON_STARTUP = os.getenv("INGEST_ON_STARTUP", "true").lower() != "false"
+# Streaming ingest: PDF ayrıştırma process pool'da, Chroma'ya sabit boyutlu batch'ler halinde yazılır
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Mevcut depo açılırken geçici hatalarda (SQLite kilidi, G/Ç) deneme sayısı ve ilk bekleme (sn, her denemede iki katına çıkar)
+STORE_OPEN_RETRIES = int(os.getenv("STORE_OPEN_RETRIES", "3"))
+STORE_OPEN_RETRY_DELAY = float(os.getenv("STORE_OPEN_RETRY_DELAY", "1.0"))
+# Sunum için arama arka ucu: "chroma" veya "mmap" (Chroma'dan dışa aktarılan, mmap edilen float16/int8 matris)
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "chroma").lower()
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float16").lower()
+# Adayları float32 kopyayla yeniden skorla (diskte ek dosya; sadece aday satırlar belleğe sayfalanır)
+VECTOR_INDEX_RESCORE = os.getenv("VECTOR_INDEX_RESCORE", "true").lower() != "false"
+# Aynı metinler için embedding API'sini tekrar çağırmamak adına disk önbelleği
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "false"
 
 QUERY_GEN_LLM_MODEL = "gemini-1.5-flash-latest"
 query_gen_llm = None
 try:
-    query_gen_llm = ChatGoogleGenerativeAI(model=QUERY_GEN_LLM_MODEL, google_api_key=GOOGLE_API_KEY, temperature=0.1)
-    logging.info(f"Sorgu üretimi için LLM yüklendi: {QUERY_GEN_LLM_MODEL}")
+    query_gen_llm = get_chat_model(temperature=0.1, model=QUERY_GEN_LLM_MODEL)
+    logging.info(f"Sorgu üretimi için LLM hazır (istemci ilk çağrıda oluşturulur): {QUERY_GEN_LLM_MODEL}")
 except Exception as e:
     logging.error(f"Sorgu üretimi LLM'i ({QUERY_GEN_LLM_MODEL}) yüklenirken HATA: {e}", exc_info=True)
 
@@ -55,90 +91,578 @@ QUERY_PROMPT = PromptTemplate(input_variables=["question"],template=QUERY_PROMPT
 
 def get_embedding_function():
     logging.info(f"Embedding modeli yükleniyor: {EMBEDDING_MODEL_NAME}")
-    return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL_NAME, google_api_key=GOOGLE_API_KEY)
+    embeddings = get_embeddings(EMBEDDING_MODEL_NAME)
+    if EMBEDDING_CACHE_ENABLED:
+        return CachedEmbeddings(embeddings, EMBEDDING_MODEL_NAME)
+    return embeddings
+
+def _get_text_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+def _split_pdf(file_path):
+    """Tek bir PDF'i yükler, boş sayfaları atar ve parçalara böler."""
+    filename = os.path.basename(file_path)
+    from langchain_community.document_loaders import PyPDFLoader
+    loader = PyPDFLoader(file_path, extract_images=False)
+    loaded_docs = loader.load()
+    page_count = len(loaded_docs)
+    valid_docs = [doc for doc in loaded_docs if doc.page_content and doc.page_content.strip()]
+    if not valid_docs:
+        logging.warning(f"{filename} yüklendi ({page_count} sayfa) ancak içerik bulunamadı veya boş.")
+        return []
+    split_docs = _get_text_splitter().split_documents(valid_docs)
+    # Sayının künyesi (tarih, sayı), belge türü ve kanun numaraları parça metadata'sına yazılır
+    annotate_chunks(split_docs, valid_docs[0].page_content)
+    logging.info(f"{filename} yüklendi ({page_count} sayfa), {len(valid_docs)} geçerli sayfa, {len(split_docs)} parça.")
+    return split_docs
+
+def _list_pdfs(pdf_folder_path):
+    if not os.path.isdir(pdf_folder_path):
+        logging.warning(f"PDF klasörü bulunamadı: {pdf_folder_path}")
+        return []
+    return sorted(f for f in os.listdir(pdf_folder_path) if f.endswith(".pdf"))
+
+def _split_pdf_job(file_path):
+    """Process pool içinde çalışır; hata durumunda parçalar yerine None döner."""
+    try:
+        return file_path, _split_pdf(file_path)
+    except Exception as e:
+        logging.error(f"Hata: {os.path.basename(file_path)} yüklenirken sorun oluştu: {e}", exc_info=True)
+        return file_path, None
+
+def iter_split_pdfs(file_paths, workers=INGEST_WORKERS):
+    """
+    PDF'leri paralel olarak ayrıştırıp (file_path, parçalar) çiftlerini giriş sırasıyla üretir.
+    Aynı anda en fazla 2 * workers dosyanın parçaları bellekte tutulur.
+    """
+    if workers <= 1:
+        for file_path in file_paths:
+            yield _split_pdf_job(file_path)
+        return
+
+    paths = iter(file_paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque(executor.submit(_split_pdf_job, p) for p in itertools.islice(paths, workers * 2))
+        while in_flight:
+            result = in_flight.popleft().result()
+            next_path = next(paths, None)
+            if next_path is not None:
+                in_flight.append(executor.submit(_split_pdf_job, next_path))
+            yield result
 
 def load_and_split_pdfs(pdf_folder_path):
     
-    documents = []
     logging.info(f"PDF'ler yükleniyor: {pdf_folder_path}")
-    valid_doc_count = 0
-    total_pages = 0
-    for filename in os.listdir(pdf_folder_path):
-        if filename.endswith(".pdf"):
-            file_path = os.path.join(pdf_folder_path, filename)
-            try:
-                loader = PyPDFLoader(file_path, extract_images=False)
-                loaded_docs = loader.load()
-                page_count = len(loaded_docs)
-                total_pages += page_count
-                current_valid_docs = [doc for doc in loaded_docs if doc.page_content and doc.page_content.strip()]
-                if current_valid_docs:
-                    documents.extend(current_valid_docs)
-                    logging.info(f"{filename} yüklendi ({page_count} sayfa), {len(current_valid_docs)} geçerli sayfa bulundu.")
-                    valid_doc_count += len(current_valid_docs)
-                else:
-                    logging.warning(f"{filename} yüklendi ({page_count} sayfa) ancak içerik bulunamadı veya boş.")
-            except Exception as e:
-                logging.error(f"Hata: {filename} yüklenirken sorun oluştu: {e}", exc_info=True)
-
-    if not documents:
+    file_paths = [os.path.join(pdf_folder_path, filename) for filename in _list_pdfs(pdf_folder_path)]
+    split_docs = []
+    for _, docs in iter_split_pdfs(file_paths):
+        split_docs.extend(docs or [])
+
+    if not split_docs:
         logging.warning("Hiçbir PDF belgesi yüklenemedi veya içerikleri boş.")
         return []
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        length_function=len,
-        is_separator_regex=False,
-    )
-    split_docs = text_splitter.split_documents(documents)
-    logging.info(f"Toplam {total_pages} sayfa ({valid_doc_count} geçerli sayfa), {len(split_docs)} parçaya bölündü (Chunk Size: {CHUNK_SIZE}, Overlap: {CHUNK_OVERLAP}).")
+    logging.info(f"Toplam {len(split_docs)} parça oluşturuldu (Chunk Size: {CHUNK_SIZE}, Overlap: {CHUNK_OVERLAP}).")
     return split_docs
 
+# --- Artımlı Ingest (Manifest) ---
+def _file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _manifest_path(persist_directory):
+    return os.path.join(persist_directory, INGEST_MANIFEST_FILENAME)
+
+def _ingest_settings():
+    """Değişirse tüm arşivin yeniden embed edilmesini gerektiren ayarlar."""
+    return {
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+
+def _empty_manifest():
+    return {"version": INGEST_MANIFEST_VERSION, "settings": _ingest_settings(), "files": {}, "pending": {}}
+
+def load_manifest(persist_directory=CHROMA_PERSIST_DIR):
+    path = _manifest_path(persist_directory)
+    if not os.path.exists(path):
+        return _empty_manifest()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ingest manifest okunamadı ({path}): {e}. Boş manifest ile devam ediliyor.")
+        return _empty_manifest()
+    if manifest.get("version") != INGEST_MANIFEST_VERSION or manifest.get("settings") != _ingest_settings():
+        logging.warning("Ingest ayarları (model/chunk) değişmiş, tüm PDF'ler yeniden işlenecek.")
+        stale = _empty_manifest()
+        # Eski chunk'ların silinebilmesi için ID'leri koru
+        stale["files"] = {name: {"sha256": None, "chunk_ids": entry.get("chunk_ids", [])}
+                          for name, entry in manifest.get("files", {}).items()}
+        return stale
+    return manifest
+
+def save_manifest(manifest, persist_directory=CHROMA_PERSIST_DIR):
+    os.makedirs(persist_directory, exist_ok=True)
+    path = _manifest_path(persist_directory)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+def _chunk_ids_for(file_sha, count):
+    return [f"{file_sha[:16]}-{i}" for i in range(count)]
+
+def _delete_chunks(vector_store, chunk_ids=None, source=None):
+    """Verilen ID'lere veya kaynak PDF yoluna ait chunk'ları koleksiyondan siler."""
+    ids = list(chunk_ids or [])
+    if source:
+        # Manifest'ten önceki (rastgele ID'li) kayıtları da temizle
+        ids.extend(vector_store.get(where={"source": source}, include=[])["ids"])
+    ids = list(dict.fromkeys(ids))
+    if ids:
+        vector_store.delete(ids=ids)
+    return len(ids)
+
+def _scan_pdf_folder(pdf_folder, manifest):
+    """data/ klasöründeki PDF'leri manifest ile karşılaştırır: (değişenler, silinenler)."""
+    current = {}
+    for filename in _list_pdfs(pdf_folder):
+        file_path = os.path.join(pdf_folder, filename)
+        stat = os.stat(file_path)
+        entry = manifest["files"].get(filename)
+        # Boyut ve mtime aynıysa dosyayı yeniden hash'lemeye gerek yok
+        if entry and entry.get("sha256") and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+            current[filename] = entry["sha256"]
+        else:
+            current[filename] = _file_sha256(file_path)
+    changed = [name for name, sha in current.items() if manifest["files"].get(name, {}).get("sha256") != sha]
+    removed = [name for name in {**manifest["files"], **manifest.get("pending", {})} if name not in current]
+    return current, changed, removed
+
+def _iter_changed_chunks(vector_store, pdf_folder, manifest, current, changed, stats):
+    """
+    Değişen PDF'lerin parçalarını (filename, index, doc) olarak akıtır.
+    Yarıda kalmış bir ingest'te zaten yazılmış batch'ler atlanır.
+    """
+    pending = manifest["pending"]
+    file_paths = [os.path.join(pdf_folder, filename) for filename in changed]
+    for file_path, split_docs in iter_split_pdfs(file_paths):
+        filename = os.path.basename(file_path)
+        if split_docs is None:
+            stats["failed"] += 1
+            continue
+        file_sha = current[filename]
+        resume = pending.get(filename)
+        if resume and resume.get("sha256") == file_sha and resume.get("total") == len(split_docs):
+            start = resume["committed"]
+            logging.info(f"{filename}: yarıda kalan ingest {start}/{len(split_docs)} parçadan devam ediyor.")
+        else:
+            old_entry = manifest["files"].get(filename)
+            stats["chunks_removed"] += _delete_chunks(vector_store, (old_entry or {}).get("chunk_ids"), file_path)
+            pending[filename] = {"sha256": file_sha, "total": len(split_docs), "committed": 0, "replaces": old_entry is not None}
+            start = 0
+        chunk_ids = _chunk_ids_for(file_sha, len(split_docs))
+        for index in range(start, len(split_docs)):
+            doc = split_docs[index]
+            doc.metadata["chunk_id"] = chunk_ids[index]
+            yield filename, index, doc
+        if not split_docs:
+            # Boş PDF: yazılacak parça yok, doğrudan tamamlandı say
+            yield filename, -1, None
+
+def _commit_batch(vector_store, pdf_folder, persist_directory, manifest, batch, stats):
+    """Bir batch'i Chroma'ya yazar, manifest'teki ilerlemeyi günceller ve kaydeder."""
+    docs = [doc for _, _, doc in batch if doc is not None]
+    if docs:
+        vector_store.add_documents(documents=docs, ids=[doc.metadata["chunk_id"] for doc in docs])
+        stats["chunks_added"] += len(docs)
+    pending = manifest["pending"]
+    for filename, index, _ in batch:
+        pending[filename]["committed"] = max(pending[filename]["committed"], index + 1)
+    for filename in dict.fromkeys(filename for filename, _, _ in batch):
+        entry = pending[filename]
+        if entry["committed"] < entry["total"]:
+            continue
+        stat = os.stat(os.path.join(pdf_folder, filename))
+        manifest["files"][filename] = {"sha256": entry["sha256"], "size": stat.st_size, "mtime": stat.st_mtime,
+                                       "chunk_ids": _chunk_ids_for(entry["sha256"], entry["total"])}
+        stats["updated" if entry["replaces"] else "added"] += 1
+        del pending[filename]
+    save_manifest(manifest, persist_directory)
+
+def _stream_changed_pdfs(vector_store, pdf_folder, persist_directory, manifest, current, changed, stats):
+    manifest.setdefault("pending", {})
+    chunks = _iter_changed_chunks(vector_store, pdf_folder, manifest, current, changed, stats)
+    while True:
+        batch = list(itertools.islice(chunks, INGEST_BATCH_SIZE))
+        if not batch:
+            break
+        try:
+            _commit_batch(vector_store, pdf_folder, persist_directory, manifest, batch, stats)
+        except Exception as e:
+            logging.error(f"Hata: Batch vektör deposuna yazılırken sorun oluştu: {e}. Ingest durduruluyor, sonraki çalıştırmada kaldığı yerden devam edecek.", exc_info=True)
+            chunks.close()
+            return
+        logging.info(f"Ingest ilerlemesi: {stats['chunks_added']} parça yazıldı.")
+
+def sync_vector_store(vector_store, pdf_folder=PDF_DATA_PATH, persist_directory=CHROMA_PERSIST_DIR):
+    """
+    Vektör deposunu data/ klasörüyle artımlı olarak senkronize eder.
+    Sadece yeni/değişen PDF'ler bölünüp embed edilir, silinen PDF'lerin chunk'ları kaldırılır.
+    Parçalar process pool'dan akarak INGEST_BATCH_SIZE'lık batch'ler halinde yazılır.
+    """
+    manifest = load_manifest(persist_directory)
+    current, changed, removed = _scan_pdf_folder(pdf_folder, manifest)
+    stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": len(current) - len(changed), "chunks_added": 0, "chunks_removed": 0, "failed": 0}
+    if not changed and not removed:
+        logging.info(f"Vektör deposu güncel ({len(current)} PDF), embed edilecek yeni belge yok.")
+        sync_lexical_index(vector_store, persist_directory)
+        sync_metadata_index(vector_store, persist_directory)
+        sync_vector_index(vector_store, persist_directory)
+        return stats
+
+    logging.info(f"Artımlı ingest: {len(changed)} yeni/değişen, {len(removed)} silinen PDF.")
+    for filename in removed:
+        entry = manifest["files"].pop(filename, None) or {}
+        manifest.get("pending", {}).pop(filename, None)
+        try:
+            stats["chunks_removed"] += _delete_chunks(vector_store, entry.get("chunk_ids"), os.path.join(pdf_folder, filename))
+            stats["removed"] += 1
+            logging.info(f"{filename} arşivden kaldırıldı.")
+        except Exception as e:
+            logging.error(f"Hata: {filename} chunk'ları silinirken: {e}", exc_info=True)
+        save_manifest(manifest, persist_directory)
+
+    if changed:
+        _stream_changed_pdfs(vector_store, pdf_folder, persist_directory, manifest, current, changed, stats)
+
+    logging.info(f"Artımlı ingest tamamlandı: {stats}")
+    sync_lexical_index(vector_store, persist_directory)
+    sync_metadata_index(vector_store, persist_directory)
+    sync_vector_index(vector_store, persist_directory)
+    if stats["chunks_added"] or stats["chunks_removed"]:
+        # Arşiv değişti: önbellekteki Resmi Gazete cevapları artık eskimiş olabilir
+        invalidate_cached_answers("gazette_agent")
+    return stats
+
+# --- Mmap vektör indeksi (sunum) ---
+_vector_indexes = {}
+
+def _use_mmap_index():
+    return VECTOR_INDEX_BACKEND == "mmap" and RETRIEVER_MODE == "fusion"
+
+def _vector_index_is_fresh(persist_directory):
+    header = read_header(persist_directory)
+    if not header:
+        return False
+    manifest = load_manifest(persist_directory)
+    return (header.get("signature") == manifest_signature(manifest) and header.get("dtype") == VECTOR_INDEX_DTYPE
+            and header.get("embedding_model") == EMBEDDING_MODEL_NAME and header.get("float32") == VECTOR_INDEX_RESCORE)
+
+def sync_vector_index(vector_store, persist_directory=CHROMA_PERSIST_DIR, force=False):
+    """
+    VECTOR_INDEX_BACKEND=mmap ise Chroma koleksiyonunu mmap indeksine dışa aktarır.
+    İndeks manifest imzasıyla eşleşiyorsa (ingest'ten beri değişiklik yoksa) dokunulmaz.
+    """
+    if not (_use_mmap_index() or force):
+        return False
+    if not force and _vector_index_is_fresh(persist_directory):
+        return False
+    try:
+        signature = manifest_signature(load_manifest(persist_directory))
+        count = export_vector_index(vector_store, persist_directory, signature, EMBEDDING_MODEL_NAME,
+                                    dtype=VECTOR_INDEX_DTYPE, keep_float32=VECTOR_INDEX_RESCORE)
+        _vector_indexes.pop(persist_directory, None)
+        logging.info(f"Mmap vektör indeksi yazıldı: {count} parça ({VECTOR_INDEX_DTYPE}, float32 yeniden skorlama={VECTOR_INDEX_RESCORE}).")
+        return True
+    except Exception as e:
+        logging.error(f"Hata: Mmap vektör indeksi dışa aktarılırken: {e}", exc_info=True)
+        return False
+
+def get_vector_index(persist_directory=CHROMA_PERSIST_DIR, embeddings=None):
+    """Persist klasörüne ait mmap indeksini (ilk çağrıda açarak) döndürür; yoksa None."""
+    index = _vector_indexes.get(persist_directory)
+    if index is None:
+        index = MmapVectorIndex.load(persist_directory, embeddings=embeddings, rescore=VECTOR_INDEX_RESCORE)
+        if index is not None:
+            _vector_indexes[persist_directory] = index
+    elif embeddings is not None and index.embeddings is None:
+        index.embeddings = embeddings
+    return index
+
+# --- Sözcüksel (BM25) indeks ---
+_lexical_indexes = {}
+
+def get_lexical_index(persist_directory=CHROMA_PERSIST_DIR):
+    """Persist klasörüne ait BM25 indeksini (ilk çağrıda diskten) döndürür."""
+    if persist_directory not in _lexical_indexes:
+        _lexical_indexes[persist_directory] = LexicalIndex.load(persist_directory)
+    return _lexical_indexes[persist_directory]
+
+def sync_lexical_index(vector_store, persist_directory=CHROMA_PERSIST_DIR):
+    """
+    BM25 indeksini manifest ile eşler: sha'sı değişen dosyaların parçaları Chroma'dan okunup
+    yeniden indekslenir, manifestte olmayan dosyalar çıkarılır. Embedding çağrısı yapılmaz.
+    """
+    manifest = load_manifest(persist_directory)
+    index = get_lexical_index(persist_directory)
+    files = manifest["files"]
+    stale = [name for name, entry in files.items() if index.files.get(name) != entry["sha256"]]
+    removed = [name for name in index.files if name not in files]
+    if not stale and not removed:
+        return index
+    try:
+        for filename in removed:
+            index.remove_file(filename)
+        for filename in stale:
+            entry = files[filename]
+            chunk_ids = entry.get("chunk_ids") or []
+            chunks = []
+            for start in range(0, len(chunk_ids), INGEST_BATCH_SIZE * 8):
+                result = vector_store.get(ids=chunk_ids[start:start + INGEST_BATCH_SIZE * 8], include=["documents"])
+                chunks.extend(zip(result["ids"], result["documents"]))
+            index.add_file(filename, entry["sha256"], chunks)
+        index.save(persist_directory)
+        logging.info(f"Sözcüksel indeks güncellendi: {len(stale)} dosya indekslendi, {len(removed)} dosya çıkarıldı.")
+    except Exception as e:
+        logging.error(f"Hata: Sözcüksel indeks güncellenirken: {e}", exc_info=True)
+    return index
+
+# --- Metadata (tarih/sayı/kanun no) indeksi ---
+_metadata_indexes = {}
+
+def get_metadata_index(persist_directory=CHROMA_PERSIST_DIR):
+    """Persist klasörüne ait metadata indeksini (ilk çağrıda diskten) döndürür."""
+    if persist_directory not in _metadata_indexes:
+        _metadata_indexes[persist_directory] = MetadataIndex.load(persist_directory)
+    return _metadata_indexes[persist_directory]
+
+def sync_metadata_index(vector_store, persist_directory=CHROMA_PERSIST_DIR):
+    """
+    Metadata indeksini manifest ile eşler (sözcüksel indeksle aynı şekilde): sha'sı değişen dosyaların
+    parça metadata'sı vektör deposundan okunur. Embedding çağrısı yapılmaz.
+    """
+    if not METADATA_FILTERING:
+        return None
+    manifest = load_manifest(persist_directory)
+    index = get_metadata_index(persist_directory)
+    files = manifest["files"]
+    stale = [name for name, entry in files.items() if index.files.get(name) != entry["sha256"]]
+    removed = [name for name in index.files if name not in files]
+    if not stale and not removed:
+        return index
+    try:
+        for filename in removed:
+            index.remove_file(filename)
+        for filename in stale:
+            entry = files[filename]
+            chunk_ids = entry.get("chunk_ids") or []
+            ids, texts, metadatas = [], [], []
+            for start in range(0, len(chunk_ids), INGEST_BATCH_SIZE * 8):
+                result = vector_store.get(ids=chunk_ids[start:start + INGEST_BATCH_SIZE * 8], include=["documents", "metadatas"])
+                ids.extend(result["ids"])
+                texts.extend(result["documents"])
+                metadatas.extend(result["metadatas"])
+            order = {chunk_id: i for i, chunk_id in enumerate(chunk_ids)}
+            rows = sorted(zip(ids, texts, metadatas), key=lambda row: order.get(row[0], 0))
+            index.add_file(filename, entry["sha256"], fields_for_stored_chunks(*zip(*rows)) if rows else [])
+        index.save(persist_directory)
+        logging.info(f"Metadata indeksi güncellendi: {len(stale)} dosya indekslendi, {len(removed)} dosya çıkarıldı.")
+    except Exception as e:
+        logging.error(f"Hata: Metadata indeksi güncellenirken: {e}", exc_info=True)
+    return index
+
+def _manifest_chunk_count(persist_directory):
+    """Manifest'e göre depoda olması gereken parça sayısı (manifest yoksa/okunamazsa None)."""
+    try:
+        with open(_manifest_path(persist_directory), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return sum(len(entry.get("chunk_ids") or []) for entry in manifest.get("files", {}).values())
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class EmbeddingModelMismatch(ValueError):
+    """Depo başka bir embedding modeliyle oluşturulmuş; vektörleri kullanılamaz, depo yeniden oluşturulmalıdır."""
+
+
+def validate_vector_store(vector_store, persist_directory=CHROMA_PERSIST_DIR):
+    """
+    Mevcut depoyu embedding (ağ) çağrısı yapmadan doğrular: koleksiyon metadata'sındaki embedding modeli,
+    yerel parça sayısı ve manifest ile tutarlılık. Model uyuşmazsa EmbeddingModelMismatch fırlatır;
+    depo okunamazsa Chroma/SQLite hatası olduğu gibi yükselir. Parça sayısını döndürür.
+    """
+    collection = vector_store._collection
+    stored_model = (collection.metadata or {}).get("embedding_model")
+    if stored_model and stored_model != EMBEDDING_MODEL_NAME:
+        raise EmbeddingModelMismatch(f"Koleksiyon '{stored_model}' ile oluşturulmuş, beklenen model '{EMBEDDING_MODEL_NAME}'.")
+    count = collection.count()
+    expected = _manifest_chunk_count(persist_directory)
+    if count:
+        # Parçaların yerel olarak okunabildiğini kontrol et (embedding gerekmez)
+        vector_store.get(limit=1, include=["metadatas"])
+    if expected is not None and count != expected:
+        logging.warning(f"Vektör deposunda {count} parça var, manifest {expected} bekliyor; ingest senkronizasyonu düzeltecek.")
+    return count
+
+def _open_existing_store(persist_directory, embedding_func):
+    """Mevcut depoyu açıp doğrular: (depo, parça sayısı). Geçici hatalarda artan beklemeyle tekrar dener."""
+    for attempt in range(1, STORE_OPEN_RETRIES + 1):
+        try:
+            vector_store = _open_chroma(persist_directory, embedding_func)
+            return vector_store, validate_vector_store(vector_store, persist_directory)
+        except EmbeddingModelMismatch:
+            raise
+        except Exception as e:
+            if attempt >= STORE_OPEN_RETRIES:
+                raise
+            delay = STORE_OPEN_RETRY_DELAY * 2 ** (attempt - 1)
+            logging.warning(f"Mevcut vektör veritabanı açılamadı ({e}); {delay:.1f} sn sonra tekrar denenecek ({attempt}/{STORE_OPEN_RETRIES}).")
+            time.sleep(delay)
+
+def _open_chroma(persist_directory, embedding_func, collection_metadata=None):
+    from langchain_chroma import Chroma
+    return Chroma(persist_directory=persist_directory, embedding_function=embedding_func,
+                  collection_metadata=collection_metadata)
+
+def _reset_chroma_clients():
+    # Chroma istemcileri süreç içinde paylaşılır; klasör silinmeden önce bırakılmazsa yeni depo eski bağlantıya yazar
+    from chromadb.api.client import SharedSystemClient
+    SharedSystemClient.clear_system_cache()
+
+@contextmanager
+def _store_lock(persist_directory):
+    """
+    Aynı persist klasörünü paylaşan süreçler (ör. aynı volume'u bağlayan iki container) depoyu aynı anda
+    oluşturmasın/ingest etmesin diye dosya kilidi. Kilit dosyası klasörün yanındadır; klasörün var olup
+    olmadığı (yeni depo kararı) kilit alınınca kontrol edilir.
+    """
+    if fcntl is None:
+        yield
+        return
+    lock_path = os.path.abspath(persist_directory).rstrip(os.sep) + ".lock"
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 def create_or_load_vector_store(persist_directory=CHROMA_PERSIST_DIR, pdf_folder=PDF_DATA_PATH, force_recreate=False):
+    """Vektör deposunu açar (gerekirse oluşturur ve ingest eder); başka bir süreç ingest ediyorsa onun bitmesini bekler."""
+    with _store_lock(persist_directory):
+        return _create_or_load_vector_store(persist_directory, pdf_folder, force_recreate)
+
+def _create_or_load_vector_store(persist_directory=CHROMA_PERSIST_DIR, pdf_folder=PDF_DATA_PATH, force_recreate=False):
     
     embedding_func = get_embedding_function()
     vector_store = None
+    if _use_mmap_index() and not INGEST_ON_STARTUP and not force_recreate and _vector_index_is_fresh(persist_directory):
+        # Sunum modu: ingest yapılmayacaksa Chroma hiç açılmaz, güncel mmap indeksi doğrudan kullanılır
+        index = get_vector_index(persist_directory, embeddings=embedding_func)
+        if index is not None:
+            logging.info(f"Mmap vektör indeksi yüklendi: {len(index)} parça ({index.header['dtype']}).")
+            if HYBRID_RETRIEVAL:
+                sync_lexical_index(index, persist_directory)
+            sync_metadata_index(index, persist_directory)
+            return index
     if os.path.exists(persist_directory) and not force_recreate:
         logging.info(f"Mevcut vektör veritabanı yükleniyor: {persist_directory}")
         try:
-            vector_store = Chroma(persist_directory=persist_directory, embedding_function=embedding_func)
-            vector_store.similarity_search("test", k=1)
-            logging.info("Mevcut Vektör veritabanı başarıyla yüklendi ve doğrulandı.")
+            vector_store, count = _open_existing_store(persist_directory, embedding_func)
+        except EmbeddingModelMismatch as e:
+            # Vektörler başka modelle üretilmiş; sadece bu durumda depo silinip arşiv yeniden embed edilir
+            logging.warning(f"{e} Vektör veritabanı yeniden oluşturulacak.")
+            return _create_or_load_vector_store(persist_directory, pdf_folder, force_recreate=True)
         except Exception as e:
-            logging.warning(f"Mevcut vektör veritabanı yüklenirken/doğrulanırken hata oluştu: {e}. Yeniden oluşturulacak.")
-            try:
-                shutil.rmtree(persist_directory)
-                logging.info(f"Sorunlu veritabanı klasörü silindi: {persist_directory}")
-            except OSError as oe:
-                 logging.error(f"Veritabanı klasörü silinirken hata: {oe}", exc_info=True)
-            return create_or_load_vector_store(persist_directory, pdf_folder, force_recreate=True)
+            # Geçici olabilecek hatalarda (SQLite kilidi, G/Ç) depo silinmez; bir sonraki başlatmada tekrar denenir
+            logging.error(f"Hata: Mevcut vektör veritabanı açılamadı/doğrulanamadı: {e}", exc_info=True)
+            return None
+        logging.info(f"Mevcut Vektör veritabanı başarıyla yüklendi ve doğrulandı ({count} parça).")
+        reingest = False
+        if count == 0 and _manifest_chunk_count(persist_directory):
+            # Koleksiyon boş ama manifest parça bekliyor: klasör silinmez, manifest sıfırlanıp PDF'ler yeniden ingest edilir
+            logging.warning("Koleksiyon boş, manifest parça bekliyor; manifest sıfırlanıyor ve PDF'ler yeniden ingest edilecek.")
+            save_manifest(_empty_manifest(), persist_directory)
+            reingest = True
+        if INGEST_ON_STARTUP or reingest:
+            sync_vector_store(vector_store, pdf_folder, persist_directory)
+        else:
+            if HYBRID_RETRIEVAL:
+                sync_lexical_index(vector_store, persist_directory)
+            sync_metadata_index(vector_store, persist_directory)
+            sync_vector_index(vector_store, persist_directory)
     else:
+        if force_recreate and os.path.exists(persist_directory):
+            _reset_chroma_clients()
+            shutil.rmtree(persist_directory)
         logging.info(f"Yeni vektör veritabanı oluşturuluyor: {persist_directory}")
-        split_documents = load_and_split_pdfs(pdf_folder)
-        if not split_documents:
-             logging.error("PDF'lerden belge okunamadığı için vektör veritabanı oluşturulamıyor.")
-             return None
-        logging.info(f"{len(split_documents)} belge parçası ile vektör veritabanı oluşturuluyor...")
         try:
-            vector_store = Chroma.from_documents(
-                documents=split_documents,
-                embedding=embedding_func,
-                persist_directory=persist_directory
-            )
-            logging.info("Vektör veritabanı başarıyla oluşturuldu ve kaydedildi.")
+            vector_store = _open_chroma(persist_directory, embedding_func,
+                                        collection_metadata={"embedding_model": EMBEDDING_MODEL_NAME})
+            stats = sync_vector_store(vector_store, pdf_folder, persist_directory)
         except Exception as e:
             logging.error(f"Hata: ChromaDB oluşturulurken sorun oluştu: {e}", exc_info=True)
             return None
+        if not stats["chunks_added"]:
+             logging.error("PDF'lerden belge okunamadığı için vektör veritabanı oluşturulamıyor.")
+             return None
+        logging.info("Vektör veritabanı başarıyla oluşturuldu ve kaydedildi.")
     return vector_store
 
 
-def get_retriever(vector_store):
-    """Verilen vektör deposundan bir MultiQueryRetriever nesnesi oluşturur."""
+def get_retriever(vector_store, persist_directory=CHROMA_PERSIST_DIR):
+    """
+    Verilen vektör deposundan retriever oluşturur.
+    Varsayılan: FusionRetriever (toplu embed + eşzamanlı arama + RRF), HYBRID_RETRIEVAL açıksa BM25 ile birlikte.
+    RETRIEVER_MODE=multiquery ile eski MultiQueryRetriever.
+    """
     if not vector_store:
         logging.error("Retriever oluşturulamadı: Vektör deposu mevcut değil.")
         return None
 
+    if RETRIEVER_MODE == "fusion":
+        try:
+            query_chain = (QUERY_PROMPT | query_gen_llm | StrOutputParser()) if query_gen_llm else None
+            if not query_chain:
+                logging.warning("Sorgu üretimi LLM'i yüklenemediği için sadece orijinal soru ile arama yapılacak.")
+            lexical_index = get_lexical_index(persist_directory) if HYBRID_RETRIEVAL else None
+            if lexical_index is not None and not lexical_index.files:
+                logging.warning("Sözcüksel indeks boş, sadece vektör araması yapılacak.")
+                lexical_index = None
+            metadata_index = get_metadata_index(persist_directory) if METADATA_FILTERING else None
+            if metadata_index is not None and not metadata_index.files:
+                logging.warning("Metadata indeksi boş, tarih/sayı filtresi uygulanmayacak.")
+                metadata_index = None
+            search_store = vector_store
+            if _use_mmap_index() and not isinstance(vector_store, MmapVectorIndex):
+                search_store = get_vector_index(persist_directory, embeddings=vector_store.embeddings) or vector_store
+            if isinstance(search_store, MmapVectorIndex):
+                logging.info(f"Arama arka ucu: mmap indeks ({len(search_store)} parça, {search_store.header['dtype']}).")
+            fusion_retriever = FusionRetriever(
+                vector_store=search_store,
+                embeddings=vector_store.embeddings,
+                query_chain=query_chain,
+                k=BASE_RETRIEVER_K,
+                top_n=FUSION_TOP_N,
+                lexical_index=lexical_index,
+                lexical_k=LEXICAL_TOP_K,
+                metadata_index=metadata_index,
+            )
+            logging.info(f"FusionRetriever başarıyla oluşturuldu (k={BASE_RETRIEVER_K}, top_n={FUSION_TOP_N}, hibrit={lexical_index is not None}, metadata filtresi={metadata_index is not None}).")
+            return fusion_retriever
+        except Exception as e:
+            logging.error(f"Hata: FusionRetriever oluşturulurken: {e}. MultiQueryRetriever denenecek.", exc_info=True)
+
     # Temel retriever
     try:
         base_retriever = vector_store.as_retriever(
@@ -157,6 +681,7 @@ def get_retriever(vector_store):
 
     # MultiQueryRetriever
     try:
+        from langchain.retrievers.multi_query import MultiQueryRetriever
         multi_query_retriever = MultiQueryRetriever.from_llm(
             retriever=base_retriever,
             llm=query_gen_llm,
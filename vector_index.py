@@ -0,0 +1,320 @@
+# vector_index.py
+"""
+Sunum (serving) için salt okunur, memory-map edilen kompakt vektör indeksi.
+Chroma'daki embedding'ler normalize edilip ardışık bir float16 (veya satır ölçekli int8) matrise, parça
+metinleri tek bir UTF-8 dosyasına (ofset tablosuyla), metadata ise sözlük kodlu sütunlara yazılır.
+Arama NumPy ile blok blok yapılır; istenirse adaylar float32 kopyayla yeniden skorlanır.
+Dosyalar mmap ile açıldığı için aynı makinedeki süreçler işletim sisteminin sayfa önbelleğini paylaşır.
+"""
+import os
+import json
+import mmap
+import shutil
+import hashlib
+import logging
+import numpy as np
+from langchain_core.documents import Document
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+VECTOR_INDEX_DIRNAME = "vector_index"
+VECTOR_INDEX_VERSION = 1
+SUPPORTED_DTYPES = ("float16", "int8")
+# Arama sırasında tek seferde float32'ye çevrilen satır sayısı (geçici bellek sınırı)
+SEARCH_BLOCK_ROWS = 65536
+# float32 yeniden skorlama için k'nın kaç katı aday toplanır
+RESCORE_FACTOR = 4
+EXPORT_BATCH_SIZE = 1024
+
+_HEADER_FILE = "header.json"
+_CHUNKS_FILE = "chunks.json"
+_VECTORS_FILE = "vectors.npy"
+_SCALES_FILE = "scales.npy"
+_VECTORS_F32_FILE = "vectors_f32.npy"
+_OFFSETS_FILE = "offsets.npy"
+_TEXTS_FILE = "texts.bin"
+
+
+def manifest_signature(manifest):
+    """Ingest manifest'indeki dosya/sha listesinin özeti; indeks bu imzayla eşleşiyorsa günceldir."""
+    files = sorted((name, entry.get("sha256")) for name, entry in manifest.get("files", {}).items())
+    payload = json.dumps({"settings": manifest.get("settings"), "files": files}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _quantize_int8(matrix):
+    """Satır başına simetrik int8 nicemleme: satır ≈ kod * ölçek."""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _encode_metadata(metadatas):
+    """Metadata'yı sözlük kodlu sütunlara çevirir: anahtar -> (benzersiz değerler, satır başına kod; -1 = yok)."""
+    keys = sorted({key for metadata in metadatas for key in (metadata or {})})
+    columns = {}
+    for key in keys:
+        values, codes, lookup = [], np.full(len(metadatas), -1, dtype=np.int32), {}
+        for row, metadata in enumerate(metadatas):
+            if not metadata or key not in metadata:
+                continue
+            value = metadata[key]
+            marker = json.dumps(value, sort_keys=True)
+            if marker not in lookup:
+                lookup[marker] = len(values)
+                values.append(value)
+            codes[row] = lookup[marker]
+        columns[key] = (values, codes)
+    return columns
+
+
+def export_vector_index(vector_store, persist_directory, signature, embedding_model, dtype="float16", keep_float32=True):
+    """
+    Chroma koleksiyonunu persist_directory/vector_index altına yazar (önce geçici klasöre, sonra yer değiştirir).
+    Yazılan parça sayısını döndürür.
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Desteklenmeyen indeks tipi: {dtype} (seçenekler: {', '.join(SUPPORTED_DTYPES)})")
+    count = vector_store._collection.count()
+    target = os.path.join(persist_directory, VECTOR_INDEX_DIRNAME)
+    tmp_dir = target + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    ids, metadatas, offsets = [], [], [0]
+    vectors = scales = vectors_f32 = None
+    with open(os.path.join(tmp_dir, _TEXTS_FILE), "wb") as texts_file:
+        for start in range(0, count, EXPORT_BATCH_SIZE):
+            batch = vector_store.get(include=["embeddings", "documents", "metadatas"], limit=EXPORT_BATCH_SIZE, offset=start)
+            if not len(batch["ids"]):
+                break
+            matrix = _normalize(np.asarray(batch["embeddings"], dtype=np.float32))
+            if vectors is None:
+                dim = matrix.shape[1]
+                vector_dtype = np.float16 if dtype == "float16" else np.int8
+                vectors = np.lib.format.open_memmap(os.path.join(tmp_dir, _VECTORS_FILE), mode="w+", dtype=vector_dtype, shape=(count, dim))
+                if dtype == "int8":
+                    scales = np.lib.format.open_memmap(os.path.join(tmp_dir, _SCALES_FILE), mode="w+", dtype=np.float32, shape=(count,))
+                if keep_float32:
+                    vectors_f32 = np.lib.format.open_memmap(os.path.join(tmp_dir, _VECTORS_F32_FILE), mode="w+", dtype=np.float32, shape=(count, dim))
+            rows = slice(len(ids), len(ids) + len(matrix))
+            if dtype == "int8":
+                vectors[rows], scales[rows] = _quantize_int8(matrix)
+            else:
+                vectors[rows] = matrix.astype(np.float16)
+            if vectors_f32 is not None:
+                vectors_f32[rows] = matrix
+            for chunk_id, text, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                encoded = (text or "").encode("utf-8")
+                texts_file.write(encoded)
+                offsets.append(offsets[-1] + len(encoded))
+                ids.append(chunk_id)
+                metadatas.append(metadata or {})
+    if len(ids) != count:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise RuntimeError(f"Vektör indeksi dışa aktarılırken parça sayısı değişti ({len(ids)} != {count}).")
+    for array in (vectors, scales, vectors_f32):
+        if array is not None:
+            array.flush()
+    np.save(os.path.join(tmp_dir, _OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+
+    columns = _encode_metadata(metadatas)
+    for key, (_, codes) in columns.items():
+        np.save(os.path.join(tmp_dir, f"meta_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}.npy"), codes)
+    with open(os.path.join(tmp_dir, _CHUNKS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "metadata": {key: values for key, (values, _) in columns.items()}},
+                  f, ensure_ascii=False, separators=(",", ":"))
+    header = {
+        "version": VECTOR_INDEX_VERSION,
+        "signature": signature,
+        "embedding_model": embedding_model,
+        "dtype": dtype,
+        "count": count,
+        "dim": int(vectors.shape[1]) if vectors is not None else 0,
+        "float32": vectors_f32 is not None,
+    }
+    with open(os.path.join(tmp_dir, _HEADER_FILE), "w", encoding="utf-8") as f:
+        json.dump(header, f)
+
+    # Eski indeksi mmap eden süreçler açık dosyalarını okumaya devam eder (Linux'ta silinen dosya eşlemesi geçerli kalır)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_dir, target)
+    return count
+
+
+def read_header(persist_directory):
+    try:
+        with open(os.path.join(persist_directory, VECTOR_INDEX_DIRNAME, _HEADER_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class MmapVectorIndex:
+    """
+    Dışa aktarılmış indeksi mmap ile açar. FusionRetriever'ın kullandığı Chroma arayüzünün alt kümesini
+    (similarity_search_by_vector_with_relevance_scores, get) sağlar; retriever'da vector_store yerine verilebilir.
+    """
+
+    def __init__(self, directory, header, embeddings=None, rescore=True):
+        self.directory = directory
+        self.header = header
+        self.embeddings = embeddings
+        self.rescore = rescore and header.get("float32", False)
+        self.vectors = np.load(os.path.join(directory, _VECTORS_FILE), mmap_mode="r") if header["count"] else np.zeros((0, 0), np.float16)
+        self.scales = np.load(os.path.join(directory, _SCALES_FILE), mmap_mode="r") if header["dtype"] == "int8" and header["count"] else None
+        self.vectors_f32 = np.load(os.path.join(directory, _VECTORS_F32_FILE), mmap_mode="r") if self.rescore else None
+        self.offsets = np.load(os.path.join(directory, _OFFSETS_FILE), mmap_mode="r")
+        self._texts_file = open(os.path.join(directory, _TEXTS_FILE), "rb")
+        self.texts = mmap.mmap(self._texts_file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+        with open(os.path.join(directory, _CHUNKS_FILE), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        self.ids = chunks["ids"]
+        self._metadata_values = chunks["metadata"]
+        self._metadata_codes = {key: np.load(os.path.join(directory, f"meta_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}.npy"), mmap_mode="r")
+                                for key in self._metadata_values}
+        self._row_by_id = None
+
+    @classmethod
+    def load(cls, persist_directory, embeddings=None, rescore=True):
+        """İndeksi açar; yoksa veya sürümü uyumsuzsa None döner."""
+        header = read_header(persist_directory)
+        if not header or header.get("version") != VECTOR_INDEX_VERSION:
+            return None
+        try:
+            return cls(os.path.join(persist_directory, VECTOR_INDEX_DIRNAME), header, embeddings, rescore)
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Vektör indeksi açılamadı ({persist_directory}): {e}")
+            return None
+
+    def __len__(self):
+        return self.header["count"]
+
+    # --- Satır okuma ---
+    def _text(self, row):
+        return bytes(self.texts[int(self.offsets[row]):int(self.offsets[row + 1])]).decode("utf-8")
+
+    def _metadata(self, row):
+        metadata = {}
+        for key, codes in self._metadata_codes.items():
+            code = int(codes[row])
+            if code >= 0:
+                metadata[key] = self._metadata_values[key][code]
+        return metadata
+
+    def document(self, row):
+        return Document(page_content=self._text(row), metadata={**self._metadata(row), "chunk_id": self.ids[row]})
+
+    # --- Arama ---
+    def _block_scores(self, start, end, query):
+        block = np.asarray(self.vectors[start:end], dtype=np.float32)
+        scores = block @ query
+        if self.scales is not None:
+            scores *= self.scales[start:end]
+        return scores
+
+    def _scan(self, query, candidates):
+        """Tüm satırları bloklar halinde skorlayıp en iyi candidates satırı tutar."""
+        count = len(self)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            end = min(count, start + SEARCH_BLOCK_ROWS)
+            scores = self._block_scores(start, end, query)
+            if len(scores) > candidates:
+                top = np.argpartition(scores, -candidates)[-candidates:]
+            else:
+                top = np.arange(len(scores))
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_rows) > candidates:
+                keep = np.argpartition(best_scores, -candidates)[-candidates:]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        return best_rows, best_scores
+
+    def _scan_rows(self, rows, query, candidates):
+        """Sadece verilen satırları (metadata filtresi adayları) skorlar."""
+        # Artan sırada okumak mmap'te sayfa erişimlerini sıralı tutar
+        best_rows = np.sort(np.asarray(rows, dtype=np.int64))
+        best_scores = np.asarray(self.vectors[best_rows], dtype=np.float32) @ query
+        if self.scales is not None:
+            best_scores *= self.scales[best_rows]
+        if len(best_rows) > candidates:
+            keep = np.argpartition(best_scores, -candidates)[-candidates:]
+            best_rows, best_scores = best_rows[keep], best_scores[keep]
+        return best_rows, best_scores
+
+    def search(self, query_vector, k=8, rows=None):
+        """
+        Kosinüs benzerliğine göre en iyi k satırı (satır, skor) listesi olarak döndürür.
+        rows verilirse sadece o satırlar aranır.
+        """
+        count = len(self) if rows is None else len(rows)
+        if not count or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        candidates = min(count, k * RESCORE_FACTOR if self.rescore else k)
+        if rows is None:
+            best_rows, best_scores = self._scan(query, candidates)
+        else:
+            best_rows, best_scores = self._scan_rows(rows, query, candidates)
+        if self.rescore:
+            # Nicemleme hatasını gidermek için adaylar tam hassasiyetle yeniden skorlanır
+            order = np.sort(best_rows)
+            best_rows, best_scores = order, np.asarray(self.vectors_f32[order], dtype=np.float32) @ query
+        ranked = np.argsort(-best_scores)[:k]
+        return [(int(best_rows[i]), float(best_scores[i])) for i in ranked]
+
+    # --- Chroma uyumlu arayüz ---
+    def _rows_for_ids(self, ids):
+        if self._row_by_id is None:
+            self._row_by_id = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        return [self._row_by_id[chunk_id] for chunk_id in ids if chunk_id in self._row_by_id]
+
+    def _filter_rows(self, filter):
+        """Chroma filtre sözdiziminden sadece {"chunk_id": {"$in": [...]}} desteklenir."""
+        chunk_ids = (filter.get("chunk_id") or {}).get("$in") if len(filter) == 1 else None
+        if chunk_ids is None:
+            raise ValueError(f"Mmap vektör indeksi bu filtreyi desteklemiyor: {filter}")
+        return self._rows_for_ids(chunk_ids)
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None, **kwargs):
+        rows = self._filter_rows(filter) if filter else None
+        return [(self.document(row), score) for row, score in self.search(embedding, k, rows=rows)]
+
+    def get(self, ids=None, include=None, limit=None, offset=None, **kwargs):
+        include = ["documents", "metadatas"] if include is None else include
+        if ids is not None:
+            rows = self._rows_for_ids(ids)
+        else:
+            start = offset or 0
+            rows = range(start, len(self) if limit is None else min(len(self), start + limit))
+        result = {"ids": [self.ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self._text(row) for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadata(row) for row in rows]
+        return result
+
+    def close(self):
+        if isinstance(self.texts, mmap.mmap):
+            self.texts.close()
+        self._texts_file.close()
+
+
+if __name__ == "__main__":
+    # Mevcut Chroma deposundan indeksi elle dışa aktarmak için: python vector_index.py [persist_klasörü]
+    import sys
+    from utils import CHROMA_PERSIST_DIR, _open_chroma, get_embedding_function, sync_vector_index
+    persist_directory = sys.argv[1] if len(sys.argv) > 1 else CHROMA_PERSIST_DIR
+    sync_vector_index(_open_chroma(persist_directory, get_embedding_function()), persist_directory, force=True)
@@ -0,0 +1,443 @@
+# worker_pool.py
+"""
+Pre-fork çok süreçli sunum. Salt okunur ortak durum (mmap vektör indeksi, BM25 indeksi, modüller ve prompt
+şablonları) ana süreçte bir kez yüklenir, sonra N işçi fork edilir ve bu sayfaları copy-on-write paylaşır.
+Sorular ana süreçteki kuyruktan boş kapasitesi olan işçiye dağıtılır. İşçiler heartbeat ile izlenir. Ölen,
+yanıt vermeyen veya bir soruda takılan işçi yeniden başlatılır.
+WorkerPool, derlenmiş grafın ainvoke/astream_answer arayüzünü taklit eder; API sunucusu ve toplu cevaplama
+CLI'ı grafın yerine doğrudan kullanabilir. Sadece 'fork' başlatma yöntemi olan platformlarda (Linux) çalışır.
+"""
+import os
+import gc
+import time
+import signal
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from multiprocessing.connection import wait as wait_connections
+
+import tracing
+from conversation import CONVERSATION_FIELDS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Ayarlar ---
+POOL_WORKERS = int(os.getenv("POOL_WORKERS", str(os.cpu_count() or 1)))
+# Her işçide aynı anda çalışan soru sayısı (LLM çağrıları G/Ç bekler; tek soru bir çekirdeği doldurmaz)
+POOL_THREADS_PER_WORKER = int(os.getenv("POOL_THREADS_PER_WORKER", "4"))
+POOL_HEARTBEAT_INTERVAL = 1.0
+# Bu süre boyunca heartbeat göndermeyen işçi yanıt vermiyor sayılır ve yeniden başlatılır (saniye)
+POOL_HEALTH_TIMEOUT = float(os.getenv("POOL_HEALTH_TIMEOUT", "15"))
+# İşçinin grafı kurup hazır olması için tanınan süre (saniye)
+POOL_START_TIMEOUT = float(os.getenv("POOL_START_TIMEOUT", "120"))
+# Bir sorunun işçide en fazla süresi; aşılırsa işçi takılmış sayılır ve yeniden başlatılır (saniye)
+POOL_JOB_TIMEOUT = float(os.getenv("POOL_JOB_TIMEOUT", "300"))
+# Çöken işçi yeniden başlatılmadan önce beklenecek süre (sürekli çöken işçinin CPU'yu yakmaması için)
+POOL_RESTART_BACKOFF = 2.0
+_SUPERVISE_INTERVAL = 0.2
+RESULT_FIELDS = ("answer", "source", "route", "cached", "chunk_ids", "follow_up", "standalone_question")
+# İşçiye gönderilen başlangıç state alanları (trace gibi süreçler arası taşınamayan alanlar hariç)
+JOB_FIELDS = ("question",) + CONVERSATION_FIELDS
+
+
+class WorkerError(RuntimeError):
+    """İşçide graf çalışırken hata oluştu."""
+
+
+class WorkerCrashed(RuntimeError):
+    """Soru işlenirken işçi süreci öldü veya sağlık kontrolünden geçemeyip yeniden başlatıldı."""
+
+
+# --- Ana süreçte ortak durum ---
+def _prepare_store():
+    import utils
+    # sys.exit yerine os._exit: fork bir thread havuzundan yapıldıysa (ör. asyncio.to_thread) çocuk süreçteki
+    # concurrent.futures atexit kancası "cannot join current thread" ile çıkış kodunu 1 yapar
+    os._exit(0 if utils.create_or_load_vector_store() is not None else 1)
+
+
+def warm_shared_state(context):
+    """
+    İşçiler fork edilmeden önce ana süreçte çalışır. Ingest (gerekirse) kısa ömürlü bir alt süreçte yapılır.
+    Böylece ana süreç Chroma/SQLite bağlantısı açmaz ve bu bağlantılar fork ile işçilere kopyalanmaz.
+    """
+    process = context.Process(target=_prepare_store, name="pool-ingest")
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError("Vektör veritabanı oluşturulamadı veya yüklenemedi. 'data' klasörünü ve PDF dosyalarını kontrol edin.")
+
+    import utils
+    import graph, agents, supervisor  # noqa: F401 - modüller ve prompt şablonları işçilerle paylaşılır
+    # Depo güncel; işçiler ingest'i tekrarlamaz
+    utils.INGEST_ON_STARTUP = False
+    if utils._use_mmap_index():
+        index = utils.get_vector_index(utils.CHROMA_PERSIST_DIR)
+        if index is not None:
+            logging.info(f"İşçi havuzu: mmap vektör indeksi paylaşılıyor ({len(index)} parça).")
+    else:
+        logging.warning("İşçi havuzu: VECTOR_INDEX_BACKEND=mmap değil; her işçi kendi Chroma bağlantısını açar, vektörler paylaşılmaz.")
+    if utils.HYBRID_RETRIEVAL:
+        utils.get_lexical_index(utils.CHROMA_PERSIST_DIR)
+    if utils.METADATA_FILTERING:
+        utils.get_metadata_index(utils.CHROMA_PERSIST_DIR)
+    # Yüklenen nesneleri GC taramasından çıkar; işçilerde GC'nin dokunup sayfaları kopyalamasını önler
+    gc.collect()
+    gc.freeze()
+
+
+# --- İşçi süreci ---
+def _worker_main(index, conn, workers, threads, use_answer_cache):
+    # Ctrl+C tüm süreç grubuna gider; kapanışı ana süreç yönetir
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from async_utils import run_sync
+    from llm_gateway import gateway
+    from graph import build_agent_graph
+
+    send_lock = threading.Lock()
+
+    def send(*message):
+        try:
+            with send_lock:
+                conn.send(message)
+        except (OSError, EOFError):
+            pass  # ana süreç kapandı
+
+    gateway.share_quota(workers)
+    try:
+        agent_graph = build_agent_graph(use_answer_cache)
+    except Exception as e:
+        logging.error(f"Hata: İşçi {index} grafı kuramadı: {e}", exc_info=True)
+        send("failed", f"{type(e).__name__}: {e}")
+        return
+
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(POOL_HEARTBEAT_INTERVAL):
+            # Agent event loop'u tıkanmışsa bu çağrı dönmez ve heartbeat kesilir
+            run_sync(asyncio.sleep(0))
+            send("heartbeat")
+
+    def run_job(job_id, initial_state):
+        started = time.perf_counter()
+        try:
+            state = run_sync(agent_graph.ainvoke(initial_state))
+            send("done", job_id, {key: state.get(key) for key in RESULT_FIELDS}, time.perf_counter() - started)
+        except Exception as e:
+            logging.error(f"Hata: İşçi {index} soruyu cevaplarken: {e}", exc_info=True)
+            send("error", job_id, f"{type(e).__name__}: {e}", time.perf_counter() - started)
+
+    threading.Thread(target=heartbeat, name=f"pool-heartbeat-{index}", daemon=True).start()
+    send("ready", os.getpid())
+    with ThreadPoolExecutor(threads, thread_name_prefix=f"pool-worker-{index}") as executor:
+        while True:
+            try:
+                job = conn.recv()
+            except (OSError, EOFError):
+                break
+            if job is None:
+                break
+            executor.submit(run_job, *job)
+    stop.set()
+
+
+# --- Ana süreç ---
+class _WorkerSlot:
+    """Havuzdaki bir işçi yuvası; işçi yeniden başlatılsa da sayaçlar yuvada birikir."""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.pid = None
+        self.ready = False
+        self.spawned = 0.0
+        self.last_seen = 0.0
+        self.next_start = 0.0
+        self.in_flight = {}  # iş kimliği -> gönderilme zamanı
+        self.completed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.restarts = 0
+        self.send_lock = threading.Lock()
+
+    def stats(self, uptime):
+        return {
+            "worker": self.index,
+            "pid": self.pid,
+            "ready": self.ready,
+            "in_flight": len(self.in_flight),
+            "completed": self.completed,
+            "errors": self.errors,
+            "restarts": self.restarts,
+            "avg_seconds": round(self.busy_seconds / self.completed, 3) if self.completed else None,
+            "answers_per_second": round(self.completed / uptime, 3) if uptime else 0.0,
+        }
+
+
+class WorkerPool:
+    """
+    Pre-fork işçi havuzu. start() ortak durumu yükleyip işçileri fork eder; submit() bir Future döner.
+    Kuyruk ana süreçtedir: her işçiye en fazla threads_per_worker soru gönderilir, kalanlar sırada bekler.
+    Böylece çöken bir işçiyle sadece o anda işlediği sorular kaybolur (WorkerCrashed ile biter).
+    """
+
+    def __init__(self, workers=POOL_WORKERS, threads_per_worker=POOL_THREADS_PER_WORKER, use_answer_cache=True):
+        if workers < 1 or threads_per_worker < 1:
+            raise ValueError("İşçi ve işçi başına thread sayısı en az 1 olmalı.")
+        # fork olmayan platformlarda ValueError fırlatır
+        self._context = multiprocessing.get_context("fork")
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.use_answer_cache = use_answer_cache
+        self.slots = [_WorkerSlot(index) for index in range(workers)]
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._futures = {}
+        self._job_ids = itertools.count(1)
+        self._closed = False
+        self._draining = False
+        self._supervisor = None
+        self.started = None
+
+    # --- Yaşam döngüsü ---
+    def start(self, timeout=POOL_START_TIMEOUT):
+        """Ortak durumu yükler, işçileri başlatır ve en az biri hazır olana kadar bekler."""
+        started = time.perf_counter()
+        warm_shared_state(self._context)
+        logging.info(f"İşçi havuzu: ortak durum {time.perf_counter() - started:.2f} sn'de yüklendi, {self.workers} işçi başlatılıyor.")
+        with self._lock:
+            for slot in self.slots:
+                self._spawn(slot)
+        self.started = time.monotonic()
+        self._supervisor = threading.Thread(target=self._supervise, name="worker-pool", daemon=True)
+        self._supervisor.start()
+        ready = 0
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                ready = sum(slot.ready for slot in self.slots)
+            if ready == self.workers:
+                break
+            time.sleep(_SUPERVISE_INTERVAL)
+        if not ready:
+            self.close()
+            raise RuntimeError(f"İşçi havuzu: {timeout} sn içinde hiçbir işçi hazır olmadı.")
+        logging.info(f"İşçi havuzu hazır: {ready}/{self.workers} işçi, {time.perf_counter() - started:.2f} sn.")
+        return self
+
+    def close(self, timeout=10.0):
+        """
+        Yeni soru kabulünü durdurur, sıradaki ve işlenen soruların bitmesini timeout süresince bekler,
+        sonra işçileri durdurur ve işçi bazında verimi raporlar.
+        """
+        with self._lock:
+            if self._closed or self._draining:
+                return
+            self._draining = True
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self._supervisor is not None and self._supervisor.is_alive():
+            with self._lock:
+                if not self._pending and not any(slot.in_flight for slot in self.slots):
+                    break
+            time.sleep(_SUPERVISE_INTERVAL)
+        with self._lock:
+            self._closed = True
+            pending = list(self._pending)
+            self._pending.clear()
+        for _, _, future in pending:
+            _fail(future, WorkerCrashed("İşçi havuzu kapatıldı."))
+        for slot in self.slots:
+            if slot.conn is not None:
+                try:
+                    with slot.send_lock:
+                        slot.conn.send(None)
+                except OSError:
+                    pass
+        deadline = time.monotonic() + timeout
+        for slot in self.slots:
+            if slot.process is not None:
+                slot.process.join(max(0.0, deadline - time.monotonic()))
+                if slot.process.is_alive():
+                    slot.process.kill()
+                    slot.process.join(1.0)
+        if self._supervisor is not None:
+            self._supervisor.join(timeout=1.0)
+        with self._lock:
+            for slot in self.slots:
+                for job_id in list(slot.in_flight):
+                    _fail(self._futures.pop(job_id, None), WorkerCrashed("İşçi havuzu kapatıldı."))
+                slot.in_flight.clear()
+                if slot.conn is not None:
+                    slot.conn.close()
+                    slot.conn = None
+        for worker in self.stats()["workers"]:
+            logging.info(f"İşçi {worker['worker']}: {worker['completed']} cevap, {worker['errors']} hata, "
+                         f"{worker['restarts']} yeniden başlatma, {worker['answers_per_second']} cevap/sn")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # --- Soru gönderme ---
+    def submit(self, initial_state):
+        """Soruyu (konuşma alanlarıyla birlikte) kuyruğa ekler; sonucu RESULT_FIELDS alanlarıyla dönen Future."""
+        if isinstance(initial_state, str):
+            initial_state = {"question": initial_state}
+        job = {key: initial_state[key] for key in JOB_FIELDS if initial_state.get(key) is not None}
+        future = Future()
+        with self._lock:
+            if self._closed or self._draining:
+                raise RuntimeError("İşçi havuzu kapalı.")
+            self._pending.append((next(self._job_ids), job, future))
+            self._dispatch()
+        return future
+
+    def invoke(self, initial_state, config=None):
+        return self.submit(initial_state).result()
+
+    async def ainvoke(self, initial_state, config=None):
+        return await asyncio.wrap_future(self.submit(initial_state))
+
+    async def astream_answer(self, initial_state):
+        # Token'lar işçi sürecinde kalır; sadece son durum akıtılır
+        yield "final", await self.ainvoke(initial_state)
+
+    def stats(self):
+        uptime = time.monotonic() - self.started if self.started else 0.0
+        with self._lock:
+            return {"workers": [slot.stats(uptime) for slot in self.slots], "pending": len(self._pending),
+                    "ready": sum(slot.ready for slot in self.slots)}
+
+    # --- İç işler (self._lock altında çağrılır) ---
+    def _spawn(self, slot):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, name=f"pool-worker-{slot.index}",
+            args=(slot.index, child_conn, self.workers, self.threads_per_worker, self.use_answer_cache))
+        process.start()
+        child_conn.close()
+        slot.process, slot.conn, slot.pid = process, parent_conn, process.pid
+        slot.ready = False
+        slot.spawned = slot.last_seen = time.monotonic()
+
+    def _dispatch(self):
+        while self._pending:
+            candidates = [slot for slot in self.slots
+                          if slot.ready and len(slot.in_flight) < self.threads_per_worker]
+            if not candidates:
+                return
+            slot = min(candidates, key=lambda candidate: len(candidate.in_flight))
+            job_id, job, future = self._pending.popleft()
+            if future.cancelled():
+                continue  # çağıran vazgeçti
+            try:
+                with slot.send_lock:
+                    slot.conn.send((job_id, job))
+            except OSError:
+                self._pending.appendleft((job_id, job, future))
+                self._retire(slot, "iş gönderilemedi")
+                continue
+            self._futures[job_id] = future
+            slot.in_flight[job_id] = time.monotonic()
+
+    def _retire(self, slot, reason):
+        """İşçiyi sonlandırır, üzerindeki soruları WorkerCrashed ile bitirir ve yeniden başlatmayı planlar."""
+        logging.error(f"Hata: İşçi {slot.index} (pid {slot.pid}) yeniden başlatılacak: {reason}")
+        if slot.process is not None and slot.process.is_alive():
+            slot.process.kill()
+            slot.process.join(1.0)
+        if slot.conn is not None:
+            slot.conn.close()
+        for job_id in list(slot.in_flight):
+            _fail(self._futures.pop(job_id, None), WorkerCrashed(f"İşçi {slot.index} soruyu tamamlayamadı: {reason}"))
+        slot.in_flight.clear()
+        slot.process = slot.conn = None
+        slot.ready = False
+        slot.restarts += 1
+        slot.next_start = time.monotonic() + POOL_RESTART_BACKOFF
+        tracing.metrics.inc("pool_worker_restarts_total", 1, (("worker", str(slot.index)),))
+
+    def _handle(self, slot, message):
+        kind = message[0]
+        slot.last_seen = time.monotonic()
+        if kind == "ready":
+            slot.ready = True
+            logging.info(f"İşçi {slot.index} hazır (pid {message[1]}, {slot.last_seen - slot.spawned:.2f} sn).")
+        elif kind in ("done", "error"):
+            _, job_id, payload, seconds = message
+            slot.in_flight.pop(job_id, None)
+            future = self._futures.pop(job_id, None)
+            slot.busy_seconds += seconds
+            if kind == "done":
+                slot.completed += 1
+                _resolve(future, payload)
+            else:
+                slot.errors += 1
+                _fail(future, WorkerError(payload))
+            tracing.metrics.inc("pool_answers_total", 1, (("worker", str(slot.index)), ("outcome", "ok" if kind == "done" else "error")))
+        elif kind == "failed":
+            self._retire(slot, message[1])
+
+    def _check_health(self, now):
+        for slot in self.slots:
+            if slot.process is None:
+                if now >= slot.next_start:
+                    self._spawn(slot)
+            elif not slot.process.is_alive():
+                self._retire(slot, f"süreç sonlandı (çıkış kodu {slot.process.exitcode})")
+            elif not slot.ready and now - slot.spawned > POOL_START_TIMEOUT:
+                self._retire(slot, f"{POOL_START_TIMEOUT} sn içinde hazır olmadı")
+            elif slot.ready and now - slot.last_seen > POOL_HEALTH_TIMEOUT:
+                self._retire(slot, f"{POOL_HEALTH_TIMEOUT} sn'dir heartbeat yok")
+            elif slot.in_flight and now - min(slot.in_flight.values()) > POOL_JOB_TIMEOUT:
+                self._retire(slot, f"bir soru {POOL_JOB_TIMEOUT} sn'yi aştı")
+
+    def _supervise(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                connections = {slot.conn: slot for slot in self.slots if slot.conn is not None}
+            for conn in wait_connections(list(connections), timeout=_SUPERVISE_INTERVAL) if connections else ():
+                slot = connections[conn]
+                with self._lock:
+                    if self._closed or slot.conn is not conn:
+                        continue
+                    try:
+                        message = conn.recv()
+                    except (OSError, EOFError):
+                        self._retire(slot, "bağlantı koptu")
+                    else:
+                        self._handle(slot, message)
+                    self._dispatch()
+            if not connections:
+                time.sleep(_SUPERVISE_INTERVAL)
+            with self._lock:
+                if self._closed:
+                    return
+                self._check_health(time.monotonic())
+                self._dispatch()
+
+
+def _resolve(future, result):
+    if future is not None and not future.done():
+        try:
+            future.set_result(result)
+        except InvalidStateError:
+            pass  # çağıran bu arada iptal etti
+
+
+def _fail(future, error):
+    if future is not None and not future.done():
+        try:
+            future.set_exception(error)
+        except InvalidStateError:
+            pass